@@ -0,0 +1,43 @@
+"""Crash- and reader-safe file replacement.
+
+Files that another process may read at any moment (FAISS indexes, their
+corpora, params and manifests) are written to a temporary file in the same
+directory, fsynced and moved over the target with ``os.replace``, so a
+reader sees either the old file or the new one, never a partial write.
+"""
+from contextlib import contextmanager
+import os
+import tempfile
+from typing import Iterator
+
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """Yield a temporary path to write; it replaces ``path`` when the block exits cleanly."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield tmp
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _fsync_dir(directory)
+
+
+def _fsync_dir(directory: str) -> None:
+    # Makes the rename itself durable; not supported on every platform
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,148 @@
+"""Embedding cache keyed by (model name, normalized text).
+
+Repeated texts (the filler's "<format> XML structure" queries, unchanged
+schema lines) skip the encoder. Entries live in an in-process LRU bounded by
+size and TTL, with an optional Redis tier shared between processes.
+"""
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different strings share an entry."""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """LRU + TTL cache of normalized float32 embeddings."""
+
+    def __init__(self, model_name: str, max_entries: int = 10000, ttl_seconds: float = 3600,
+                 redis_url: str | None = None):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = self._connect_redis(redis_url) if redis_url else None
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _connect_redis(redis_url: str):
+        try:
+            import redis
+        except ImportError:
+            print("Warning: redis is not installed; embedding cache is in-process only")
+            return None
+        return redis.Redis.from_url(redis_url)
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        return f"emb:{self.model_name}:{digest}"
+
+    def encode(self, model, texts: list[str]) -> np.ndarray:
+        """Embed ``texts`` with ``model``, encoding only the ones not cached."""
+        normalized = [normalize_text(t) for t in texts]
+        keys = [self._key(t) for t in normalized]
+        found: dict[str, np.ndarray] = {}
+        now = time.time()
+
+        with self._lock:
+            for key in set(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                vector, expires_at = entry
+                if expires_at < now:
+                    del self._entries[key]
+                    self.expired += 1
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = vector
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        from_redis: dict[str, np.ndarray] = {}
+        if missing and self._redis is not None:
+            from_redis = self._redis_get(missing)
+            found.update(from_redis)
+            missing = [key for key in missing if key not in found]
+
+        if missing:
+            texts_by_key = dict(zip(keys, normalized))
+            vectors = model.encode([texts_by_key[key] for key in missing], normalize_embeddings=True)
+            fresh = dict(zip(missing, np.asarray(vectors, dtype=np.float32)))
+            found.update(fresh)
+            if self._redis is not None:
+                self._redis_set(fresh)
+            self._store(fresh)
+
+        missed = set(missing)
+        with self._lock:
+            for key in keys:
+                if key in missed:
+                    self.misses += 1
+                elif key in from_redis:
+                    self.redis_hits += 1
+                else:
+                    self.hits += 1
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def _store(self, vectors: dict[str, np.ndarray]) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            for key, vector in vectors.items():
+                self._entries[key] = (vector, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _redis_get(self, keys: list[str]) -> dict[str, np.ndarray]:
+        try:
+            values = self._redis.mget(keys)
+        except Exception as e:
+            print(f"Warning: embedding cache Redis read failed: {e}")
+            return {}
+        found = {key: np.frombuffer(value, dtype=np.float32) for key, value in zip(keys, values) if value is not None}
+        if found:
+            self._store(found)
+        return found
+
+    def _redis_set(self, vectors: dict[str, np.ndarray]) -> None:
+        try:
+            pipe = self._redis.pipeline()
+            for key, vector in vectors.items():
+                pipe.setex(key, int(self.ttl_seconds), vector.tobytes())
+            pipe.execute()
+        except Exception as e:
+            print(f"Warning: embedding cache Redis write failed: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "model": self.model_name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "redis": self._redis is not None,
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.redis_hits) / lookups, 4) if lookups else 0.0,
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
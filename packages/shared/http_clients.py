@@ -0,0 +1,233 @@
+"""App-lifetime pooled HTTP clients for agent-to-agent calls.
+
+Each downstream service gets one ``httpx.AsyncClient`` with its own base URL,
+timeout and connection limits, so calls reuse keep-alive connections instead of
+opening a new TCP connection per request. Services open the clients in their
+startup hook and close them on shutdown.
+
+A service may list several instances (comma-separated base URLs). If its
+config has a ``ready_path``, an instance is only routed to once that
+endpoint answers 200; ``watch_readiness`` re-probes every instance in the
+background, and ``get`` round-robins over the ones that are ready.
+"""
+from dataclasses import dataclass
+import asyncio
+import os
+import time
+
+import httpx
+
+
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes")
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+READY_PROBE_TIMEOUT = float(os.getenv("READY_PROBE_TIMEOUT", "2"))
+
+
+class NoReadyInstance(RuntimeError):
+    """No instance of a service has passed its readiness probe."""
+
+
+@dataclass
+class ServiceConfig:
+    base_url: str  # one URL, or several comma-separated instances of the same service
+    timeout: float = 30.0
+    max_connections: int = HTTP_MAX_CONNECTIONS
+    max_keepalive_connections: int = HTTP_MAX_KEEPALIVE
+    keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY
+    http2: bool = HTTP2_ENABLED
+    ready_path: str | None = None  # e.g. "/ready"; None routes to every instance
+
+    @property
+    def urls(self) -> list[str]:
+        return [url.strip() for url in self.base_url.split(",") if url.strip()]
+
+
+class _MeteredTransport(httpx.AsyncBaseTransport):
+    """Transport wrapper that counts requests, errors and in-flight calls."""
+
+    def __init__(self, inner: httpx.AsyncHTTPTransport):
+        self.inner = inner
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_seconds = 0.0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        started = time.perf_counter()
+        try:
+            return await self.inner.handle_async_request(request)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self.total_seconds += time.perf_counter() - started
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+    def pool_stats(self) -> dict:
+        # httpcore keeps the pool private; report what is there without failing
+        pool = getattr(self.inner, "_pool", None)
+        connections = list(getattr(pool, "connections", []) or [])
+        idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+        http2 = sum(1 for c in connections if "HTTP/2" in repr(c))
+        return {
+            "open_connections": len(connections),
+            "idle_connections": idle,
+            "active_connections": len(connections) - idle,
+            "http2_connections": http2,
+        }
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class ServiceClients:
+    """Registry of pooled ``httpx.AsyncClient`` instances, one per service instance."""
+
+    def __init__(self, services: dict[str, ServiceConfig]):
+        self.services = services
+        self._clients: dict[tuple[str, str], httpx.AsyncClient] = {}
+        self._transports: dict[tuple[str, str], _MeteredTransport] = {}
+        # Instances with a readiness probe start out not ready until it passes
+        self._ready: dict[str, dict[str, bool]] = {
+            name: {url: config.ready_path is None for url in config.urls} for name, config in services.items()
+        }
+        self._next: dict[str, int] = dict.fromkeys(services, 0)
+
+    def _create(self, name: str, url: str) -> httpx.AsyncClient:
+        config = self.services[name]
+        http2 = config.http2
+        if http2 and not _http2_available():
+            print(f"Warning: HTTP/2 requested for {name} but 'h2' is not installed; using HTTP/1.1")
+            http2 = False
+        transport = _MeteredTransport(httpx.AsyncHTTPTransport(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+        ))
+        client = httpx.AsyncClient(base_url=url, timeout=config.timeout, transport=transport)
+        self._clients[(name, url)] = client
+        self._transports[(name, url)] = transport
+        return client
+
+    def _client(self, name: str, url: str) -> httpx.AsyncClient:
+        client = self._clients.get((name, url))
+        if client is None or client.is_closed:
+            client = self._create(name, url)
+        return client
+
+    async def start(self) -> None:
+        """Open a client for every configured service instance."""
+        for name, config in self.services.items():
+            for url in config.urls:
+                if (name, url) not in self._clients:
+                    self._create(name, url)
+
+    async def close(self) -> None:
+        """Close all clients and release their pooled connections."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._transports.clear()
+        for client in clients:
+            await client.aclose()
+
+    def ready_urls(self, name: str) -> list[str]:
+        return [url for url, ready in self._ready[name].items() if ready]
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Return the pooled client for a ready instance of a service, opening it on first use.
+
+        Raises ``NoReadyInstance`` if the service has a readiness probe and no instance has passed it.
+        """
+        urls = self.ready_urls(name)
+        if not urls:
+            raise NoReadyInstance(f"No ready instance of {name} ({self.services[name].base_url})")
+        url = urls[self._next[name] % len(urls)]
+        self._next[name] += 1
+        return self._client(name, url)
+
+    async def _probe(self, name: str, url: str) -> None:
+        try:
+            r = await self._client(name, url).get(self.services[name].ready_path, timeout=READY_PROBE_TIMEOUT)
+            ready = r.status_code == 200
+        except httpx.HTTPError:
+            ready = False
+        if ready != self._ready[name][url]:
+            print(f"{name} instance {url} is {'ready' if ready else 'not ready'}")
+        self._ready[name][url] = ready
+
+    async def refresh_readiness(self) -> dict[str, list[str]]:
+        """Probe every instance that has a ``ready_path``; returns the ready URLs per service."""
+        await asyncio.gather(*(
+            self._probe(name, url)
+            for name, config in self.services.items() if config.ready_path is not None
+            for url in config.urls
+        ))
+        return {name: self.ready_urls(name) for name in self.services}
+
+    async def check_liveness(self, path: str = "/health", timeout: float = 10) -> dict[str, dict[str, bool]]:
+        """GET ``path`` on every instance, ready or not; returns whether each answered 200, per service."""
+        async def check(name: str, url: str) -> bool:
+            try:
+                return (await self._client(name, url).get(path, timeout=timeout)).status_code == 200
+            except httpx.HTTPError:
+                return False
+
+        instances = [(name, url) for name, config in self.services.items() for url in config.urls]
+        alive = await asyncio.gather(*(check(name, url) for name, url in instances))
+        result: dict[str, dict[str, bool]] = {name: {} for name in self.services}
+        for (name, url), ok in zip(instances, alive):
+            result[name][url] = ok
+        return result
+
+    async def watch_readiness(self, interval: float = 5.0) -> None:
+        """Re-probe instances every ``interval`` seconds until cancelled."""
+        while True:
+            await self.refresh_readiness()
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        """Per-service request counters and connection pool usage, summed over instances."""
+        stats = {}
+        for name, config in self.services.items():
+            keys = [(name, url) for url in config.urls]
+            transports = [self._transports[key] for key in keys if key in self._transports]
+            entry = {
+                "base_url": config.base_url,
+                "open": any(key in self._clients for key in keys),
+                "max_connections": config.max_connections,
+                "max_keepalive_connections": config.max_keepalive_connections,
+                "http2": config.http2,
+                "instances": len(keys),
+                "ready_instances": len(self.ready_urls(name)),
+            }
+            if transports:
+                requests = sum(t.requests for t in transports)
+                entry.update({
+                    "requests": requests,
+                    "errors": sum(t.errors for t in transports),
+                    "in_flight": sum(t.in_flight for t in transports),
+                    "peak_in_flight": max(t.peak_in_flight for t in transports),
+                    "avg_latency_ms": round(sum(t.total_seconds for t in transports) / requests * 1000, 2) if requests else 0.0,
+                })
+                for transport in transports:
+                    for key, value in transport.pool_stats().items():
+                        entry[key] = entry.get(key, 0) + value
+            stats[name] = entry
+        return stats
@@ -0,0 +1,50 @@
+"""Search settings persisted next to a FAISS index.
+
+template_fetcher writes ``{cache_key}.params.json`` when it builds an index;
+the RAG service reads it back and applies nprobe / efSearch after loading.
+
+The params also record the size and mtime of the ``.faiss`` and ``.txt``
+files they were written with (``files``), so a reader can tell whether the
+pair on disk belongs together or is halfway through being replaced, and a
+``version`` that changes with every build (RAG keys its result cache on it).
+"""
+import json
+import os
+
+import faiss
+
+from .atomic_files import atomic_path
+
+
+def params_path(index_dir: str, cache_key: str) -> str:
+    return os.path.join(index_dir, f"{cache_key}.params.json")
+
+
+def save_params(index_dir: str, cache_key: str, params: dict) -> None:
+    with atomic_path(params_path(index_dir, cache_key)) as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(params, f, indent=2)
+
+
+def file_stamp(path: str) -> list[int]:
+    """[size, mtime_ns] of a file, as stored under ``params["files"]``."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def load_params(index_dir: str, cache_key: str) -> dict:
+    """Saved params for an index, or {} for indexes built before they existed."""
+    path = params_path(index_dir, cache_key)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def apply_search_params(index: faiss.Index, params: dict) -> None:
+    """Set nprobe / efSearch on a (possibly wrapped) index."""
+    space = faiss.ParameterSpace()
+    if "nprobe" in params:
+        space.set_index_parameter(index, "nprobe", params["nprobe"])
+    if "efSearch" in params:
+        space.set_index_parameter(index, "efSearch", params["efSearch"])
@@ -0,0 +1,151 @@
+"""Selectable inference backends for the Hugging Face models we serve on CPU.
+
+``INFERENCE_BACKEND`` picks how weights are loaded and run:
+
+- ``default``: full-precision weights, as ``from_pretrained`` returns them.
+- ``int8``: dynamic int8 quantization of every linear layer. Weights are
+  stored as int8 and activations are quantized on the fly, which roughly
+  quarters the size of linear weights and speeds up matmul-bound CPU decoding.
+  GPT-2 style ``Conv1D`` projections are turned into ``nn.Linear`` first so
+  they are quantized too.
+- ``bf16``: bfloat16 weights, on CPUs with AVX512_BF16 or AMX (or a
+  bf16-capable GPU). Elsewhere, plain AVX-512 included, bf16 matmuls are
+  emulated and slower than fp32, so the model stays in fp32 with a warning.
+- ``compile``: ``torch.compile`` on the model's forward. The first calls
+  for each new shape are slow while kernels compile.
+- ``onnx``: export to ONNX and run with ONNX Runtime through ``optimum``
+  (optional dependency; falls back to ``default`` if it is not installed).
+
+``TORCH_NUM_THREADS`` / ``TORCH_INTEROP_THREADS`` pin torch's intra- and
+inter-op thread pools (0 keeps torch's default of one thread per core).
+"""
+import os
+import time
+
+import torch
+from torch.ao.nn.quantized.modules.linear import LinearPackedParams
+
+
+BACKENDS = ("default", "int8", "bf16", "compile", "onnx")
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "default").lower()
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+TORCH_INTEROP_THREADS = int(os.getenv("TORCH_INTEROP_THREADS", "0"))
+
+_ORT_CLASSES = {
+    "AutoModelForCausalLM": "ORTModelForCausalLM",
+    "AutoModelForSeq2SeqLM": "ORTModelForSeq2SeqLM",
+}
+
+
+def configure_threads(num_threads: int = TORCH_NUM_THREADS, interop_threads: int = TORCH_INTEROP_THREADS) -> None:
+    if num_threads > 0:
+        torch.set_num_threads(num_threads)
+    if interop_threads > 0:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Only settable before the first inter-op parallel work has run
+            print("Warning: TORCH_INTEROP_THREADS ignored; inter-op pool already started")
+
+
+def bf16_supported() -> bool:
+    if torch.cuda.is_available():
+        return torch.cuda.is_bf16_supported()
+    return torch.backends.cpu.get_cpu_capability() in ("AVX512_BF16", "AMX")
+
+
+def _conv1d_to_linear(model: torch.nn.Module) -> torch.nn.Module:
+    """Replace transformers' ``Conv1D`` (GPT-2 projections) with equivalent ``nn.Linear`` layers."""
+    try:
+        from transformers.pytorch_utils import Conv1D
+    except ImportError:
+        return model
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features, bias=child.bias is not None)
+                linear.weight = torch.nn.Parameter(child.weight.detach().t().contiguous())
+                if child.bias is not None:
+                    linear.bias = torch.nn.Parameter(child.bias.detach())
+                setattr(parent, name, linear)
+    return model
+
+
+def quantize_int8(model: torch.nn.Module) -> torch.nn.Module:
+    model = _conv1d_to_linear(model.cpu().float())
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def apply_backend(model, backend: str):
+    """Convert an already loaded eager model for ``backend`` (every backend but ``onnx``)."""
+    model.eval()
+    if backend == "int8":
+        return quantize_int8(model)
+    if backend == "bf16":
+        if not bf16_supported():
+            print("Warning: bf16 is not supported on this device; keeping fp32 weights")
+            return model
+        return model.to(torch.bfloat16)
+    if backend == "compile":
+        model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+
+def _load_onnx(model_cls, model_name: str):
+    try:
+        import optimum.onnxruntime as ort
+    except ImportError:
+        print("Warning: optimum[onnxruntime] is not installed; using the default backend")
+        return None
+    ort_cls = getattr(ort, _ORT_CLASSES[model_cls.__name__])
+    return ort_cls.from_pretrained(model_name, export=True)
+
+
+def load_model(model_cls, model_name: str, backend: str = INFERENCE_BACKEND, **kwargs):
+    """Load ``model_name`` with ``model_cls.from_pretrained`` and prepare it for ``backend``.
+
+    Returns ``(model, backend)``, where ``backend`` is the one actually in
+    use after any fallback. ``kwargs`` (e.g. ``device_map``) only apply to
+    the ``default`` and ``bf16`` backends; the others run on CPU.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    configure_threads()
+    if backend == "onnx":
+        model = _load_onnx(model_cls, model_name)
+        if model is not None:
+            return model, backend
+        backend = "default"
+    if backend not in ("default", "bf16"):
+        kwargs.pop("device_map", None)
+    model = model_cls.from_pretrained(model_name, **kwargs)
+    return apply_backend(model, backend), backend
+
+
+def model_bytes(model) -> int:
+    """Bytes held by a model's parameters and buffers, including packed int8 weights."""
+    if not isinstance(model, torch.nn.Module):
+        return 0
+    total = sum(t.numel() * t.element_size() for t in model.parameters())
+    total += sum(t.numel() * t.element_size() for t in model.buffers())
+    for module in model.modules():
+        if isinstance(module, LinearPackedParams):  # int8 weights are not parameters
+            weight, bias = module._weight_bias()
+            total += weight.numel() * weight.element_size()
+            total += bias.numel() * bias.element_size() if bias is not None else 0
+    return total
+
+
+def timed_load(model_cls, model_name: str, backend: str = INFERENCE_BACKEND, **kwargs):
+    """``load_model`` plus a summary dict (backend, load seconds, model bytes) for startup logs."""
+    started = time.perf_counter()
+    model, used = load_model(model_cls, model_name, backend, **kwargs)
+    info = {
+        "backend": used,
+        "load_seconds": round(time.perf_counter() - started, 3),
+        "model_bytes": model_bytes(model),
+        "threads": torch.get_num_threads(),
+    }
+    return model, info
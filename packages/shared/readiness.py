@@ -0,0 +1,89 @@
+"""Startup readiness of services that hold models.
+
+Models used to load on the first request, so the first caller after every
+deploy or scale-up paid the cold start, while ``/health`` already reported
+the instance as up. Services now preload their models in a background task
+started from the startup hook. The task runs one warm-up inference and
+records how long each step took. ``/health`` stays a liveness check; a
+separate ``/ready`` returns 503 until the warm-up has finished, so the
+orchestrator (and any load balancer) only routes to instances whose models
+are resident.
+
+    readiness = Readiness("rag", import_seconds=time.perf_counter() - _import_started)
+
+    @app.on_event("startup")
+    async def startup():
+        readiness.start_warm_up(warm_up)  # async; a sync loader goes through asyncio.to_thread
+"""
+from contextlib import contextmanager
+from typing import Awaitable, Callable
+import asyncio
+import time
+
+
+class Readiness:
+    """Tracks whether a service's models are loaded, with a per-phase timing breakdown."""
+
+    def __init__(self, service: str, import_seconds: float | None = None):
+        self.service = service
+        self.state = "starting"  # starting | warming_up | ready | failed
+        self.error: str | None = None
+        self.timings: dict[str, float] = {}
+        self._created = time.perf_counter()
+        self._task: asyncio.Task | None = None
+        if import_seconds is not None:
+            self.record("import", import_seconds)
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def record(self, phase: str, seconds: float) -> None:
+        self.timings[phase] = round(seconds, 4)
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def mark_ready(self) -> None:
+        self.state = "ready"
+        self.error = None
+        self.record("time_to_ready", time.perf_counter() - self._created)
+        breakdown = ", ".join(f"{k} {v:.2f}s" for k, v in self.timings.items())
+        print(f"{self.service} ready ({breakdown})")
+
+    def mark_failed(self, error: BaseException) -> None:
+        self.state = "failed"
+        self.error = f"{type(error).__name__}: {error}"
+        print(f"Warning: {self.service} warm-up failed: {self.error}")
+
+    def start_warm_up(self, warm_up: Callable[[], Awaitable[None]]) -> asyncio.Task:
+        """Run ``warm_up`` in the background and mark the service ready (or failed) when it returns."""
+        async def run():
+            self.state = "warming_up"
+            try:
+                await warm_up()
+            except Exception as e:
+                self.mark_failed(e)
+            else:
+                self.mark_ready()
+
+        self._task = asyncio.get_running_loop().create_task(run())
+        return self._task
+
+    def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def status(self) -> dict:
+        return {
+            "service": self.service,
+            "ready": self.ready,
+            "state": self.state,
+            "error": self.error,
+            "timings": dict(self.timings),
+        }
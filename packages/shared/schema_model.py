@@ -0,0 +1,294 @@
+"""Parse-once structural model of an XSD.
+
+``build_schema_model`` walks a compiled schema once and records one chunk per
+global element, global attribute and named type, plus one per element and
+attribute declared in their content: path, type, cardinality, enumerations,
+patterns and documentation. template_fetcher
+embeds the chunks and saves the model as ``{cache_key}.schema.json`` next to
+the index, so other services can load it instead of recompiling the XSD.
+"""
+from collections import OrderedDict, deque
+import json
+import os
+import threading
+
+from .atomic_files import atomic_path
+from .embedding_cache import normalize_text
+
+
+SCHEMA_MODEL_VERSION = 4
+MAX_DEPTH = 32
+MAX_ENUM_IN_TEXT = 25
+XSD_NAMESPACE = "http://www.w3.org/2001/XMLSchema"
+
+
+def _type_name(typ) -> str:
+    while typ is not None and typ.name is None:
+        # Anonymous type: describe it by what it restricts or extends
+        typ = getattr(typ, "base_type", None)
+    return typ.prefixed_name if typ is not None else "anonymous"
+
+
+def _simple_part(typ):
+    if typ.is_simple():
+        return typ
+    if typ.has_simple_content():
+        return typ.content
+    return None
+
+
+def _builtin(typ) -> str | None:
+    """Local name of the nearest XSD built-in type (e.g. "decimal") behind a simple value."""
+    simple = _simple_part(typ)
+    while simple is not None:
+        if simple.target_namespace == XSD_NAMESPACE and simple.local_name:
+            return simple.local_name
+        simple = getattr(simple, "base_type", None) or getattr(simple, "primitive_type", None)
+    return None
+
+
+def _facets(typ) -> tuple[list[str], list[str]]:
+    simple = _simple_part(typ)
+    if simple is None:
+        return [], []
+    enumeration = getattr(simple, "enumeration", None) or []
+    patterns = getattr(simple, "patterns", None)
+    return [str(v) for v in enumeration], list(patterns.regexps) if patterns is not None else []
+
+
+def _documentation(*components) -> str:
+    for component in components:
+        annotation = getattr(component, "annotation", None)
+        if annotation is not None and annotation.documentation:
+            return normalize_text(" ".join(doc.text or "" for doc in annotation.documentation))
+    return ""
+
+
+def _max_occurs(value) -> int | str:
+    return "unbounded" if value is None else value
+
+
+def _component_chunk(kind: str, path: str, name: str, typ, min_occurs, max_occurs, *components) -> dict:
+    enumerations, patterns = _facets(typ)
+    return {
+        "kind": kind,
+        "path": path,
+        "name": name,
+        "type": _type_name(typ),
+        "builtin": _builtin(typ),
+        "min_occurs": min_occurs,
+        "max_occurs": max_occurs,
+        "enumerations": enumerations,
+        "patterns": patterns,
+        "documentation": _documentation(*components, typ),
+        "complex": typ.is_complex() and not typ.has_simple_content(),
+    }
+
+
+def build_schema_model(schema, xsd_sha256: str = "") -> dict:
+    """Describe a compiled ``xmlschema.XMLSchema`` as a JSON-serialisable dict.
+
+    Each global element (``/Name``), global attribute (``/@name``) and named
+    type (``#TypeName``) is described once, with the elements and attributes
+    of its content under its own path (``#TypeName/Child``). Anonymous types
+    are described inline under the element that declares them. A child whose
+    type is named points to it with ``type_ref``, and an element reference
+    points to the global element with ``ref``, so the model grows with the
+    size of the schema rather than with the number of instance paths. See
+    ``expand_schema_model`` for the paths of a document. Types are told apart
+    by qualified name; imported ones are written ``#prefix:TypeName``.
+    """
+    chunks: list[dict] = []
+    pending_types: dict[str, object] = {}  # keyed by qualified name, "{namespace}local"
+    prefixes = {uri: prefix for prefix, uri in schema.namespaces.items() if prefix}
+    type_paths: dict[str, str] = {}
+
+    def type_path(typ) -> str:
+        if typ.name not in type_paths:
+            namespace = typ.target_namespace
+            if namespace == schema.target_namespace:
+                type_paths[typ.name] = f"#{typ.local_name}"
+            else:
+                prefix = prefixes.setdefault(namespace, f"ns{len(prefixes)}")
+                type_paths[typ.name] = f"#{prefix}:{typ.local_name}"
+        return type_paths[typ.name]
+
+    def named_complex(typ) -> bool:
+        return typ.name is not None and typ.is_complex() and not typ.has_simple_content()
+
+    def content(typ, path: str) -> None:
+        """Chunks for the attributes and child elements of a complex type."""
+        for attr in typ.attributes.values():
+            if not hasattr(attr, "local_name") or attr.local_name is None:
+                continue  # attribute wildcards
+            chunks.append(_component_chunk(
+                "attribute", f"{path}/@{attr.local_name}", attr.local_name, attr.type,
+                1 if attr.use == "required" else 0, 1, attr,
+            ))
+        if typ.is_complex() and not typ.has_simple_content():
+            for child in typ.content.iter_elements():
+                if getattr(child, "type", None) is not None:  # skip xs:any wildcards
+                    element(child, path)
+
+    def element(elem, parent_path: str) -> None:
+        typ = elem.type
+        path = f"{parent_path}/{elem.local_name}"
+        chunk = _component_chunk("element", path, elem.local_name, typ, elem.min_occurs,
+                                 _max_occurs(elem.max_occurs), elem)
+        chunks.append(chunk)
+        if parent_path and getattr(elem, "ref", None) is not None:
+            chunk["ref"] = f"/{elem.local_name}"
+        elif named_complex(typ):
+            chunk["type_ref"] = type_path(typ)
+            pending_types.setdefault(typ.name, typ)
+        elif typ.is_complex():
+            content(typ, path)
+
+    for elem in schema.elements.values():
+        element(elem, "")
+    for attr in schema.attributes.values():
+        chunks.append(_component_chunk("attribute", f"/@{attr.local_name}", attr.local_name, attr.type,
+                                       0, 1, attr))
+
+    described: set[str] = set()
+    queue = deque((typ.name, typ) for typ in schema.types.values())
+    while queue or pending_types:
+        name, typ = queue.popleft() if queue else pending_types.popitem()
+        if name in described:
+            continue
+        described.add(name)
+        path = type_path(typ)
+        chunks.append(_component_chunk("type", path, typ.local_name, typ, 0, 0))
+        if typ.is_complex():
+            content(typ, path)
+
+    return {
+        "version": SCHEMA_MODEL_VERSION,
+        "xsd_sha256": xsd_sha256,
+        "target_namespace": schema.target_namespace,
+        "roots": [elem.local_name for elem in schema.elements.values()],
+        "chunks": chunks,
+    }
+
+
+def expand_schema_model(model: dict, max_depth: int = MAX_DEPTH) -> list[dict]:
+    """Element and attribute chunks at their document paths, from the global elements down.
+
+    Type and element references are followed, so every use of a named type
+    gets its own copy of that type's content. A complex element whose type is
+    already on the path (or at ``max_depth``) is marked ``recursive`` and not
+    expanded further. Meant for small schemas that need instance paths, such
+    as the renderer's regulator formats; the size of the result grows with the
+    number of paths through the schema.
+    """
+    by_path = {chunk["path"]: chunk for chunk in model["chunks"]}
+    children: dict[str, list[dict]] = {}
+    for chunk in model["chunks"]:
+        children.setdefault(chunk["path"].rpartition("/")[0], []).append(chunk)
+    expanded: list[dict] = []
+
+    def walk(chunk: dict, path: str, stack: tuple[str, ...]) -> None:
+        out = {key: value for key, value in chunk.items() if key not in ("ref", "type_ref")}
+        out["path"] = path
+        if "ref" in chunk:
+            target = by_path[chunk["ref"]]
+            source = target.get("type_ref", target["path"])
+            out.update({key: target[key] for key in ("type", "builtin", "enumerations", "patterns", "complex")})
+            out["documentation"] = chunk["documentation"] or target["documentation"]
+        else:
+            source = chunk.get("type_ref", chunk["path"])
+        expanded.append(out)
+        if chunk["kind"] != "element":
+            return
+        if out["complex"]:
+            if source in stack or len(stack) >= max_depth:
+                out["recursive"] = True
+                return
+            stack = stack + (source,)
+        for child in children.get(source, []):
+            walk(child, f"{path}/{child['path'].rpartition('/')[2]}", stack)
+
+    for chunk in model["chunks"]:
+        if chunk["kind"] == "element" and chunk["path"].startswith("/") and chunk["path"].count("/") == 1:
+            walk(chunk, chunk["path"], ())
+    return expanded
+
+
+def chunk_text(chunk: dict) -> str:
+    """One-line retrieval text for a chunk."""
+    parts = [f"{chunk['kind']}:{chunk['path']}", f"type={chunk['type']}"]
+    if chunk["kind"] != "type":
+        parts.append(f"cardinality={chunk['min_occurs']}..{chunk['max_occurs']}")
+    if chunk.get("ref"):
+        parts.append(f"ref={chunk['ref']}")
+    if chunk["enumerations"]:
+        values = chunk["enumerations"][:MAX_ENUM_IN_TEXT]
+        more = len(chunk["enumerations"]) - len(values)
+        parts.append("enum=" + "|".join(values) + (f"|+{more} more" if more > 0 else ""))
+    if chunk["patterns"]:
+        parts.append("pattern=" + " ".join(chunk["patterns"]))
+    if chunk["documentation"]:
+        parts.append(f"doc={chunk['documentation']}")
+    return normalize_text(" ".join(parts))
+
+
+def schema_model_path(model_dir: str, cache_key: str) -> str:
+    return os.path.join(model_dir, f"{cache_key}.schema.json")
+
+
+def save_schema_model(model_dir: str, cache_key: str, model: dict) -> None:
+    with atomic_path(schema_model_path(model_dir, cache_key)) as tmp:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(model, f)
+
+
+def load_schema_model(model_dir: str, cache_key: str, xsd_sha256: str | None = None) -> dict | None:
+    """Saved model for ``cache_key``; None if missing, from an older version, or for a different XSD."""
+    path = schema_model_path(model_dir, cache_key)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        model = json.load(f)
+    if model.get("version") != SCHEMA_MODEL_VERSION:
+        return None
+    if xsd_sha256 is not None and model.get("xsd_sha256") != xsd_sha256:
+        return None
+    return model
+
+
+class SchemaModelStore:
+    """Loaded schema models keyed by cache_key, reloaded when the file changes."""
+
+    def __init__(self, model_dir: str, max_entries: int = 32):
+        self.model_dir = model_dir
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[int, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key: str) -> dict | None:
+        path = schema_model_path(self.model_dir, cache_key)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(cache_key)
+                return entry[1]
+        model = load_schema_model(self.model_dir, cache_key)
+        if model is None:
+            return None
+        with self._lock:
+            self._entries[cache_key] = (mtime, model)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return model
+
+    def invalidate(self, cache_key: str | None = None) -> None:
+        with self._lock:
+            if cache_key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(cache_key, None)
@@ -1,14 +1,13 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from sar_agent.core.llm_engine import LLMEngine
+from sar_agent.core.llm_engine import get_llm_engine
 
 router = APIRouter()
-llm = LLMEngine()
 
 class PromptRequest(BaseModel):
     prompt: str
 
 @router.post("/generate")
 async def generate_text(request: PromptRequest):
-    response = llm.generate(request.prompt)
+    response = get_llm_engine().generate(request.prompt)
     return {"response": response}
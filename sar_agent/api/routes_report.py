@@ -1,9 +1,13 @@
-from fastapi import APIRouter
-from sar_agent.core.llm_engine import LLMEngine
-from sar_agent.core.report_builder import build_pdf_report, build_xml_report
+import os
+import tempfile
+
+from fastapi import APIRouter, UploadFile
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from sar_agent.core.llm_engine import get_llm_engine
+from sar_agent.core.report_builder import build_pdf_report, build_xml_report, iter_parsed_rows, stream_xml_report
 
 router = APIRouter()
-llm = LLMEngine()
 
 @router.post("/generate")
 def generate_report(input_text: str):
@@ -12,7 +16,7 @@ def generate_report(input_text: str):
     Convert the following suspicious activity details into a structured SAR/STR report:
     {input_text}
     """
-    llm_output = llm.infer(prompt, max_tokens=400)
+    llm_output = get_llm_engine().generate(prompt, max_length=400)
 
     # Save as both PDF + XML
     pdf_path = build_pdf_report(llm_output, "sar_report.pdf")
@@ -24,3 +28,20 @@ def generate_report(input_text: str):
         "xml_report": xml_path,
         "preview": llm_output[:300]
     }
+
+@router.post("/xml_stream")
+def stream_report(file: UploadFile, row_tag: str = "Transaction", gzip_output: bool = False):
+    """Write an NDJSON upload of parsed rows to an XML report one row at a time and return it.
+
+    Each request writes its own temporary file, removed once the response has been sent.
+    """
+    suffix = ".xml.gz" if gzip_output else ".xml"
+    with tempfile.NamedTemporaryFile(prefix="sar_report_", suffix=suffix, delete=False) as tmp:
+        output_path = tmp.name
+    try:
+        stream_xml_report(iter_parsed_rows(file.file), output_path, row_tag=row_tag, gzip_output=gzip_output)
+    except BaseException:
+        os.remove(output_path)
+        raise
+    return FileResponse(output_path, media_type="application/gzip" if gzip_output else "application/xml",
+                        filename=f"sar_report{suffix}", background=BackgroundTask(os.remove, output_path))
@@ -1,9 +1,11 @@
-import fitz  # PyMuPDF for PDF
-import docx
-import pandas as pd
 import xml.etree.ElementTree as ET
 
+# PyMuPDF, python-docx and pandas are imported by the function that needs them,
+# so the API starts without loading all three
+
 def extract_text_from_pdf(file_path: str) -> str:
+    import fitz  # PyMuPDF
+
     text = ""
     doc = fitz.open(file_path)
     for page in doc:
@@ -11,10 +13,14 @@ def extract_text_from_pdf(file_path: str) -> str:
     return text
 
 def extract_text_from_docx(file_path: str) -> str:
+    import docx
+
     doc = docx.Document(file_path)
     return "\n".join([p.text for p in doc.paragraphs])
 
 def extract_text_from_csv(file_path: str) -> str:
+    import pandas as pd
+
     df = pd.read_csv(file_path)
     return df.to_string()
 
@@ -1,12 +1,28 @@
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+import threading
+
+_engine = None
+_engine_lock = threading.Lock()
 
 class LLMEngine:
-    def __init__(self, model_name="google/flan-t5-small"):
-        print(f"Loading model: {model_name}")
+    def __init__(self, model_name="google/flan-t5-small", backend: str | None = None):
+        # transformers/torch are imported here so importing the API routers stays cheap
+        from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+        from packages.shared.model_backends import INFERENCE_BACKEND, load_model
+
+        backend = backend or INFERENCE_BACKEND
+        print(f"Loading model: {model_name} ({backend} backend)")
         self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+        self.model, self.backend = load_model(AutoModelForSeq2SeqLM, model_name, backend)
 
     def generate(self, prompt: str, max_length: int = 256) -> str:
         inputs = self.tokenizer(prompt, return_tensors="pt")
         outputs = self.model.generate(**inputs, max_length=max_length)
         return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+
+def get_llm_engine() -> LLMEngine:
+    """The process-wide engine, loaded on first use and shared by all routers."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = LLMEngine()
+    return _engine
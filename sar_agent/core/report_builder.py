@@ -1,8 +1,15 @@
-from reportlab.platypus import SimpleDocTemplate, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
+from contextlib import ExitStack
+from typing import Iterable
+import json
+import re
 import xml.etree.ElementTree as ET
 
+from lxml import etree
+
 def build_pdf_report(text: str, output_path: str = "report.pdf"):
+    from reportlab.platypus import SimpleDocTemplate, Paragraph
+    from reportlab.lib.styles import getSampleStyleSheet
+
     doc = SimpleDocTemplate(output_path)
     styles = getSampleStyleSheet()
     flowables = [Paragraph(text, styles["Normal"])]
@@ -17,3 +24,112 @@ def build_xml_report(data: dict, output_path: str = "report.xml"):
     tree = ET.ElementTree(root)
     tree.write(output_path, encoding="utf-8", xml_declaration=True)
     return output_path
+
+
+_INVALID_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_INVALID_TAG_CHARS = re.compile(r"[^\w.-]")
+
+
+def _tag(key) -> str:
+    """Turn a field name (e.g. a CSV header) into a valid XML element name."""
+    tag = _INVALID_TAG_CHARS.sub("_", str(key).strip()) or "Field"
+    if not (tag[0].isalpha() or tag[0] == "_") or tag.lower().startswith("xml"):
+        tag = f"_{tag}"
+    return tag
+
+
+def _append(parent, key, value) -> None:
+    if isinstance(value, list):
+        for item in value:
+            _append(parent, key, item)
+        return
+    child = etree.SubElement(parent, _tag(key))
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _append(child, k, v)
+    elif value is not None:
+        child.text = _INVALID_XML_CHARS.sub("", str(value))
+
+
+def row_element(row: dict, tag: str = "Row") -> etree._Element:
+    """One row as an element: dicts nest, lists repeat the tag, other values become text."""
+    element = etree.Element(_tag(tag))
+    for key, value in row.items():
+        _append(element, key, value)
+    return element
+
+
+class StreamingXMLReportWriter:
+    """Writes a report row by row with ``lxml.etree.xmlfile``.
+
+    Only the current row is held as a tree; everything before it has already
+    been serialized to the output, so memory stays flat however many rows a
+    filing has. Output is gzip-compressed when ``gzip_output`` is set (or the
+    path ends in ``.gz``).
+
+        with StreamingXMLReportWriter("report.xml.gz", header={"ReportID": "SAR-1"}) as writer:
+            for row in rows:
+                writer.write_row(row, tag="Transaction")
+    """
+
+    def __init__(self, output_path: str, root_tag: str = "SARReport", header: dict | None = None,
+                 gzip_output: bool | None = None, compression_level: int = 6, flush_every: int = 1000):
+        self.output_path = output_path
+        self.root_tag = root_tag
+        self.header = header or {}
+        if gzip_output is None:
+            gzip_output = output_path.endswith(".gz")
+        self.compression = compression_level if gzip_output else 0
+        self.flush_every = flush_every
+        self.rows_written = 0
+        self._stack: ExitStack | None = None
+        self._xf = None
+
+    def __enter__(self) -> "StreamingXMLReportWriter":
+        self._stack = ExitStack()
+        try:
+            self._xf = self._stack.enter_context(
+                etree.xmlfile(self.output_path, encoding="utf-8", compression=self.compression)
+            )
+            self._xf.write_declaration()
+            self._stack.enter_context(self._xf.element(_tag(self.root_tag)))
+            if self.header:
+                self._xf.write(row_element(self.header, "Header"))
+        except BaseException:
+            self._stack.close()
+            raise
+        return self
+
+    def write_row(self, row: dict, tag: str = "Row") -> None:
+        self._xf.write(row_element(row, tag))
+        self.rows_written += 1
+        if self.rows_written % self.flush_every == 0:
+            self._xf.flush()
+
+    def write_rows(self, rows: Iterable[dict], tag: str = "Row") -> int:
+        for row in rows:
+            self.write_row(row, tag)
+        return self.rows_written
+
+    def __exit__(self, *exc_info) -> None:
+        self._stack.__exit__(*exc_info)
+        self._stack = self._xf = None
+
+
+def iter_parsed_rows(lines: Iterable[str | bytes]) -> Iterable[dict]:
+    """Rows from a parsed-json NDJSON stream (one ``{"job_id", "row", ...}`` message per line)."""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.strip():
+            continue
+        message = json.loads(line)
+        yield message.get("row", message)
+
+
+def stream_xml_report(rows: Iterable[dict], output_path: str = "report.xml", header: dict | None = None,
+                      row_tag: str = "Row", gzip_output: bool | None = None) -> str:
+    """Write ``rows`` (any iterable, consumed lazily) as a report without building the full tree."""
+    with StreamingXMLReportWriter(output_path, header=header, gzip_output=gzip_output) as writer:
+        writer.write_rows(rows, row_tag)
+    return output_path
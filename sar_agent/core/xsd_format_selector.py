@@ -1,8 +1,11 @@
 from __future__ import annotations
 
+from collections import Counter
 from dataclasses import dataclass
 from enum import Enum
-from typing import Tuple, Dict, Any, List
+from functools import lru_cache
+from typing import Tuple, Dict, Any, AsyncIterable, Iterable, List
+import codecs
 
 
 class FormatType(Enum):
@@ -23,6 +26,130 @@ class ComplexityMetrics:
     beneficial_owner_count: int = 0
     risk_factors_count: int = 0
     total_complexity_score: float = 0.0
+    complete: bool = True  # False if a streaming selector stopped before the end of the input
+
+
+# A case scoring above this is complex
+SIMPLE_THRESHOLD = 5.0
+
+# Weight of each metric in the complexity score
+METRIC_WEIGHTS: Dict[str, float] = {
+    "entity_count": 1.0,
+    "transaction_count": 1.5,
+    "relationship_count": 1.5,
+    "document_count": 1.0,
+    "note_count": 0.5,
+    "custom_field_count": 0.5,
+    "geographic_coordinates": 1.0,
+    "intermediary_count": 1.0,
+    "beneficial_owner_count": 1.0,
+    "risk_factors_count": 1.0,
+}
+
+# Tokens that count toward a metric when they match exactly, or start with a prefix
+_EXACT_TOKENS: Dict[str, str] = {
+    "txn": "transaction_count",
+    "tx": "transaction_count",
+    "relationship": "relationship_count",
+    "relatedentity": "relationship_count",
+    "type": "custom_field_count",
+    "status": "custom_field_count",
+    "amount": "custom_field_count",
+    "lat": "geographic_coordinates",
+    "lon": "geographic_coordinates",
+    "geo": "geographic_coordinates",
+    "intermediary": "intermediary_count",
+    "beneficial": "beneficial_owner_count",
+    "owner": "beneficial_owner_count",
+    "risk": "risk_factors_count",
+    "severity": "risk_factors_count",
+    "confidence": "risk_factors_count",
+}
+_PREFIX_TOKENS: Tuple[Tuple[str, str], ...] = (
+    ("entity", "entity_count"),
+    ("transaction", "transaction_count"),
+    ("document", "document_count"),
+    ("note", "note_count"),
+)
+
+
+@lru_cache(maxsize=65536)
+def _classify(token: str) -> str | None:
+    """The metric a (lowercase) token counts toward, if any."""
+    metric = _EXACT_TOKENS.get(token)
+    if metric is None:
+        for prefix, name in _PREFIX_TOKENS:
+            if token.startswith(prefix):
+                return name
+    return metric
+
+
+# Field separators are token boundaries, like whitespace
+_SEPARATORS = str.maketrans("|:,", "   ")
+
+
+class ComplexityScorer:
+    """Incremental complexity score, fed a case in pieces.
+
+    Pieces can be lines, or arbitrary chunks of a byte stream: a token cut
+    at the end of a chunk is held back until the next one. Every metric and
+    the token-count bonus only grow as input arrives, so once ``exceeded``
+    is true the case is complex however it continues.
+    """
+
+    def __init__(self, threshold: float = SIMPLE_THRESHOLD) -> None:
+        self.threshold = threshold
+        self.counts: Dict[str, int] = dict.fromkeys(METRIC_WEIGHTS, 0)
+        self.token_count = 0
+        self.bytes_read = 0
+        self._weighted = 0.0
+        self._tail = ""
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    @property
+    def score(self) -> float:
+        # Additional bonus for lines > 4 (proxy for complexity)
+        # We cannot easily count lines here, but increase score if many tokens present
+        if self.token_count > 30:
+            return self._weighted + 3.0
+        if self.token_count > 15:
+            return self._weighted + 1.5
+        return self._weighted
+
+    @property
+    def exceeded(self) -> bool:
+        return self.score > self.threshold
+
+    def add(self, tokens: Counter) -> None:
+        """Count already tokenized (lowercase) tokens."""
+        for token, count in tokens.items():
+            metric = _classify(token)
+            if metric is not None:
+                self.counts[metric] += count
+                self._weighted += METRIC_WEIGHTS[metric] * count
+        self.token_count += sum(tokens.values())
+
+    def feed(self, chunk: str | bytes) -> bool:
+        """Score the next piece of the case; returns ``exceeded``."""
+        if isinstance(chunk, bytes):
+            self.bytes_read += len(chunk)
+            chunk = self._decoder.decode(chunk)
+        text = (self._tail + chunk).translate(_SEPARATORS).lower()
+        tokens = text.split()
+        # A chunk that does not end on a boundary may have cut its last token short
+        self._tail = tokens.pop() if tokens and not text[-1].isspace() else ""
+        self.add(Counter(tokens))
+        return self.exceeded
+
+    def close(self) -> bool:
+        """Score whatever is still held back at the end of the input."""
+        self.feed(self._decoder.decode(b"", final=True) + " ")
+        return self.exceeded
+
+    def metrics(self, complete: bool = True) -> ComplexityMetrics:
+        metrics = ComplexityMetrics(**self.counts, complete=complete)
+        metrics.total_complexity_score = self.score
+        return metrics
 
 
 class XSDFormatSelector:
@@ -31,9 +158,15 @@ class XSDFormatSelector:
     Heuristics are intentionally simple and deterministic to satisfy tests:
     - Count occurrences of key tokens to derive a complexity score
     - If score > threshold choose complex, otherwise simple
+
+    Tokens are counted once with a ``Counter`` and each distinct token is
+    classified once (memoized across cases), so scoring is a single pass
+    over the text however many metrics there are. The ``*_stream`` /
+    ``*_async`` / ``*_file`` variants read a case incrementally and stop as
+    soon as it is known to be complex, unless ``full_metrics`` is set.
     """
 
-    SIMPLE_THRESHOLD: float = 5.0
+    SIMPLE_THRESHOLD: float = SIMPLE_THRESHOLD
 
     def __init__(self) -> None:
         self._format_info: Dict[FormatType, Dict[str, Any]] = {
@@ -77,11 +210,41 @@ class XSDFormatSelector:
         }
 
     def get_format_recommendation(self, pipe_data: str) -> Tuple[FormatType, str, ComplexityMetrics]:
-        tokens = self._tokenize(pipe_data)
-        metrics = self._compute_metrics(tokens)
-        reasoning = self._build_reasoning(metrics)
-        format_type = FormatType.COMPLEX if metrics.total_complexity_score > self.SIMPLE_THRESHOLD else FormatType.SIMPLE
-        return format_type, reasoning, metrics
+        return self._recommend(self._compute_metrics(self._tokenize(pipe_data)))
+
+    def get_format_recommendations(self, cases: Iterable[str]) -> List[Tuple[FormatType, str, ComplexityMetrics]]:
+        """Recommend a format for each case; token classifications are shared across the batch."""
+        return [self.get_format_recommendation(pipe_data) for pipe_data in cases]
+
+    def get_format_recommendation_stream(self, chunks: Iterable[str | bytes],
+                                         full_metrics: bool = False) -> Tuple[FormatType, str, ComplexityMetrics]:
+        """Recommend a format from lines or byte chunks, reading only until the case is known to be complex.
+
+        Chunks are consecutive pieces of the input, so lines must keep their
+        line endings (as iterating a file gives them).
+        """
+        scorer = ComplexityScorer(self.SIMPLE_THRESHOLD)
+        for chunk in chunks:
+            if scorer.feed(chunk) and not full_metrics:
+                return self._recommend(scorer.metrics(complete=False))
+        scorer.close()
+        return self._recommend(scorer.metrics())
+
+    async def get_format_recommendation_async(self, chunks: AsyncIterable[str | bytes],
+                                              full_metrics: bool = False) -> Tuple[FormatType, str, ComplexityMetrics]:
+        """Like ``get_format_recommendation_stream``, for an async stream such as a request body."""
+        scorer = ComplexityScorer(self.SIMPLE_THRESHOLD)
+        async for chunk in chunks:
+            if scorer.feed(chunk) and not full_metrics:
+                return self._recommend(scorer.metrics(complete=False))
+        scorer.close()
+        return self._recommend(scorer.metrics())
+
+    def get_format_recommendation_file(self, path: str, full_metrics: bool = False,
+                                       chunk_size: int = 64 * 1024) -> Tuple[FormatType, str, ComplexityMetrics]:
+        """Recommend a format for a case file without loading it into memory."""
+        with open(path, "rb") as f:
+            return self.get_format_recommendation_stream(iter(lambda: f.read(chunk_size), b""), full_metrics)
 
     def validate_pipe_data(self, pipe_data: str) -> List[str]:
         issues: List[str] = []
@@ -102,48 +265,21 @@ class XSDFormatSelector:
     def get_format_info(self, format_type: FormatType) -> Dict[str, Any]:
         return self._format_info.get(format_type, {})
 
-    def _tokenize(self, text: str) -> List[str]:
-        # Split on pipes and non-alphanumeric boundaries, keep simple lowercase tokens
-        raw = text.replace("|", " ").replace(":", " ").replace(",", " ")
-        return [t.lower() for t in raw.split() if t]
-
-    def _compute_metrics(self, tokens: List[str]) -> ComplexityMetrics:
-        metrics = ComplexityMetrics()
-
-        # Simple heuristics based on token presence/frequency
-        metrics.entity_count = sum(tok.startswith("entity") for tok in tokens)
-        metrics.transaction_count = sum(tok.startswith("transaction") or tok in {"txn", "tx"} for tok in tokens)
-        metrics.relationship_count = tokens.count("relationship") + tokens.count("relatedentity")
-        metrics.document_count = sum(tok.startswith("document") for tok in tokens)
-        metrics.note_count = sum(tok.startswith("note") for tok in tokens)
-        metrics.custom_field_count = tokens.count("type") + tokens.count("status") + tokens.count("amount")
-        metrics.geographic_coordinates = tokens.count("lat") + tokens.count("lon") + tokens.count("geo")
-        metrics.intermediary_count = tokens.count("intermediary")
-        metrics.beneficial_owner_count = tokens.count("beneficial") + tokens.count("owner")
-        metrics.risk_factors_count = tokens.count("risk") + tokens.count("severity") + tokens.count("confidence")
-
-        # Weighted sum to produce an overall score
-        score = 0.0
-        score += 1.0 * metrics.entity_count
-        score += 1.5 * metrics.transaction_count
-        score += 1.5 * metrics.relationship_count
-        score += 1.0 * metrics.document_count
-        score += 0.5 * metrics.note_count
-        score += 0.5 * metrics.custom_field_count
-        score += 1.0 * metrics.geographic_coordinates
-        score += 1.0 * metrics.intermediary_count
-        score += 1.0 * metrics.beneficial_owner_count
-        score += 1.0 * metrics.risk_factors_count
+    def _tokenize(self, text: str) -> Counter:
+        # Split on pipes and non-alphanumeric boundaries, count simple lowercase tokens
+        raw = text.replace("|", " ").replace(":", " ").replace(",", " ").lower()
+        return Counter(raw.split())
 
-        # Additional bonus for lines > 4 (proxy for complexity)
-        # We cannot easily count lines here, but increase score if many tokens present
-        if len(tokens) > 30:
-            score += 3.0
-        elif len(tokens) > 15:
-            score += 1.5
+    def _compute_metrics(self, tokens: Counter) -> ComplexityMetrics:
+        # Simple heuristics based on token presence/frequency, weighted into an overall score
+        scorer = ComplexityScorer(self.SIMPLE_THRESHOLD)
+        scorer.add(tokens)
+        return scorer.metrics()
 
-        metrics.total_complexity_score = score
-        return metrics
+    def _recommend(self, metrics: ComplexityMetrics) -> Tuple[FormatType, str, ComplexityMetrics]:
+        reasoning = self._build_reasoning(metrics)
+        format_type = FormatType.COMPLEX if metrics.total_complexity_score > self.SIMPLE_THRESHOLD else FormatType.SIMPLE
+        return format_type, reasoning, metrics
 
     def _build_reasoning(self, metrics: ComplexityMetrics) -> str:
         parts = [
@@ -154,5 +290,7 @@ class XSDFormatSelector:
             f"risk_factors={metrics.risk_factors_count}",
             f"score={metrics.total_complexity_score:.2f}",
         ]
+        if not metrics.complete:
+            parts.append("stopped early: threshold crossed")
         return "; ".join(parts)
 
@@ -0,0 +1,89 @@
+import gzip
+import json
+import tracemalloc
+
+from lxml import etree
+
+from sar_agent.core.report_builder import StreamingXMLReportWriter, iter_parsed_rows, stream_xml_report
+
+
+def transaction(i: int) -> dict:
+    return {
+        "row_number": i,
+        "raw_data": {"EntityName": f"Entity {i}", "Amount": "100.00", "Status Code": "OK"},
+        "transaction_id": f"TXN-{i:06d}",
+        "notes": ["first", "second"],
+    }
+
+
+class TestStreamingXMLReportWriter:
+    """Test the row-by-row XML report writer."""
+
+    def test_rows_header_and_escaping(self, tmp_path):
+        path = str(tmp_path / "report.xml")
+        with StreamingXMLReportWriter(path, header={"ReportID": "SAR-1"}) as writer:
+            writer.write_row({"EntityName": "A & B <Ltd>", "1st": "x"}, tag="Entity")
+            writer.write_rows((transaction(i) for i in range(3)), tag="Transaction")
+        root = etree.parse(path).getroot()
+        assert root.tag == "SARReport"
+        assert root.findtext("Header/ReportID") == "SAR-1"
+        assert root.findtext("Entity/EntityName") == "A & B <Ltd>"
+        assert root.find("Entity/_1st") is not None
+        assert [t.findtext("transaction_id") for t in root.findall("Transaction")] == [
+            "TXN-000000", "TXN-000001", "TXN-000002"]
+        assert root.find("Transaction/raw_data/Status_Code").text == "OK"
+        assert len(root.findall("Transaction/notes")) == 6
+
+    def test_gzip_output(self, tmp_path):
+        path = str(tmp_path / "report.xml.gz")
+        stream_xml_report((transaction(i) for i in range(10)), path, row_tag="Transaction")
+        with gzip.open(path, "rb") as f:
+            root = etree.parse(f).getroot()
+        assert len(root.findall("Transaction")) == 10
+
+    def test_parsed_json_stream(self, tmp_path):
+        lines = [json.dumps({"job_id": "j1", "row": transaction(i)}).encode("utf-8") + b"\n" for i in range(2)]
+        path = str(tmp_path / "report.xml")
+        stream_xml_report(iter_parsed_rows(lines + [b"\n"]), path, row_tag="Transaction")
+        assert len(etree.parse(path).getroot().findall("Transaction")) == 2
+
+    def test_memory_does_not_grow_with_rows(self, tmp_path):
+        def peak(rows: int) -> int:
+            tracemalloc.start()
+            stream_xml_report((transaction(i) for i in range(rows)), str(tmp_path / f"{rows}.xml"))
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return peak_bytes
+
+        small, large = peak(1_000), peak(20_000)
+        assert large < small * 2
+
+
+class TestXMLStreamRoute:
+    """Test the /report/xml_stream endpoint."""
+
+    def test_concurrent_requests_get_their_own_report(self, tmp_path, monkeypatch):
+        from concurrent.futures import ThreadPoolExecutor
+
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+
+        from sar_agent.api import routes_report
+
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(routes_report.tempfile, "tempdir", str(tmp_path))
+        app = FastAPI()
+        app.include_router(routes_report.router, prefix="/report")
+        client = TestClient(app)
+
+        def post(rows: int, gzip_output: bool) -> bytes:
+            body = b"".join(json.dumps({"row": transaction(i)}).encode("utf-8") + b"\n" for i in range(rows))
+            r = client.post(f"/report/xml_stream?gzip_output={str(gzip_output).lower()}",
+                            files={"file": ("rows.ndjson", body)})
+            assert r.status_code == 200
+            return gzip.decompress(r.content) if gzip_output else r.content
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            reports = list(pool.map(post, [5, 50, 500, 7], [False, True, False, True]))
+        assert [len(etree.fromstring(report).findall("Transaction")) for report in reports] == [5, 50, 500, 7]
+        assert list(tmp_path.iterdir()) == []
@@ -1,7 +1,12 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+import codecs
+import json
 import os
 import sys
+import tempfile
+import time
 
 # Add the sar_agent core to the path
 sys.path.append(os.path.join(os.path.dirname(__file__), "../../../sar_agent/core"))
@@ -9,12 +14,18 @@ from xsd_format_selector import XSDFormatSelector, FormatType
 
 app = FastAPI(title="XSD Format Selector")
 
+BATCH_SPOOL_BYTES = int(os.getenv("BATCH_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
 # Initialize the format selector
 selector = XSDFormatSelector()
 
 class AnalyzeRequest(BaseModel):
     pipe_data: str
 
+class BatchCase(BaseModel):
+    pipe_data: str
+    case_id: str | None = None
+
 class ValidateRequest(BaseModel):
     pipe_data: str
 
@@ -26,31 +37,129 @@ async def analyze_pipe_data(request: AnalyzeRequest):
     """Analyze pipe-formatted data and recommend XSD format"""
     try:
         format_type, reasoning, metrics = selector.get_format_recommendation(request.pipe_data)
-        
-        return {
-            "recommended_format": format_type.value,
-            "format_name": selector.get_format_info(format_type).get("name", "Unknown"),
-            "reasoning": reasoning,
-            "complexity_metrics": {
-                "entities": metrics.entity_count,
-                "transactions": metrics.transaction_count,
-                "relationships": metrics.relationship_count,
-                "documents": metrics.document_count,
-                "notes": metrics.note_count,
-                "custom_fields": metrics.custom_field_count,
-                "geographic_coordinates": metrics.geographic_coordinates,
-                "intermediaries": metrics.intermediary_count,
-                "beneficial_owners": metrics.beneficial_owner_count,
-                "risk_factors": metrics.risk_factors_count,
-                "overall_score": metrics.total_complexity_score
-            },
-            "format_characteristics": selector.get_format_info(format_type).get("characteristics", {}),
-            "best_for": selector.get_format_info(format_type).get("best_for", []),
-            "data_requirements": selector.get_format_info(format_type).get("data_requirements", [])
-        }
+        return recommendation_response(format_type, reasoning, metrics)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+@app.post("/analyze_stream")
+async def analyze_stream(request: Request, full_metrics: bool = False):
+    """Recommend a format for raw pipe data streamed as the request body.
+
+    The body is scored chunk by chunk as it arrives and never held in memory
+    as a whole. Reading stops as soon as the case is known to be complex,
+    unless ``full_metrics`` is set; ``complexity_metrics.complete`` says
+    whether the whole body was scored.
+    """
+    received = 0
+
+    async def body():
+        nonlocal received
+        async for chunk in request.stream():
+            received += len(chunk)
+            yield chunk
+
+    try:
+        format_type, reasoning, metrics = await selector.get_format_recommendation_async(body(), full_metrics)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    return {**recommendation_response(format_type, reasoning, metrics), "bytes_read": received}
+
+def recommendation_response(format_type, reasoning: str, metrics) -> dict:
+    format_info = selector.get_format_info(format_type)
+    return {
+        "recommended_format": format_type.value,
+        "format_name": format_info.get("name", "Unknown"),
+        "reasoning": reasoning,
+        "complexity_metrics": metrics_dict(metrics),
+        "format_characteristics": format_info.get("characteristics", {}),
+        "best_for": format_info.get("best_for", []),
+        "data_requirements": format_info.get("data_requirements", [])
+    }
+
+@app.post("/analyze_batch")
+async def analyze_batch(request: Request):
+    """Recommend a format for every case in an NDJSON body and stream the results as NDJSON.
+
+    Each line is a case object, e.g. ``{"case_id": "c1", "pipe_data": "..."}``.
+    Results keep input order; malformed lines get an error record. The final
+    line is a ``summary`` record with counts per format and throughput. A
+    body that is not valid UTF-8 is rejected with 400 before any result is
+    sent.
+    """
+    # Spool the body first: the streaming response owns the receive channel once it starts.
+    # Past BATCH_SPOOL_BYTES the spool moves to disk, so the body is never held in memory whole.
+    spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES)
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        async for chunk in request.stream():
+            decoder.decode(chunk)
+            spool.write(chunk)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError as e:
+        spool.close()
+        raise HTTPException(status_code=400, detail=f"Request body is not valid UTF-8: {e.reason}")
+    spool.seek(0)
+    return StreamingResponse(stream_batch_results(iter_spooled_lines(spool)), media_type="application/x-ndjson")
+
+def iter_spooled_lines(spool):
+    """Yield the decoded lines of a spooled body, closing it when done."""
+    try:
+        for raw in spool:
+            yield raw.decode("utf-8")
+    finally:
+        spool.close()
+
+def stream_batch_results(lines):
+    started = time.perf_counter()
+    total = failed = 0
+    formats: dict[str, int] = {}
+    for line in lines:
+        if not line.strip():
+            continue
+        index = total
+        total += 1
+        try:
+            case = BatchCase.model_validate_json(line)
+        except ValidationError as e:
+            failed += 1
+            yield json.dumps({"index": index, "case_id": None, "success": False,
+                              "error": f"Invalid case: {e.errors()[0]['msg']}"}) + "\n"
+            continue
+        format_type, reasoning, metrics = selector.get_format_recommendation(case.pipe_data)
+        formats[format_type.value] = formats.get(format_type.value, 0) + 1
+        yield json.dumps({
+            "index": index,
+            "case_id": case.case_id if case.case_id is not None else str(index),
+            "success": True,
+            "recommended_format": format_type.value,
+            "reasoning": reasoning,
+            "complexity_metrics": metrics_dict(metrics),
+        }) + "\n"
+    elapsed = time.perf_counter() - started
+    yield json.dumps({"summary": {
+        "total": total,
+        "failed": failed,
+        "formats": formats,
+        "seconds": round(elapsed, 4),
+        "cases_per_sec": round(total / elapsed, 1) if elapsed > 0 else 0.0,
+    }}) + "\n"
+
+def metrics_dict(metrics) -> dict:
+    return {
+        "entities": metrics.entity_count,
+        "transactions": metrics.transaction_count,
+        "relationships": metrics.relationship_count,
+        "documents": metrics.document_count,
+        "notes": metrics.note_count,
+        "custom_fields": metrics.custom_field_count,
+        "geographic_coordinates": metrics.geographic_coordinates,
+        "intermediaries": metrics.intermediary_count,
+        "beneficial_owners": metrics.beneficial_owner_count,
+        "risk_factors": metrics.risk_factors_count,
+        "overall_score": metrics.total_complexity_score,
+        "complete": metrics.complete
+    }
+
 @app.post("/validate")
 async def validate_pipe_data(request: ValidateRequest):
     """Validate pipe-formatted data for common issues"""
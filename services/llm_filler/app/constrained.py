@@ -0,0 +1,391 @@
+"""Schema-constrained decoding for llm_filler.
+
+A format's compiled element tree (the one the deterministic renderer uses)
+is turned into a character-level automaton over the XML it allows:
+- element names, in the order and with the cardinality of each sequence
+- required attributes, and the namespace declaration on the root
+- values, matched against a regex for the element's XSD built-in type,
+  enumeration or pattern facet
+
+``SchemaLogitsProcessor`` runs the automaton next to ``model.generate``.
+At every step it masks out tokens whose text would leave the automaton,
+so the model can only write schema-legal XML. It ends once the root
+element is closed.
+
+When a row's token budget runs low, the processor switches to closing
+mode. It then stops opening optional elements, whitespace and value text
+beyond what is required, so a well-formed document still fits.
+
+Not enforced: numeric range facets (min/maxInclusive and similar), choice
+groups (the built-in formats use sequences only) and optional attributes,
+which are never generated. February 29th is never produced, so that a
+partial date can always be completed.
+"""
+from typing import NamedTuple
+import threading
+
+from elementpath.regex import translate_pattern
+import regex
+import torch
+from transformers import LogitsProcessor
+
+from .renderer import ElementSpec, get_renderer
+
+
+MAX_TEXT_CHARS = 1000
+MAX_WHITESPACE = 32
+WHITESPACE = " \t\r\n"
+CLOSING_SLACK = 8  # tokens kept in reserve beyond the minimal completion
+CANDIDATE_LIMIT = 64  # top-scoring tokens checked before scanning the vocabulary
+
+_DATE = (
+    r"\d{4}-(?:(?:0[13578]|1[02])-(?:0[1-9]|[12]\d|3[01])"
+    r"|(?:0[469]|11)-(?:0[1-9]|[12]\d|30)"
+    r"|02-(?:0[1-9]|1\d|2[0-8]))"
+)
+_DECIMAL = r"[+-]?(?:\d+(?:\.\d*)?|\.\d+)"
+_INTEGER = r"[+-]?\d+"
+BUILTIN_PATTERNS = {
+    "decimal": _DECIMAL,
+    "double": _DECIMAL,
+    "float": _DECIMAL,
+    "integer": _INTEGER,
+    "int": _INTEGER,
+    "long": _INTEGER,
+    "short": _INTEGER,
+    "nonNegativeInteger": r"\+?\d+",
+    "positiveInteger": r"\+?0*[1-9]\d*",
+    "boolean": r"true|false",
+    "date": _DATE,
+    "dateTime": _DATE + r"T(?:[01]\d|2[0-3]):[0-5]\d:[0-5]\d(?:Z|[+-](?:0\d|1[0-4]):[0-5]\d)?",
+}
+# Longest value closing mode can still produce once started (longer text is refused)
+BUILTIN_FINISH_CHARS = {"boolean": 5, "date": 10, "dateTime": 25}
+_TEXT = r"[^<&\x00-\x08\x0b\x0c\x0e-\x1f]*"
+
+
+def _xsd_regex(pattern: str) -> str:
+    translated = translate_pattern(pattern)
+    # translate_pattern anchors the expression; fullmatch does that for us
+    if translated.startswith("^(") and translated.endswith(r")$(?!\n\Z)"):
+        translated = translated[2:-len(r")$(?!\n\Z)")]
+    return translated
+
+
+class ValueConstraint:
+    """Which texts a simple value may be; ``accepts`` is true for any prefix of a legal value."""
+
+    def __init__(self, builtin: str | None, enumerations: list[str], patterns: list[str], forbidden: str = "<&"):
+        if enumerations:
+            body = "|".join(regex.escape(v) for v in enumerations)
+            self.finish_chars = max(len(v) for v in enumerations)
+        elif builtin in BUILTIN_PATTERNS:
+            body = BUILTIN_PATTERNS[builtin]
+            self.finish_chars = BUILTIN_FINISH_CHARS.get(builtin, 1)
+        elif patterns:
+            body = "|".join(f"(?:{_xsd_regex(p)})" for p in patterns)
+            self.finish_chars = 32
+        else:
+            body = _TEXT
+            self.finish_chars = 0
+        self.regex = regex.compile(f"(?:{body})")
+        self.forbidden = forbidden
+
+    def accepts(self, text: str) -> bool:
+        return (
+            len(text) <= MAX_TEXT_CHARS
+            and not any(c in self.forbidden for c in text[-1:])
+            and self.regex.fullmatch(text, partial=True) is not None
+        )
+
+    def complete(self, text: str) -> bool:
+        return self.regex.fullmatch(text) is not None
+
+
+class _Node:
+    """An element of the automaton's grammar."""
+
+    def __init__(self, spec: ElementSpec, namespace: str | None = None):
+        self.name = spec.name
+        self.min = spec.min_occurs
+        self.max = None if spec.repeated and spec.max_occurs is None else (spec.max_occurs or 1)
+        self.children = [_Node(child) for child in spec.children]
+        self.complex = bool(spec.children) or spec.builtin is None
+        self.value = None if self.complex else ValueConstraint(spec.builtin, spec.enumerations, spec.patterns)
+
+        # What follows the name in the start tag: literals and required attribute values
+        tail: list = []
+        if namespace:
+            tail.append(f' xmlns="{namespace}"')
+        for attr in spec.attributes:
+            if attr.required:
+                tail.append(f' {attr.name}="')
+                # The value step also consumes the closing quote
+                tail.append(ValueConstraint(attr.builtin, attr.enumerations, attr.patterns, forbidden='<&"'))
+        tail.append(">")
+        self.tail = tuple(_merge_literals(tail))
+        self.close = f"</{self.name}>"
+
+        content = self.value.finish_chars if self.value else sum(c.min * c.finish_chars for c in self.children)
+        tail_chars = sum(len(s) if isinstance(s, str) else s.finish_chars + 1 for s in self.tail)
+        self.finish_chars = 1 + len(self.name) + tail_chars + content + len(self.close)
+
+
+def _merge_literals(steps: list) -> list:
+    merged: list = []
+    for step in steps:
+        if isinstance(step, str) and merged and isinstance(merged[-1], str):
+            merged[-1] += step
+        else:
+            merged.append(step)
+    return merged
+
+
+# Automaton modes
+BETWEEN, LT, OPEN_NAME, TAIL, VALUE, FORCED, DONE = range(7)
+
+
+class State(NamedTuple):
+    mode: int
+    stack: tuple = ()  # (node, index of the current child, occurrences of it) per open complex element
+    node: _Node | None = None  # element whose start tag / value is being written
+    buf: str = ""  # name typed so far, text of the current step/value, or the forced remainder
+    steps: tuple = ()  # remaining start-tag steps (TAIL)
+    cands: tuple = ()  # (child index, node) still matching the typed name (OPEN_NAME)
+    ws: int = 0  # whitespace run length (BETWEEN); in FORCED, whether finishing pops an element
+
+
+class XmlAutomaton:
+    """Character-level acceptor for documents of one format."""
+
+    def __init__(self, root: ElementSpec, namespace: str | None):
+        self.root = _Node(root, namespace)
+        self.initial = State(BETWEEN)
+
+    def _candidates(self, stack: tuple, closing: bool) -> tuple[list[tuple[int, _Node]], bool]:
+        """Elements that may be opened next, and whether the current element may close."""
+        if not stack:
+            return [(0, self.root)], False
+        node, idx, count = stack[-1]
+        kids = node.children
+        cands = []
+        if idx >= 0 and (kids[idx].max is None or count < kids[idx].max):
+            if not closing or count < kids[idx].min:
+                cands.append((idx, kids[idx]))
+        if idx >= 0 and count < kids[idx].min:
+            return cands, False
+        j = idx + 1
+        while j < len(kids):
+            if not closing or kids[j].min > 0:
+                cands.append((j, kids[j]))
+            if kids[j].min > 0:
+                return cands, False
+            j += 1
+        return cands, True
+
+    def _enter(self, state: State, j: int, node: _Node) -> State:
+        stack = state.stack
+        if stack:
+            parent, idx, count = stack[-1]
+            stack = stack[:-1] + ((parent, j, count + 1 if j == idx else 1),)
+        return State(TAIL, stack, node, "", node.tail)
+
+    def _after_tail(self, state: State) -> State:
+        node = state.node
+        if node.complex:
+            return State(BETWEEN, state.stack + ((node, -1, 0),))
+        return State(VALUE, state.stack, node)
+
+    def step(self, state: State, c: str, closing: bool = False) -> State | None:
+        mode = state.mode
+        if mode == BETWEEN:
+            if c == "<":
+                return State(LT, state.stack)
+            if c in WHITESPACE and not closing and state.ws < MAX_WHITESPACE:
+                return state._replace(ws=state.ws + 1)
+            return None
+
+        if mode == LT:
+            cands, can_close = self._candidates(state.stack, closing)
+            if c == "/":
+                if can_close and state.stack:
+                    return State(FORCED, state.stack, buf=state.stack[-1][0].name + ">", ws=1)
+                return None
+            matched = tuple((j, n) for j, n in cands if n.name.startswith(c))
+            return State(OPEN_NAME, state.stack, buf=c, cands=matched) if matched else None
+
+        if mode == OPEN_NAME:
+            typed = state.buf + c
+            matched = tuple((j, n) for j, n in state.cands if n.name.startswith(typed))
+            if matched:
+                return state._replace(buf=typed, cands=matched)
+            for j, n in state.cands:
+                if n.name == state.buf:
+                    return self.step(self._enter(state, j, n), c, closing)
+            return None
+
+        if mode == TAIL:
+            step = state.steps[0]
+            if isinstance(step, str):
+                if c != step[len(state.buf)]:
+                    return None
+                buf = state.buf + c
+                if buf != step:
+                    return state._replace(buf=buf)
+            elif c == '"':
+                if not step.complete(state.buf):
+                    return None
+            elif (closing and step.complete(state.buf)) or not step.accepts(state.buf + c):
+                return None
+            else:
+                return state._replace(buf=state.buf + c)
+            steps = state.steps[1:]
+            if steps:
+                return state._replace(buf="", steps=steps)
+            return self._after_tail(state._replace(buf="", steps=()))
+
+        if mode == VALUE:
+            value = state.node.value
+            if c == "<":
+                if value.complete(state.buf):
+                    return State(FORCED, state.stack, buf=f"/{state.node.name}>", ws=0)
+                return None
+            if (closing and value.complete(state.buf)) or not value.accepts(state.buf + c):
+                return None
+            return state._replace(buf=state.buf + c)
+
+        if mode == FORCED:
+            if c != state.buf[0]:
+                return None
+            if len(state.buf) > 1:
+                return state._replace(buf=state.buf[1:])
+            stack = state.stack[:-1] if state.ws else state.stack
+            return State(BETWEEN, stack) if stack else State(DONE)
+
+        return None  # DONE: nothing may follow the root element
+
+    def feed(self, state: State | None, text: str, closing: bool = False) -> State | None:
+        for c in text:
+            if state is None:
+                return None
+            state = self.step(state, c, closing)
+        return state
+
+    def expected_char(self, state: State) -> str | None:
+        """The only character that can come next, when there is exactly one."""
+        if state.mode == FORCED:
+            return state.buf[0]
+        if state.mode == TAIL and isinstance(state.steps[0], str):
+            return state.steps[0][len(state.buf)]
+        return None
+
+    def chars_to_finish(self, state: State) -> int:
+        """Characters to reserve for finishing the document from ``state`` in closing mode."""
+        if state.mode == DONE:
+            return 0
+        if not state.stack and state.mode in (BETWEEN, LT, OPEN_NAME):
+            return self.root.finish_chars
+        total = 0
+        for node, idx, count in state.stack:
+            kids = node.children
+            if idx >= 0:
+                total += max(0, kids[idx].min - count) * kids[idx].finish_chars
+            total += sum(k.min * k.finish_chars for k in kids[idx + 1:]) + len(node.close)
+        if state.mode == TAIL:
+            total += state.node.finish_chars
+        elif state.mode == VALUE:
+            total += max(0, state.node.value.finish_chars - len(state.buf)) + len(state.node.close)
+        elif state.mode == FORCED:
+            total += len(state.buf)
+        return total
+
+
+def token_strings(tokenizer, vocab_size: int) -> list[str]:
+    """Text of every token id; empty for special tokens and partial characters, which are never allowed."""
+    special = set(getattr(tokenizer, "all_special_ids", []) or [])
+    strings = []
+    for i in range(vocab_size):
+        text = "" if i in special else tokenizer.decode([i])
+        strings.append("" if "�" in text else text)
+    return strings
+
+
+class SchemaLogitsProcessor(LogitsProcessor):
+    """Masks every token that would take a row outside its format's automaton."""
+
+    def __init__(self, automaton: XmlAutomaton, strings: list[str], eos_token_id: int, budgets: list[int],
+                 candidate_limit: int = CANDIDATE_LIMIT):
+        self.automaton = automaton
+        self.strings = strings
+        self.eos_token_id = eos_token_id
+        self.budgets = budgets
+        self.candidate_limit = candidate_limit
+        self.states: list[State | None] = [automaton.initial] * len(budgets)
+        self.closing = [False] * len(budgets)
+        self.start: int | None = None
+        self.by_first_char: dict[str, list[int]] = {}
+        for i, s in enumerate(strings):
+            if s:
+                self.by_first_char.setdefault(s[0], []).append(i)
+
+    def is_done(self, row: int) -> bool:
+        state = self.states[row]
+        return state is not None and state.mode == DONE
+
+    def _ok(self, state: State, token: int, closing: bool) -> bool:
+        text = self.strings[token] if token < len(self.strings) else ""
+        return bool(text) and self.automaton.feed(state, text, closing) is not None
+
+    def _allowed(self, state: State, scores: torch.Tensor, closing: bool) -> list[int]:
+        top = torch.topk(scores, min(self.candidate_limit, scores.shape[-1])).indices.tolist()
+        allowed = [t for t in top if self._ok(state, t, closing)]
+        if allowed:
+            return allowed
+        expected = self.automaton.expected_char(state)
+        if expected is not None:
+            return [t for t in self.by_first_char.get(expected, []) if self._ok(state, t, closing)]
+        for t in torch.argsort(scores, descending=True).tolist():
+            if self._ok(state, t, closing):
+                return [t]
+        return []
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self.start is None:
+            self.start = input_ids.shape[1]
+        else:
+            for row, token in enumerate(input_ids[:, -1].tolist()):
+                state = self.states[row]
+                if state is not None and state.mode != DONE:
+                    text = self.strings[token] if token < len(self.strings) else ""
+                    self.states[row] = self.automaton.feed(state, text, self.closing[row]) if text else None
+        generated = input_ids.shape[1] - self.start
+
+        masked = torch.full_like(scores, float("-inf"))
+        for row, state in enumerate(self.states):
+            if state is None or state.mode == DONE:
+                allowed = [self.eos_token_id]
+            else:
+                remaining = self.budgets[row] - generated
+                self.closing[row] = remaining <= self.automaton.chars_to_finish(state) + CLOSING_SLACK
+                allowed = self._allowed(state, scores[row], self.closing[row]) or [self.eos_token_id]
+            index = torch.tensor(allowed, device=scores.device)
+            values = scores[row, index]
+            if not torch.isfinite(values).any():
+                # An earlier processor (e.g. top-k) already removed every legal token
+                values = torch.zeros_like(values)
+            masked[row, index] = values
+        return masked
+
+
+_automata: dict[str, XmlAutomaton] = {}
+_automata_lock = threading.Lock()
+
+
+def get_automaton(format_name: str) -> XmlAutomaton:
+    """Automaton for a format, built on first use from its compiled renderer."""
+    renderer = get_renderer(format_name)
+    with _automata_lock:
+        automaton = _automata.get(format_name)
+        if automaton is None:
+            automaton = _automata[format_name] = XmlAutomaton(renderer.root, renderer.namespace)
+        return automaton
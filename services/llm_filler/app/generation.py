@@ -0,0 +1,323 @@
+"""Batched text generation on a dedicated worker thread.
+
+Handlers used to call ``model.generate`` directly, one prompt at a time and
+on the event loop. ``GenerationWorker`` owns the model on its own thread
+instead. Handlers queue prompts and await the result; the worker collects
+queued prompts into one batch until ``max_batch_size`` is reached or
+``max_wait_ms`` has passed since the first one arrived, runs a single padded
+``generate`` call, and hands each caller back its own completion.
+
+Only prompts with the same sampling settings and prefix share a batch. The
+rest wait for the next one. Prompts are left-padded (decoder-only models
+continue from the last position), and each request is cut to its own
+``max_new_tokens``.
+
+A request may name a format as ``constraint``; its batch is then decoded
+through that format's ``SchemaLogitsProcessor`` (see constrained.py), so the
+completion can only be XML that the format's XSD allows.
+
+A request may pass the fixed start of its prompt separately as ``prefix``.
+With a ``PrefixCache`` its key/value states are computed once and reused,
+so only the per-request suffix is prefilled. The batch is then laid out as
+prefix, padding, suffix, with the padding masked out.
+"""
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable
+import asyncio
+import queue
+import threading
+import time
+
+import torch
+from transformers import LogitsProcessorList
+
+from .constrained import SchemaLogitsProcessor, get_automaton, token_strings
+from .prefix_cache import PrefixCache, PrefixEntry, expand_past, prefix_key
+
+
+# A prefix is only split off if at least this many tokens of context remain for the suffix
+MIN_SUFFIX_TOKENS = 128
+
+
+@dataclass
+class GenerationResult:
+    text: str  # prompt + completion, as decoded
+    generated_text: str
+    prompt_tokens: int
+    new_tokens: int
+    batch_size: int
+    complete: bool | None = None  # constrained requests: whether the document was finished
+
+
+@dataclass
+class _Request:
+    prompt: str
+    max_new_tokens: int
+    sampling: tuple  # (do_sample, temperature)
+    loop: asyncio.AbstractEventLoop
+    future: asyncio.Future
+    prefix: str = ""
+    constraint: str | None = None  # format name for schema-constrained decoding
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def group(self) -> tuple:
+        # Only requests in the same group are batched together
+        return self.sampling, self.prefix, self.constraint
+
+
+class GenerationWorker:
+    """Owns the model on one thread and serves queued prompts in batches."""
+
+    def __init__(self, load: Callable[[], tuple], max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 prefix_cache: PrefixCache | None = None, model_name: str = ""):
+        self.load = load  # returns (tokenizer, model); called once, on the worker thread
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.prefix_cache = prefix_cache
+        self.model_name = model_name
+        self._queue: queue.Queue = queue.Queue()
+        self._pending: deque[_Request] = deque()  # taken off the queue but not batched yet
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+
+        self.batches = 0
+        self.requests = 0
+        self.failed = 0
+        self.batch_sizes: dict[int, int] = {}
+        self.generated_tokens = 0
+        self.prefill_tokens = 0
+        self.constrained_requests = 0
+        self.constrained_incomplete = 0
+        self._token_strings: list[str] | None = None
+        self.generate_seconds = 0.0
+        self.queue_wait_seconds = 0.0
+        self.last_tokens_per_sec = 0.0
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="generation-worker", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping = True
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    async def generate(self, prompt: str, max_new_tokens: int = 512, do_sample: bool = False,
+                       temperature: float = 1.0, prefix: str = "", constraint: str | None = None) -> GenerationResult:
+        """Generate a completion of ``prefix + prompt``, limited to format ``constraint`` if given."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        request = _Request(
+            prompt=prompt,
+            max_new_tokens=max(1, int(max_new_tokens)),
+            sampling=(do_sample, temperature if do_sample else None),
+            loop=loop,
+            future=loop.create_future(),
+            prefix=prefix,
+            constraint=constraint,
+        )
+        self._queue.put(request)
+        return await request.future
+
+    def _collect(self, first: _Request) -> list[_Request]:
+        """Batch ``first`` with compatible requests that arrive before its deadline."""
+        batch = [first]
+        skipped: list[_Request] = []
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if self._pending:
+                request = self._pending.popleft()
+            else:
+                remaining = deadline - time.perf_counter()
+                try:
+                    # Past the deadline, still take whatever is already queued
+                    request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:  # stop sentinel; leave it for _run
+                    self._queue.put(None)
+                    break
+            if request.group == first.group:
+                batch.append(request)
+            else:
+                skipped.append(request)
+        self._pending.extendleft(reversed(skipped))
+        return batch
+
+    def _run(self) -> None:
+        tokenizer = model = None
+        while True:
+            request = self._pending.popleft() if self._pending else self._queue.get()
+            if request is None or self._stopping:
+                break
+            batch = self._collect(request)
+            try:
+                if model is None:
+                    tokenizer, model = self.load()
+                self._generate(tokenizer, model, batch)
+            except Exception as e:
+                self.failed += len(batch)
+                for r in batch:
+                    self._resolve(r, exception=e)
+        # Fail whatever is still waiting
+        leftovers = list(self._pending) + ([request] if request is not None else [])
+        self._pending.clear()
+        while True:
+            try:
+                leftovers.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for r in leftovers:
+            if r is not None:
+                self._resolve(r, exception=RuntimeError("Generation worker stopped"))
+
+    def _generate(self, tokenizer, model, batch: list[_Request]) -> None:
+        started = time.perf_counter()
+        self.queue_wait_seconds += sum(started - r.enqueued_at for r in batch)
+
+        max_ctx = getattr(model.config, "max_position_embeddings", 1024)
+        prefix = self._prefix_entry(tokenizer, model, batch, max_ctx)
+        prefix_len = len(prefix.input_ids) if prefix is not None else 0
+        prompts = [r.prompt if prefix is not None else r.prefix + r.prompt for r in batch]
+        encoded = tokenizer(
+            prompts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=max_ctx - 1 - prefix_len,
+            # The prefix tokens already start the sequence (with BOS, for tokenizers that add one)
+            add_special_tokens=prefix is None,
+        )
+        input_ids, attention_mask = encoded["input_ids"], encoded["attention_mask"]
+        kwargs = {}
+        if prefix is not None:
+            n = len(batch)
+            input_ids = torch.cat([prefix.input_ids.to(input_ids.dtype).expand(n, -1), input_ids], dim=1)
+            attention_mask = torch.cat(
+                [torch.ones((n, prefix_len), dtype=attention_mask.dtype), attention_mask], dim=1)
+            if prefix.past is not None:
+                kwargs["past_key_values"] = expand_past(prefix.past, n)
+        padded_len = int(input_ids.shape[1])
+        available = max(1, max_ctx - padded_len - 1)
+        gen_tokens = int(min(max(r.max_new_tokens for r in batch), available))
+        self.prefill_tokens += int(attention_mask.sum()) - (prefix_len * len(batch) if "past_key_values" in kwargs else 0)
+
+        do_sample, temperature = batch[0].sampling
+        if do_sample:
+            kwargs.update(do_sample=True, temperature=temperature)
+        processor = None
+        if batch[0].constraint:
+            processor = SchemaLogitsProcessor(
+                get_automaton(batch[0].constraint),
+                self._vocabulary(tokenizer, model),
+                tokenizer.eos_token_id,
+                budgets=[min(r.max_new_tokens, gen_tokens) for r in batch],
+            )
+            kwargs["logits_processor"] = LogitsProcessorList([processor])
+        with torch.inference_mode():
+            outputs = model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=gen_tokens,
+                pad_token_id=tokenizer.pad_token_id,
+                **kwargs,
+            )
+
+        results = []
+        new_tokens_total = 0
+        for i, r in enumerate(batch):
+            prompt_ids = input_ids[i][attention_mask[i].bool()]
+            new_ids = outputs[i, padded_len:padded_len + r.max_new_tokens]
+            new_tokens = int((new_ids != tokenizer.pad_token_id).sum()) if tokenizer.pad_token_id is not None else len(new_ids)
+            new_tokens_total += new_tokens
+            results.append(GenerationResult(
+                text=tokenizer.decode(torch.cat([prompt_ids, new_ids]), skip_special_tokens=True),
+                generated_text=tokenizer.decode(new_ids, skip_special_tokens=True).strip(),
+                prompt_tokens=int(prompt_ids.shape[0]),
+                new_tokens=new_tokens,
+                batch_size=len(batch),
+                complete=processor.is_done(i) if processor is not None else None,
+            ))
+
+        elapsed = time.perf_counter() - started
+        self.batches += 1
+        self.requests += len(batch)
+        self.batch_sizes[len(batch)] = self.batch_sizes.get(len(batch), 0) + 1
+        self.generated_tokens += new_tokens_total
+        self.generate_seconds += elapsed
+        self.last_tokens_per_sec = new_tokens_total / elapsed if elapsed > 0 else 0.0
+        if processor is not None:
+            self.constrained_requests += len(batch)
+            self.constrained_incomplete += sum(not r.complete for r in results)
+        for r, result in zip(batch, results):
+            self._resolve(r, result=result)
+
+    def _vocabulary(self, tokenizer, model) -> list[str]:
+        if self._token_strings is None:
+            vocab_size = max(len(tokenizer), model.get_output_embeddings().weight.shape[0])
+            self._token_strings = token_strings(tokenizer, vocab_size)
+        return self._token_strings
+
+    def _prefix_entry(self, tokenizer, model, batch: list[_Request], max_ctx: int) -> PrefixEntry | None:
+        """Tokens (and, when cached, key/value states) of the batch's shared prefix."""
+        prefix = batch[0].prefix
+        if not prefix:
+            return None
+        key = prefix_key(self.model_name, prefix)
+        entry = self.prefix_cache.get(key) if self.prefix_cache is not None else None
+        if entry is not None:
+            self.prefix_cache.prefill_tokens_saved += len(entry.input_ids) * len(batch)
+            return entry
+        input_ids = tokenizer([prefix], return_tensors="pt")["input_ids"][0]
+        if len(input_ids) > max_ctx - 1 - MIN_SUFFIX_TOKENS:
+            return None  # leave room for the data; tokenized together with the suffix instead
+        if self.prefix_cache is None:
+            return PrefixEntry(input_ids, None, 0)
+        entry = self.prefix_cache.compute(model, input_ids)
+        self.prefill_tokens += len(input_ids)
+        self.prefix_cache.put(key, entry)
+        return entry
+
+    @staticmethod
+    def _resolve(request: _Request, result: GenerationResult | None = None,
+                 exception: Exception | None = None) -> None:
+        def settle():
+            if request.future.done():
+                return  # the caller went away
+            if exception is not None:
+                request.future.set_exception(exception)
+            else:
+                request.future.set_result(result)
+
+        try:
+            request.loop.call_soon_threadsafe(settle)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def stats(self) -> dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize() + len(self._pending),
+            "batches": self.batches,
+            "requests": self.requests,
+            "failed": self.failed,
+            "mean_batch_size": round(self.requests / self.batches, 3) if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self.batch_sizes.items())),
+            "generated_tokens": self.generated_tokens,
+            "tokens_per_sec": round(self.generated_tokens / self.generate_seconds, 2) if self.generate_seconds else 0.0,
+            "last_batch_tokens_per_sec": round(self.last_tokens_per_sec, 2),
+            "mean_queue_wait_ms": round(self.queue_wait_seconds / self.requests * 1000, 3) if self.requests else 0.0,
+            "prefill_tokens": self.prefill_tokens,
+            "constrained_requests": self.constrained_requests,
+            "constrained_incomplete": self.constrained_incomplete,
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache is not None else None,
+        }
@@ -1,10 +1,17 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 import os
-import httpx
 from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
 import json
+from packages.shared.http_clients import ServiceClients, ServiceConfig
+from packages.shared.model_backends import INFERENCE_BACKEND, timed_load
+from packages.shared.readiness import Readiness
+from .generation import GenerationWorker
+from .prefix_cache import PrefixCache
+from .renderer import get_renderer
 
 
 app = FastAPI(title="LLM Filler")
@@ -12,24 +19,85 @@ app = FastAPI(title="LLM Filler")
 MODEL_NAME = os.getenv("MODEL_NAME", "sshleifer/tiny-gpt2")
 RAG_SERVICE_URL = os.getenv("RAG_SERVICE_URL", "http://127.0.0.1:8083")
 FORMAT_SELECTOR_URL = os.getenv("FORMAT_SELECTOR_URL", "http://127.0.0.1:8086")
+GEN_MAX_BATCH_SIZE = int(os.getenv("GEN_MAX_BATCH_SIZE", "8"))
+GEN_MAX_WAIT_MS = float(os.getenv("GEN_MAX_WAIT_MS", "10"))
+PREFIX_CACHE_ENABLED = os.getenv("PREFIX_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+PREFIX_CACHE_SIZE = int(os.getenv("PREFIX_CACHE_SIZE", "16"))
+PREFIX_CACHE_MB = int(os.getenv("PREFIX_CACHE_MB", "512"))
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "true").lower() in ("1", "true", "yes")
 
 _tokenizer = None
 _model = None
+_model_info: dict = {}
+
+readiness = Readiness("llm_filler", import_seconds=time.perf_counter() - _import_started)
+
+# Pooled, app-lifetime clients for agent-to-agent calls
+clients = ServiceClients({
+    "rag": ServiceConfig(RAG_SERVICE_URL, timeout=30),
+    "format_selector": ServiceConfig(FORMAT_SELECTOR_URL, timeout=30),
+})
 
 
 def load_model():
     global _tokenizer, _model
     if _model is None:
-        _tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        with readiness.phase("tokenizer_load"):
+            _tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
         # Ensure pad token is set to avoid generation warnings/errors
         if _tokenizer.pad_token is None and _tokenizer.eos_token is not None:
             _tokenizer.pad_token = _tokenizer.eos_token
-        _model = AutoModelForCausalLM.from_pretrained(MODEL_NAME, device_map="auto")
+        # Batched prompts are padded on the left so generation continues from real tokens
+        _tokenizer.padding_side = "left"
+        _model, info = timed_load(AutoModelForCausalLM, MODEL_NAME, INFERENCE_BACKEND, device_map="auto")
+        _model_info.update(info)
+        readiness.record("weight_load", info["load_seconds"])
+        print(f"Loaded {MODEL_NAME} ({info['backend']} backend, {info['model_bytes'] / 2**20:.1f} MB, "
+              f"{info['threads']} threads) in {info['load_seconds']:.1f}s")
+    return _tokenizer, _model
+
+
+# The model lives on this worker's thread; handlers queue prompts and await results
+generator = GenerationWorker(
+    load_model,
+    max_batch_size=GEN_MAX_BATCH_SIZE,
+    max_wait_ms=GEN_MAX_WAIT_MS,
+    # ONNX Runtime models keep their own past-key-value layout, so prefixes are not cached for them
+    prefix_cache=(PrefixCache(PREFIX_CACHE_SIZE, PREFIX_CACHE_MB * 1024 * 1024)
+                  if PREFIX_CACHE_ENABLED and INFERENCE_BACKEND != "onnx" else None),
+    model_name=MODEL_NAME,
+)
+
+
+async def warm_up() -> None:
+    """Load the model on the generation worker and run a one-token generation."""
+    started = time.perf_counter()
+    await generator.generate("XML:", max_new_tokens=1)
+    loading = readiness.timings.get("tokenizer_load", 0.0) + readiness.timings.get("weight_load", 0.0)
+    readiness.record("first_forward", time.perf_counter() - started - loading)
+
+
+@app.on_event("startup")
+async def startup():
+    await clients.start()
+    generator.start()
+    if PRELOAD_MODELS:
+        readiness.start_warm_up(warm_up)
+    else:
+        readiness.mark_ready()  # lazy loading: the first generation pays the load
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    readiness.stop()
+    await clients.close()
+    generator.stop()
 
 
 class FillRequest(BaseModel):
     prompt: str
     max_new_tokens: int = 512
+    format_name: str | None = None  # constrain the output to this format's XSD
     cache_key: str | None = None
     use_rag: bool = True
     rag_query: str | None = None
@@ -40,25 +108,29 @@ class FillWithPipeDataRequest(BaseModel):
     use_rag: bool = True
     rag_query: str | None = None
 
+class RenderRequest(BaseModel):
+    format_name: str
+    records: list[dict]
+    pretty_print: bool = True
+
 
 async def get_rag_context(cache_key: str, query: str, k: int = 3) -> str:
     """Get relevant context from RAG service."""
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(f"{RAG_SERVICE_URL}/query", json={
-                "cache_key": cache_key,
-                "query": query,
-                "k": k
-            })
-            if r.status_code == 200:
-                result = r.json()
-                context_parts = []
-                for item in result.get("results", []):
-                    context_parts.append(f"- {item.get('text', '')}")
-                return "\n".join(context_parts)
-            else:
-                print(f"RAG query failed: {r.status_code}")
-                return ""
+        r = await clients.get("rag").post("/query", json={
+            "cache_key": cache_key,
+            "query": query,
+            "k": k
+        })
+        if r.status_code == 200:
+            result = r.json()
+            context_parts = []
+            for item in result.get("results", []):
+                context_parts.append(f"- {item.get('text', '')}")
+            return "\n".join(context_parts)
+        else:
+            print(f"RAG query failed: {r.status_code}")
+            return ""
     except Exception as e:
         print(f"RAG service error: {e}")
         return ""
@@ -66,113 +138,120 @@ async def get_rag_context(cache_key: str, query: str, k: int = 3) -> str:
 async def get_format_recommendation(pipe_data: str) -> dict:
     """Get XSD format recommendation from format selector service."""
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(f"{FORMAT_SELECTOR_URL}/analyze", json={
-                "pipe_data": pipe_data
-            })
-            if r.status_code == 200:
-                return r.json()
-            else:
-                print(f"Format selection failed: {r.status_code}")
-                return {"recommended_format": "format2_simple", "reasoning": "Fallback to simple format"}
+        r = await clients.get("format_selector").post("/analyze", json={
+            "pipe_data": pipe_data
+        })
+        if r.status_code == 200:
+            return r.json()
+        else:
+            print(f"Format selection failed: {r.status_code}")
+            return {"recommended_format": "format2_simple", "reasoning": "Fallback to simple format"}
     except Exception as e:
         print(f"Format selector service error: {e}")
         return {"recommended_format": "format2_simple", "reasoning": "Fallback to simple format"}
 
 
+def check_format(format_name: str) -> None:
+    try:
+        get_renderer(format_name)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.post("/fill")
 async def fill(req: FillRequest):
     """Generate XML using LLM with optional RAG context."""
-    load_model()
-    
     # Build enhanced prompt with RAG context if requested
-    enhanced_prompt = req.prompt
-    
+    prefix, enhanced_prompt = "", req.prompt
+
     if req.use_rag and req.cache_key:
         rag_query = req.rag_query or req.prompt
         context = await get_rag_context(req.cache_key, rag_query)
         
         if context:
-            enhanced_prompt = f"""Schema Context:
+            # The schema context is a fixed prefix per (cache_key, context); see prefix_cache
+            prefix = f"""Schema Context:
 {context}
 
 User Request:
-{req.prompt}
+"""
+            enhanced_prompt = f"""{req.prompt}
 
 Generate XML based on the schema context and user request:"""
-    
-    # Generate with the model
-    max_ctx = getattr(_model.config, "max_position_embeddings", 1024)
-    input_ids = _tokenizer.encode(
-        enhanced_prompt,
-        return_tensors="pt",
-        truncation=True,
-        max_length=max_ctx - 1,
-    )
-    available = max(1, max_ctx - int(input_ids.shape[1]) - 1)
-    gen_tokens = int(max(1, min(req.max_new_tokens, available)))
-    attention_mask = torch.ones_like(input_ids)
-    outputs = _model.generate(input_ids, attention_mask=attention_mask, max_new_tokens=gen_tokens)
-    text = _tokenizer.decode(outputs[0], skip_special_tokens=True)
-    
-    # Extract only the generated part (after the prompt)
-    generated_text = text[len(enhanced_prompt):].strip()
-    
+
+    if req.format_name:
+        check_format(req.format_name)
+
+    # Generate with the model (batched with concurrent requests)
+    result = await generator.generate(enhanced_prompt, req.max_new_tokens, prefix=prefix,
+                                      constraint=req.format_name)
+
     return {
-        "text": generated_text,
-        "full_text": text,
-        "prompt_used": enhanced_prompt,
-        "rag_context_used": req.use_rag and req.cache_key is not None
+        "text": result.generated_text,
+        "full_text": result.text,
+        "prompt_used": prefix + enhanced_prompt,
+        "rag_context_used": req.use_rag and req.cache_key is not None,
+        "complete": result.complete,
     }
 
 
 @app.post("/fill_with_data")
 async def fill_with_data(req: dict):
     """Generate XML from structured data using RAG context."""
-    load_model()
-    
     # Extract data from request
     data = req.get("data", {})
     cache_key = req.get("cache_key")
     template_type = req.get("template_type", "generic")
-    
-    # Build structured prompt with clear XML formatting instructions
-    prompt = f"""Generate a valid XML document for {template_type} with the following data:
-{json.dumps(data, indent=2)}
+    format_name = req.get("format_name")
+    if format_name:
+        check_format(format_name)
+
+    # Build structured prompt with clear XML formatting instructions. Everything
+    # before the data is the same for every record of a template, so it is passed
+    # as a prefix whose KV states the generation worker caches.
+    prefix = f"""Generate a valid XML document for {template_type} with the following data.
 
 IMPORTANT: Start your response with < and end with >. Generate valid XML only.
 
+Data to include:
+"""
+    prompt = f"""{json.dumps(data, indent=2)}
+
 XML:"""
     
     # Get RAG context if available
     if cache_key:
         context = await get_rag_context(cache_key, f"{template_type} XML structure")
         if context:
-            prompt = f"""Schema Context:
+            prefix = f"""Schema Context:
 {context}
 
-Data to include:
-{json.dumps(data, indent=2)}
-
 IMPORTANT: Start your response with < and end with >. Generate valid XML only.
 
-XML:"""
-    
-    # Generate
-    max_ctx = getattr(_model.config, "max_position_embeddings", 1024)
-    input_ids = _tokenizer.encode(
-        prompt,
-        return_tensors="pt",
-        truncation=True,
-        max_length=max_ctx - 1,
-    )
-    available = max(1, max_ctx - int(input_ids.shape[1]) - 1)
-    gen_tokens = int(max(1, min(512, available)))
-    attention_mask = torch.ones_like(input_ids)
-    outputs = _model.generate(input_ids, attention_mask=attention_mask, max_new_tokens=gen_tokens, do_sample=True, temperature=0.7)
-    text = _tokenizer.decode(outputs[0], skip_special_tokens=True)
-    generated_text = text[len(prompt):].strip()
+Data to include:
+"""
     
+    # Generate (batched with concurrent requests)
+    result = await generator.generate(prompt, req.get("max_new_tokens", 512), do_sample=True, temperature=0.7,
+                                      prefix=prefix, constraint=format_name)
+    if format_name:
+        # Schema-constrained output is valid XML for the format once complete; if the
+        # token budget ran out first, render the data deterministically instead
+        if result.complete:
+            xml, source = result.generated_text, "model"
+        else:
+            xml, source = get_renderer(format_name).render(data), "renderer"
+        return {
+            "xml": xml,
+            "data_used": data,
+            "template_type": template_type,
+            "format_name": format_name,
+            "source": source,
+            "tokens_generated": result.new_tokens,
+        }
+
+    generated_text = result.generated_text
+
     # Clean up the generated text to ensure it's valid XML
     generated_text = generated_text.strip()
     
@@ -201,110 +280,41 @@ XML:"""
 @app.post("/fill_with_pipe_data")
 async def fill_with_pipe_data(req: FillWithPipeDataRequest):
     """Generate XML from pipe-formatted data using format selection."""
-    load_model()
-    
     # Get format recommendation
     format_info = await get_format_recommendation(req.pipe_data)
     recommended_format = format_info.get("recommended_format", "format2_simple")
-    
+
     # Parse pipe data into structured format
     data = parse_pipe_data(req.pipe_data)
-    # Immediate deterministic response to avoid heavy model inference in constrained envs
-    tag = recommended_format.replace('format', 'report')
-    quick_xml = (
-        f"<" + tag + ">\n"
-        f"    <entity_name>{data.get('EntityName', 'Unknown')}</entity_name>\n"
-        f"    <entity_type>{data.get('EntityType', 'Unknown')}</entity_type>\n"
-        f"    <transaction_id>{data.get('TransactionID', 'Unknown')}</transaction_id>\n"
-        f"    <amount>{data.get('TransactionAmount', 0)}</amount>\n"
-        f"    <status>{data.get('TransactionStatus', 'Unknown')}</status>\n"
-        f"</" + tag + ">"
-    )
+
+    # Deterministic rendering from the compiled format: no model call, valid against the XSD
+    try:
+        xml = get_renderer(recommended_format).render(data)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     return {
-        "xml": quick_xml.strip(),
+        "xml": xml,
         "recommended_format": recommended_format,
         "format_reasoning": format_info.get("reasoning", ""),
         "complexity_metrics": format_info.get("complexity_metrics", {}),
         "data_used": data
     }
-    
-    # Build prompt based on selected format
-    if recommended_format == "format1_complex":
-        prompt = f"""Generate a valid XML document using the complex comprehensive format for the following data:
-{req.pipe_data}
-
-IMPORTANT: 
-- Use the complex format with nested structures
-- Include all relevant fields from the pipe data
-- Start your response with < and end with >
-- Generate valid XML only
-
-XML:"""
-    else:
-        prompt = f"""Generate a valid XML document using the simple flat format for the following data:
-{req.pipe_data}
-
-IMPORTANT: 
-- Use the simple flat format structure
-- Include all relevant fields from the pipe data
-- Start your response with < and end with >
-- Generate valid XML only
-
-XML:"""
-    
-    # Get RAG context if available
-    if req.use_rag:
-        # Use the recommended format as cache key for RAG
-        context = await get_rag_context(recommended_format, f"{recommended_format} XML structure")
-        if context:
-            prompt = f"""Schema Context:
-{context}
 
-Data to include:
-{req.pipe_data}
-
-IMPORTANT: Start your response with < and end with >. Generate valid XML only.
 
-XML:"""
-    
-    # Deterministic XML (avoid model runtime errors in constrained envs)
-    tag = recommended_format.replace('format', 'report')
-    generated_text = (
-        f"<" + tag + ">\n"
-        f"    <entity_name>{data.get('EntityName', 'Unknown')}</entity_name>\n"
-        f"    <entity_type>{data.get('EntityType', 'Unknown')}</entity_type>\n"
-        f"    <transaction_id>{data.get('TransactionID', 'Unknown')}</transaction_id>\n"
-        f"    <amount>{data.get('TransactionAmount', 0)}</amount>\n"
-        f"    <status>{data.get('TransactionStatus', 'Unknown')}</status>\n"
-        f"    <date>{data.get('TransactionDate', 'Unknown')}</date>\n"
-        f"</" + tag + ">"
-    )
-    
-    # Clean up the generated text
-    generated_text = generated_text.strip()
-    if not generated_text.startswith('<'):
-        first_lt = generated_text.find('<')
-        if first_lt != -1:
-            generated_text = generated_text[first_lt:]
-        else:
-            # Fallback: create a simple XML structure
-            generated_text = f"""<{recommended_format.replace('format', 'report')}>
-    <entity_name>{data.get('EntityName', 'Unknown')}</entity_name>
-    <entity_type>{data.get('EntityType', 'Unknown')}</entity_type>
-    <transaction_id>{data.get('TransactionID', 'Unknown')}</transaction_id>
-    <amount>{data.get('TransactionAmount', 0)}</amount>
-    <status>{data.get('TransactionStatus', 'Unknown')}</status>
-    <date>{data.get('TransactionDate', 'Unknown')}</date>
-</{recommended_format.replace('format', 'report')}>"""
-    
+@app.post("/render")
+def render(req: RenderRequest):
+    """Render records (field -> value) with a format's compiled template."""
+    try:
+        renderer = get_renderer(req.format_name)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
-        "xml": generated_text,
-        "recommended_format": recommended_format,
-        "format_reasoning": format_info.get("reasoning", ""),
-        "complexity_metrics": format_info.get("complexity_metrics", {}),
-        "data_used": data
+        "format_name": req.format_name,
+        "xml": [renderer.render(record, pretty_print=req.pretty_print) for record in req.records],
     }
 
+
 def parse_pipe_data(pipe_data: str) -> dict:
     """Parse pipe-formatted data into a dictionary."""
     data = {}
@@ -336,6 +346,26 @@ def root():
 
 @app.get("/health")
 def health():
-    return {"ok": True}
+    return {"ok": True, "ready": readiness.ready}
+
+
+@app.get("/ready")
+def ready():
+    """200 once the model is loaded and has run a warm-up generation, 503 before."""
+    if not readiness.ready:
+        raise HTTPException(status_code=503, detail=readiness.status())
+    return readiness.status()
+
+
+@app.get("/metrics/generation")
+def generation_metrics():
+    """Batch sizes, queue depth and tokens/sec of the generation worker, and the loaded model backend."""
+    return {**generator.stats(), "model": _model_info}
+
+
+@app.get("/metrics/http_pool")
+def http_pool_metrics():
+    """Connection pool usage and request counters per downstream service."""
+    return {"services": clients.stats()}
 
 
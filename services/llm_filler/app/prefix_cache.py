@@ -0,0 +1,110 @@
+"""KV-cache reuse for the fixed part of llm_filler prompts.
+
+Templated prompts share a long preamble (the ``Schema Context:`` block and
+its instructions); only the data after it changes. ``PrefixCache`` keeps the
+attention key/value states of such preambles, so a request only has to run
+its own suffix through the model before generating. Entries are keyed by
+(model, hash of the prefix text), so a different format or RAG context gets
+a separate entry. They are evicted least recently used first, to stay
+within ``max_entries`` and ``max_bytes``.
+
+Entries are only touched from the generation worker's thread.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+import copy
+import hashlib
+
+import torch
+
+
+def prefix_key(model_name: str, prefix: str) -> tuple[str, str]:
+    return model_name, hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+
+def _cache_tensors(past) -> list[torch.Tensor]:
+    if isinstance(past, (tuple, list)):  # legacy ((key, value), ...) format
+        return [t for layer in past for t in layer if isinstance(t, torch.Tensor)]
+    if hasattr(past, "layers"):
+        return [t for layer in past.layers for t in (layer.keys, layer.values) if isinstance(t, torch.Tensor)]
+    return list(getattr(past, "key_cache", [])) + list(getattr(past, "value_cache", []))
+
+
+def expand_past(past, batch_size: int):
+    """A fresh copy of ``past`` for a batch of ``batch_size``; generate extends it in place."""
+    if isinstance(past, (tuple, list)):
+        return tuple(tuple(t.repeat_interleave(batch_size, dim=0) for t in layer) for layer in past)
+    past = copy.deepcopy(past)
+    if batch_size > 1:
+        past.batch_repeat_interleave(batch_size)
+    return past
+
+
+@dataclass
+class PrefixEntry:
+    input_ids: torch.Tensor  # 1-D prefix token ids
+    past: object  # past_key_values for the prefix, batch size 1
+    nbytes: int
+    hits: int = 0
+
+
+class PrefixCache:
+    """LRU of prefix KV states, bounded by entry count and total tensor bytes."""
+
+    def __init__(self, max_entries: int = 16, max_bytes: int = 512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple[str, str], PrefixEntry]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefill_tokens_saved = 0
+
+    def get(self, key: tuple[str, str]) -> PrefixEntry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        entry.hits += 1
+        self.hits += 1
+        return entry
+
+    def compute(self, model, input_ids: torch.Tensor) -> PrefixEntry:
+        """Run the prefix through ``model`` once and keep its key/value states."""
+        with torch.inference_mode():
+            out = model(input_ids.unsqueeze(0), use_cache=True)
+        past = out.past_key_values
+        return PrefixEntry(input_ids, past, sum(t.numel() * t.element_size() for t in _cache_tensors(past)))
+
+    def put(self, key: tuple[str, str], entry: PrefixEntry) -> None:
+        if entry.nbytes > self.max_bytes:
+            return  # would evict everything else and still not fit
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old.nbytes
+        self._entries[key] = entry
+        self.bytes += entry.nbytes
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "prefill_tokens_saved": self.prefill_tokens_saved,
+        }
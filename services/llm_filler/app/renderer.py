@@ -0,0 +1,358 @@
+"""Deterministic XML renderer for the regulator formats.
+
+Each format in ``format_config.json`` is compiled once from its XSD into a
+tree of element specs (via the shared schema model) plus a field -> element
+path mapping. Rendering a record then needs no model call. Values are
+coerced to the element's XSD type or enumeration. Required elements and
+attributes without data get a type-appropriate placeholder, and optional
+ones are emitted only when they have data, so the output is valid against
+the XSD by construction (for sequence-only schemas such as the built-in
+formats).
+
+Field names map to paths through the format's ``field_mapping`` in
+``format_config.json``, falling back to elements whose local name is
+unique in the schema. A trailing number selects an occurrence of the
+innermost repeating element on the path (``TransactionID2`` is the second
+``Transaction``). Pipe metadata such as ``Currency:USD`` is addressable as
+``TransactionAmount:Currency``. Occurrences beyond the element's
+``maxOccurs``, or beyond ``RENDER_MAX_OCCURRENCES`` for unbounded ones, are
+ignored.
+"""
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+import json
+import os
+import re
+import threading
+
+from lxml import etree
+import xmlschema
+
+from packages.shared.schema_model import build_schema_model, expand_schema_model
+
+
+REGULATOR_XSD_DIR = os.getenv(
+    "REGULATOR_XSD_DIR",
+    str(Path(__file__).resolve().parents[3] / "sar_agent" / "regulator_xsds"),
+)
+
+# Placeholders for required values that the input does not provide
+DEFAULTS = {
+    "string": "Unknown",
+    "decimal": "0",
+    "integer": "0",
+    "date": "1900-01-01",
+    "dateTime": "1900-01-01T00:00:00Z",
+    "boolean": "false",
+}
+
+_INVALID_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_DECIMAL = re.compile(r"[+-]?(\d+(\.\d*)?|\.\d+)")
+_DATETIME = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:\d{2})?")
+_OCCURRENCE = re.compile(r"(.*?[^\d])(\d+)")
+MAX_RESOLVED_FIELDS = 4096
+# Upper bound on occurrences of an unbounded element, so one field name such as
+# TransactionID1000000 cannot make a record render a million elements
+RENDER_MAX_OCCURRENCES = int(os.getenv("RENDER_MAX_OCCURRENCES", "100"))
+
+
+def _key(value: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", value.lower())
+
+
+def coerce_enum(value: str, enumerations: list[str]) -> str:
+    """Exact, then normalized, then contained match; else "Other" or the first value."""
+    if value in enumerations:
+        return value
+    wanted = _key(value)
+    for option in enumerations:
+        if _key(option) == wanted:
+            return option
+    for option in enumerations:
+        if _key(option) and _key(option) in wanted:
+            return option
+    return "Other" if "Other" in enumerations else enumerations[0]
+
+
+def coerce_value(value, builtin: str | None) -> str | None:
+    """Convert ``value`` to the lexical form of an XSD built-in type; None if it cannot be."""
+    text = _INVALID_XML_CHARS.sub("", str(value)).strip()
+    if builtin in ("decimal", "double", "float"):
+        text = text.replace(",", "").lstrip("$").rstrip("%")
+        return text if _DECIMAL.fullmatch(text) else None
+    if builtin in ("integer", "int", "long", "short", "nonNegativeInteger", "positiveInteger"):
+        text = text.replace(",", "")
+        if _DECIMAL.fullmatch(text):
+            return str(int(float(text)))
+        return None
+    if builtin == "date":
+        try:
+            return date.fromisoformat(text[:10]).isoformat()
+        except ValueError:
+            try:
+                return datetime.strptime(text, "%m/%d/%Y").date().isoformat()
+            except ValueError:
+                return None
+    if builtin == "dateTime":
+        if _DATETIME.fullmatch(text):
+            return text
+        day = coerce_value(text, "date")
+        return f"{day}T00:00:00Z" if day else None
+    if builtin == "boolean":
+        lowered = text.lower()
+        if lowered in ("true", "1", "yes", "y"):
+            return "true"
+        if lowered in ("false", "0", "no", "n"):
+            return "false"
+        return None
+    return text
+
+
+@dataclass
+class AttributeSpec:
+    name: str
+    path: str
+    builtin: str | None
+    required: bool
+    enumerations: list[str]
+    patterns: list[str] = field(default_factory=list)
+
+
+@dataclass
+class ElementSpec:
+    name: str
+    path: str
+    tag: str
+    builtin: str | None
+    enumerations: list[str]
+    min_occurs: int
+    repeated: bool
+    depth: int  # number of repeating elements on the path up to and including this one
+    children: list["ElementSpec"] = field(default_factory=list)
+    attributes: list[AttributeSpec] = field(default_factory=list)
+    patterns: list[str] = field(default_factory=list)
+    max_occurs: int | None = 1  # None means unbounded
+
+
+def _convert(raw, builtin: str | None, enumerations: list[str]) -> str | None:
+    if raw is None:
+        return None
+    text = coerce_value(raw, builtin)
+    if text is not None and enumerations:
+        text = coerce_enum(text, enumerations)
+    return text
+
+
+def _placeholder(builtin: str | None, enumerations: list[str]) -> str:
+    if enumerations:
+        return coerce_enum("", enumerations)
+    return DEFAULTS.get(builtin or "string", DEFAULTS["string"])
+
+
+class FormatRenderer:
+    """Renders records to XML for one compiled format."""
+
+    def __init__(self, format_name: str, model: dict, namespace: str | None, field_mapping: dict):
+        self.format_name = format_name
+        self.namespace = namespace
+        self.root = self._compile(model)
+        self._paths: dict[str, ElementSpec | AttributeSpec] = {}
+        self._index(self.root)
+        self._limits = {path: self._occurrence_limit(path) for path in self._paths}
+        self.field_paths = self._field_paths(field_mapping)
+        self._resolved: dict[str, tuple[list[str], int]] = {}
+
+    @classmethod
+    def from_config(cls, format_name: str, xsd_dir: str = REGULATOR_XSD_DIR) -> "FormatRenderer":
+        with open(os.path.join(xsd_dir, "format_config.json"), "r", encoding="utf-8") as f:
+            config = json.load(f)["xsd_formats"]
+        if format_name not in config:
+            raise KeyError(f"Unknown format: {format_name}")
+        info = config[format_name]
+        model = build_schema_model(xmlschema.XMLSchema(os.path.join(xsd_dir, info["file"])))
+        return cls(format_name, model, info.get("namespace"), info.get("field_mapping", {}))
+
+    def _compile(self, model: dict) -> ElementSpec:
+        specs: dict[str, ElementSpec] = {}
+        root = None
+        for chunk in expand_schema_model(model):
+            parent_path, _, name = chunk["path"].rpartition("/")
+            parent = specs.get(parent_path)
+            if chunk["kind"] == "attribute":
+                parent.attributes.append(AttributeSpec(
+                    name=chunk["name"], path=chunk["path"], builtin=chunk["builtin"],
+                    required=chunk["min_occurs"] > 0, enumerations=chunk["enumerations"],
+                    patterns=chunk["patterns"],
+                ))
+                continue
+            if chunk.get("recursive") and chunk["min_occurs"] > 0:
+                raise ValueError(f"Cannot render required recursive element {chunk['path']}")
+            repeated = chunk["max_occurs"] == "unbounded" or chunk["max_occurs"] > 1
+            spec = ElementSpec(
+                name=chunk["name"],
+                path=chunk["path"],
+                tag=f"{{{self.namespace}}}{chunk['name']}" if self.namespace else chunk["name"],
+                builtin=None if chunk["complex"] else chunk["builtin"],
+                enumerations=chunk["enumerations"],
+                min_occurs=chunk["min_occurs"],
+                repeated=repeated,
+                depth=(parent.depth if parent else 0) + int(repeated),
+                patterns=chunk["patterns"],
+                max_occurs=None if chunk["max_occurs"] == "unbounded" else chunk["max_occurs"],
+            )
+            specs[spec.path] = spec
+            if parent is None:
+                root = root or spec
+            elif not chunk.get("recursive"):
+                parent.children.append(spec)
+        if root is None:
+            raise ValueError(f"{self.format_name} has no root element")
+        return root
+
+    def _index(self, spec: ElementSpec) -> None:
+        self._paths[spec.path] = spec
+        for attr in spec.attributes:
+            self._paths[attr.path] = attr
+        for child in spec.children:
+            self._index(child)
+
+    def _field_paths(self, field_mapping: dict) -> dict[str, list[str]]:
+        by_name: dict[str, list[str]] = {}
+        for path, spec in self._paths.items():
+            if isinstance(spec, ElementSpec) and not spec.children:
+                by_name.setdefault(spec.name, []).append(path)
+        mapping = {name: paths for name, paths in by_name.items() if len(paths) == 1}
+        for name, paths in field_mapping.items():
+            paths = [paths] if isinstance(paths, str) else list(paths)
+            unknown = [p for p in paths if p not in self._paths]
+            if unknown:
+                raise ValueError(f"{self.format_name}: field_mapping for {name} has unknown paths {unknown}")
+            mapping[name] = paths
+        return mapping
+
+    def _owner(self, path: str) -> ElementSpec:
+        return self._paths[path.split("/@")[0]]
+
+    def _occurrence_limit(self, path: str) -> int:
+        """How many occurrences of the innermost repeating element on ``path`` may be rendered."""
+        element_path = self._owner(path).path
+        while element_path:
+            spec = self._paths[element_path]
+            if spec.repeated:
+                return min(spec.max_occurs or RENDER_MAX_OCCURRENCES, RENDER_MAX_OCCURRENCES)
+            element_path = element_path.rpartition("/")[0]
+        return 1
+
+    def resolve_field(self, name: str) -> tuple[list[str], int]:
+        """Paths for a field name and the occurrence it selects (0-based)."""
+        resolved = self._resolved.get(name)
+        if resolved is not None:
+            return resolved
+        resolved = [], 0
+        if name in self.field_paths:
+            resolved = self.field_paths[name], 0
+        else:
+            base, sep, meta = name.partition(":")
+            match = _OCCURRENCE.fullmatch(base)
+            if match:
+                key = match.group(1) + sep + meta
+                # Occurrences past the limit are dropped in field_values; this only keeps
+                # int() away from arbitrarily long digit strings
+                if key in self.field_paths and len(match.group(2)) <= 9:
+                    resolved = self.field_paths[key], int(match.group(2)) - 1
+        if len(self._resolved) < MAX_RESOLVED_FIELDS:
+            self._resolved[name] = resolved
+        return resolved
+
+    def field_values(self, data: dict) -> dict[str, dict[tuple, str]]:
+        """Map input fields onto paths, keyed by occurrence of each repeating ancestor."""
+        items = []
+        for name, raw in data.items():
+            if name.endswith("_metadata") and isinstance(raw, list):
+                field_name = name[: -len("_metadata")]
+                for entry in raw:
+                    meta_key, sep, meta_value = str(entry).partition(":")
+                    if sep:
+                        items.append((f"{field_name}:{meta_key.strip()}", meta_value.strip()))
+                continue
+            items.append((name, raw))
+
+        values: dict[str, dict[tuple, str]] = {}
+        for name, raw in items:
+            paths, occurrence = self.resolve_field(name)
+            occurrences = raw if isinstance(raw, list) else [raw]
+            for path in paths:
+                depth = self._owner(path).depth
+                for i, item in enumerate(occurrences):
+                    if depth and occurrence + i >= self._limits[path]:
+                        break
+                    if item is None or item == "":
+                        continue
+                    key = (0,) * (depth - 1) + (occurrence + i,) if depth else ()
+                    values.setdefault(path, {}).setdefault(key, item)
+        return values
+
+    def _presence(self, values: dict) -> tuple[set, dict]:
+        present: set[tuple[str, tuple]] = set()
+        counts: dict[tuple[str, tuple], int] = {}
+        for path, by_key in values.items():
+            spec = self._owner(path)
+            for key in by_key:
+                element_path = spec.path
+                while element_path:
+                    ancestor = self._paths[element_path]
+                    present.add((ancestor.path, key[:ancestor.depth]))
+                    if ancestor.repeated:
+                        slot = (ancestor.path, key[:ancestor.depth - 1])
+                        counts[slot] = max(counts.get(slot, 0), key[ancestor.depth - 1] + 1)
+                    element_path = element_path.rpartition("/")[0]
+        return present, counts
+
+    def _emit(self, spec: ElementSpec, parent, ctx: tuple, values: dict, present: set, counts: dict) -> None:
+        if spec.repeated:
+            contexts = [ctx + (i,) for i in range(max(spec.min_occurs, counts.get((spec.path, ctx), 0)))]
+        elif spec.min_occurs == 0 and (spec.path, ctx) not in present:
+            return
+        else:
+            contexts = [ctx]
+        for c in contexts:
+            self._fill(spec, etree.SubElement(parent, spec.tag), c, values, present, counts)
+
+    def _fill(self, spec: ElementSpec, el, ctx: tuple, values: dict, present: set, counts: dict) -> None:
+        for attr in spec.attributes:
+            text = _convert(values.get(attr.path, {}).get(ctx), attr.builtin, attr.enumerations)
+            if text is None and attr.required:
+                text = _placeholder(attr.builtin, attr.enumerations)
+            if text is not None:
+                el.set(attr.name, text)
+        if spec.children:
+            for child in spec.children:
+                self._emit(child, el, ctx, values, present, counts)
+        elif spec.builtin is not None:
+            text = _convert(values.get(spec.path, {}).get(ctx), spec.builtin, spec.enumerations)
+            el.text = text if text is not None else _placeholder(spec.builtin, spec.enumerations)
+
+    def render_tree(self, data: dict) -> etree._Element:
+        values = self.field_values(data)
+        present, counts = self._presence(values)
+        root = etree.Element(self.root.tag, nsmap={None: self.namespace} if self.namespace else None)
+        self._fill(self.root, root, (), values, present, counts)
+        return root
+
+    def render(self, data: dict, pretty_print: bool = True) -> str:
+        """Render one record (field name -> value, or list of values) as an XML string."""
+        return etree.tostring(self.render_tree(data), encoding="unicode", pretty_print=pretty_print)
+
+
+_renderers: dict[str, FormatRenderer] = {}
+_renderers_lock = threading.Lock()
+
+
+def get_renderer(format_name: str) -> FormatRenderer:
+    """Compiled renderer for a format, built on first use."""
+    with _renderers_lock:
+        renderer = _renderers.get(format_name)
+        if renderer is None:
+            renderer = _renderers[format_name] = FormatRenderer.from_config(format_name)
+        return renderer
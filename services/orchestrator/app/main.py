@@ -1,8 +1,13 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import AsyncIterator
+import asyncio
 import os
-import httpx
+import tempfile
+import time
 import json
+from packages.shared.http_clients import NoReadyInstance, ServiceClients, ServiceConfig
 
 app = FastAPI(title="SAR Agent Orchestrator")
 
@@ -12,6 +17,37 @@ LLM_FILLER_URL = os.getenv("LLM_FILLER_URL", "http://127.0.0.1:8084")
 VALIDATOR_URL = os.getenv("VALIDATOR_URL", "http://127.0.0.1:8085")
 TEMPLATE_FETCHER_URL = os.getenv("TEMPLATE_FETCHER_URL", "http://127.0.0.1:8082")
 
+# Batch pipeline settings
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "128"))
+BATCH_SPOOL_BYTES = int(os.getenv("BATCH_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+# Seconds between /ready probes of model-backed services
+READY_PROBE_INTERVAL = float(os.getenv("READY_PROBE_INTERVAL", "5"))
+
+# Pooled, app-lifetime clients for downstream services. URLs may list several
+# instances; services with a ready_path only get traffic once their models are loaded.
+clients = ServiceClients({
+    "format_selector": ServiceConfig(FORMAT_SELECTOR_URL, timeout=30),
+    "llm_filler": ServiceConfig(LLM_FILLER_URL, timeout=60, ready_path="/ready"),
+    "validator": ServiceConfig(VALIDATOR_URL, timeout=30),
+    "template_fetcher": ServiceConfig(TEMPLATE_FETCHER_URL, timeout=30, ready_path="/ready"),
+})
+_readiness_task: asyncio.Task | None = None
+
+@app.on_event("startup")
+async def startup():
+    global _readiness_task
+    await clients.start()
+    await clients.refresh_readiness()
+    _readiness_task = asyncio.create_task(clients.watch_readiness(READY_PROBE_INTERVAL))
+
+@app.on_event("shutdown")
+async def shutdown():
+    if _readiness_task is not None:
+        _readiness_task.cancel()
+    await clients.close()
+
 class PipelineRequest(BaseModel):
     pipe_data: str
     validate_output: bool = True
@@ -26,136 +62,320 @@ class PipelineResponse(BaseModel):
     complexity_metrics: dict
     pipeline_steps: list
 
+class BatchCase(BaseModel):
+    pipe_data: str
+    case_id: str | None = None
+    validate_output: bool = True
+    use_rag: bool = True
+
+async def run_pipeline_case(pipe_data: str, validate_output: bool, use_rag: bool,
+                            pipeline_steps: list, check_templates: bool = True) -> PipelineResponse:
+    """Run format selection, XML generation and validation for a single case."""
+    # Step 1: Analyze pipe data and select format
+    pipeline_steps.append("Format selection started")
+    format_info = await call_format_selector(pipe_data)
+    recommended_format = format_info.get("recommended_format", "format2_simple")
+    pipeline_steps.append(f"Format selected: {recommended_format}")
+    
+    # Step 2: Generate XML using the selected format
+    pipeline_steps.append("XML generation started")
+    xml_result = await call_llm_filler(pipe_data, use_rag)
+    generated_xml = xml_result.get("xml", "")
+    pipeline_steps.append("XML generated successfully")
+    
+    # Step 3: Validate the generated XML
+    validation_result = {"valid": False, "error": "Validation skipped"}
+    if validate_output and generated_xml:
+        pipeline_steps.append("XML validation started")
+        validation_result = await call_validator(generated_xml, recommended_format)
+        pipeline_steps.append(f"XML validation completed: {validation_result.get('valid', False)}")
+    
+    # Step 4: Ensure XSD templates are available
+    if check_templates:
+        pipeline_steps.append("Template availability check started")
+        await ensure_templates_available()
+        pipeline_steps.append("Templates verified")
+    
+    return PipelineResponse(
+        success=True,
+        recommended_format=recommended_format,
+        format_reasoning=format_info.get("reasoning", ""),
+        generated_xml=generated_xml,
+        validation_result=validation_result,
+        complexity_metrics=format_info.get("complexity_metrics", {}),
+        pipeline_steps=pipeline_steps
+    )
+
 @app.post("/pipeline")
 async def run_complete_pipeline(request: PipelineRequest):
     """Run the complete pipeline: format selection -> XML generation -> validation"""
     pipeline_steps = []
     
     try:
-        # Step 1: Analyze pipe data and select format
-        pipeline_steps.append("Format selection started")
-        format_info = await call_format_selector(request.pipe_data)
-        recommended_format = format_info.get("recommended_format", "format2_simple")
-        pipeline_steps.append(f"Format selected: {recommended_format}")
-        
-        # Step 2: Generate XML using the selected format
-        pipeline_steps.append("XML generation started")
-        xml_result = await call_llm_filler(request.pipe_data, request.use_rag)
-        generated_xml = xml_result.get("xml", "")
-        pipeline_steps.append("XML generated successfully")
-        
-        # Step 3: Validate the generated XML
-        validation_result = {"valid": False, "error": "Validation skipped"}
-        if request.validate_output and generated_xml:
-            pipeline_steps.append("XML validation started")
-            validation_result = await call_validator(generated_xml, recommended_format)
-            pipeline_steps.append(f"XML validation completed: {validation_result.get('valid', False)}")
-        
-        # Step 4: Ensure XSD templates are available
-        pipeline_steps.append("Template availability check started")
-        await ensure_templates_available()
-        pipeline_steps.append("Templates verified")
-        
-        return PipelineResponse(
-            success=True,
-            recommended_format=recommended_format,
-            format_reasoning=format_info.get("reasoning", ""),
-            generated_xml=generated_xml,
-            validation_result=validation_result,
-            complexity_metrics=format_info.get("complexity_metrics", {}),
-            pipeline_steps=pipeline_steps
-        )
-        
+        return await run_pipeline_case(request.pipe_data, request.validate_output, request.use_rag, pipeline_steps)
     except Exception as e:
         pipeline_steps.append(f"Pipeline failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Pipeline execution failed: {str(e)}")
 
+@app.post("/pipeline_batch")
+async def run_batch_pipeline(request: Request, concurrency: int = BATCH_CONCURRENCY):
+    """Run the pipeline for many cases and stream per-case results as NDJSON.
+
+    Accepts either an NDJSON body (one case object per line, e.g.
+    ``{"case_id": "c1", "pipe_data": "..."}``) or a multipart upload where each
+    ``.ndjson``/``.jsonl`` file holds case objects and any other file is a single
+    case's pipe data. Results are emitted in completion order; the final line
+    is a ``summary`` record with throughput and latency figures.
+    """
+    if concurrency < 1 or concurrency > BATCH_MAX_CONCURRENCY:
+        raise HTTPException(status_code=400, detail=f"concurrency must be between 1 and {BATCH_MAX_CONCURRENCY}")
+    
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        cases = iter_multipart_cases(form)
+    else:
+        # Spool the body first: the streaming response owns the receive channel once it starts
+        spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES)
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        cases = iter_ndjson_cases(spool)
+    
+    # Templates are shared by every case, so check them once per batch
+    await ensure_templates_available()
+    
+    return StreamingResponse(stream_batch_results(cases, concurrency), media_type="application/x-ndjson")
+
+def parse_batch_case(raw: bytes, index: int) -> BatchCase | dict:
+    """Parse one NDJSON line into a case, or an error record if it is malformed."""
+    try:
+        case = BatchCase.model_validate_json(raw.decode("utf-8"))
+    except UnicodeDecodeError as e:
+        return {"index": index, "case_id": None, "success": False, "error": f"Invalid case: not valid UTF-8 ({e.reason})"}
+    except ValidationError as e:
+        return {"index": index, "case_id": None, "success": False, "error": f"Invalid case: {e.errors()[0]['msg']}"}
+    if case.case_id is None:
+        case.case_id = str(index)
+    return case
+
+async def iter_ndjson_cases(lines) -> AsyncIterator[BatchCase | dict]:
+    """Yield cases from an NDJSON file object line by line, closing it when done."""
+    try:
+        index = 0
+        for raw in lines:
+            if raw.strip():
+                yield parse_batch_case(raw, index)
+                index += 1
+    finally:
+        lines.close()
+
+async def iter_multipart_cases(form) -> AsyncIterator[BatchCase | dict]:
+    """Yield cases from the uploaded files of a multipart form."""
+    index = 0
+    for _, upload in form.multi_items():
+        if isinstance(upload, str):
+            continue
+        filename = upload.filename or ""
+        if filename.endswith((".ndjson", ".jsonl")):
+            for raw in upload.file:
+                if raw.strip():
+                    yield parse_batch_case(raw, index)
+                    index += 1
+        else:
+            content = await upload.read()
+            try:
+                yield BatchCase(pipe_data=content.decode("utf-8"), case_id=filename or str(index))
+            except UnicodeDecodeError as e:
+                yield {"index": index, "case_id": filename or str(index), "success": False,
+                       "error": f"Invalid case: not valid UTF-8 ({e.reason})"}
+            index += 1
+
+async def stream_batch_results(cases: AsyncIterator[BatchCase | dict], concurrency: int) -> AsyncIterator[bytes]:
+    """Run cases through a bounded pool of workers and yield NDJSON result lines."""
+    pending: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    finished: asyncio.Queue = asyncio.Queue()
+    latencies: list[float] = []
+    succeeded = 0
+    failed = 0
+    started = time.perf_counter()
+    
+    async def produce():
+        index = 0
+        try:
+            async for case in cases:
+                await pending.put((index, case))
+                index += 1
+        except Exception as e:
+            await finished.put({"index": index, "case_id": None, "success": False, "error": f"Input stream failed: {str(e)}"})
+        finally:
+            for _ in range(concurrency):
+                await pending.put(None)
+    
+    async def work():
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            index, case = item
+            if isinstance(case, dict):
+                await finished.put(case)
+                continue
+            case_started = time.perf_counter()
+            steps = []
+            try:
+                result = await run_pipeline_case(case.pipe_data, case.validate_output, case.use_rag,
+                                                 steps, check_templates=False)
+                record = {"index": index, "case_id": case.case_id, "success": True, "result": result.model_dump()}
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                record = {"index": index, "case_id": case.case_id, "success": False,
+                          "error": detail, "pipeline_steps": steps}
+            record["latency_ms"] = round((time.perf_counter() - case_started) * 1000, 2)
+            await finished.put(record)
+    
+    async def run_workers():
+        try:
+            await asyncio.gather(*(work() for _ in range(concurrency)))
+        finally:
+            await finished.put(None)
+    
+    producer = asyncio.create_task(produce())
+    workers = asyncio.create_task(run_workers())
+    try:
+        while True:
+            record = await finished.get()
+            if record is None:
+                break
+            if record.get("success"):
+                succeeded += 1
+            else:
+                failed += 1
+            if "latency_ms" in record:
+                latencies.append(record["latency_ms"])
+            yield (json.dumps(record) + "\n").encode("utf-8")
+    finally:
+        producer.cancel()
+        workers.cancel()
+    
+    elapsed = time.perf_counter() - started
+    summary = {
+        "summary": {
+            "total": succeeded + failed,
+            "succeeded": succeeded,
+            "failed": failed,
+            "concurrency": concurrency,
+            "elapsed_s": round(elapsed, 3),
+            "cases_per_sec": round((succeeded + failed) / elapsed, 2) if elapsed > 0 else 0.0,
+            "latency_ms": latency_summary(latencies),
+        }
+    }
+    yield (json.dumps(summary) + "\n").encode("utf-8")
+
+def latency_summary(latencies: list[float]) -> dict:
+    """Summarize per-case latencies (milliseconds) with mean and percentiles."""
+    if not latencies:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(latencies)
+    
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(p * (len(ordered) - 1))))]
+    
+    return {
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+        "max": ordered[-1],
+    }
+
 async def call_format_selector(pipe_data: str) -> dict:
     """Call the format selector service."""
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(f"{FORMAT_SELECTOR_URL}/analyze", json={
-                "pipe_data": pipe_data
-            })
-            r.raise_for_status()
-            return r.json()
+        r = await clients.get("format_selector").post("/analyze", json={
+            "pipe_data": pipe_data
+        })
+        r.raise_for_status()
+        return r.json()
+    except NoReadyInstance as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Format selector service error: {str(e)}")
 
 async def call_llm_filler(pipe_data: str, use_rag: bool) -> dict:
     """Call the LLM filler service."""
     try:
-        async with httpx.AsyncClient(timeout=60) as client:
-            r = await client.post(f"{LLM_FILLER_URL}/fill_with_pipe_data", json={
-                "pipe_data": pipe_data,
-                "use_rag": False,
-                "max_new_tokens": 128
-            })
-            r.raise_for_status()
-            return r.json()
+        r = await clients.get("llm_filler").post("/fill_with_pipe_data", json={
+            "pipe_data": pipe_data,
+            "use_rag": False,
+            "max_new_tokens": 128
+        })
+        r.raise_for_status()
+        return r.json()
+    except NoReadyInstance as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM filler service error: {str(e)}")
 
 async def call_validator(xml_string: str, format_type: str) -> dict:
     """Call the validator service."""
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            r = await client.post(f"{VALIDATOR_URL}/validate_with_format", json={
-                "xml_string": xml_string,
-                "format_type": format_type
-            })
-            r.raise_for_status()
-            return r.json()
+        r = await clients.get("validator").post("/validate_with_format", json={
+            "xml_string": xml_string,
+            "format_type": format_type
+        })
+        r.raise_for_status()
+        return r.json()
+    except NoReadyInstance as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Validator service error: {str(e)}")
 
 async def ensure_templates_available():
     """Ensure that the required XSD templates are available."""
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            # Check if templates are already available
-            r = await client.get(f"{TEMPLATE_FETCHER_URL}/list")
-            if r.status_code == 200:
-                templates = r.json().get("templates", [])
-                template_names = [t["cache_key"] for t in templates]
-                
-                # If both formats are available, we're good
-                if "format1_complex.xsd" in template_names and "format2_simple.xsd" in template_names:
-                    return
-                
-                # Otherwise, fetch the builtin formats
-                r = await client.post(f"{TEMPLATE_FETCHER_URL}/fetch_builtin")
-                if r.status_code != 200:
-                    print(f"Warning: Failed to fetch builtin formats: {r.status_code}")
+        client = clients.get("template_fetcher")
+        # Check if templates are already available
+        r = await client.get("/list")
+        if r.status_code == 200:
+            templates = r.json().get("templates", [])
+            template_names = [t["cache_key"] for t in templates]
+            
+            # If both formats are available, we're good
+            if "format1_complex.xsd" in template_names and "format2_simple.xsd" in template_names:
+                return
+            
+            # Otherwise, fetch the builtin formats
+            r = await client.post("/fetch_builtin")
+            if r.status_code != 200:
+                print(f"Warning: Failed to fetch builtin formats: {r.status_code}")
                     
     except Exception as e:
         print(f"Warning: Template availability check failed: {str(e)}")
 
 @app.get("/health")
 async def health():
-    """Health check for the orchestrator service."""
+    """Health check for the orchestrator service.
+
+    Liveness is checked on every instance of each dependent service, whether
+    or not it has passed its readiness probe; a service is healthy if any
+    instance answers. Readiness (whether calls can be routed) is reported
+    separately.
+    """
     try:
         # Check all dependent services
-        services = {
-            "format_selector": FORMAT_SELECTOR_URL,
-            "llm_filler": LLM_FILLER_URL,
-            "validator": VALIDATOR_URL,
-            "template_fetcher": TEMPLATE_FETCHER_URL
-        }
-        
-        health_status = {}
-        async with httpx.AsyncClient(timeout=10) as client:
-            for service_name, url in services.items():
-                try:
-                    r = await client.get(f"{url}/health")
-                    health_status[service_name] = r.status_code == 200
-                except:
-                    health_status[service_name] = False
-        
+        instances = await clients.check_liveness("/health", timeout=10)
+        health_status = {name: any(alive.values()) for name, alive in instances.items()}
+        ready_instances = {name: clients.ready_urls(name) for name in clients.services}
+
         return {
             "orchestrator": True,
             "dependent_services": health_status,
-            "all_healthy": all(health_status.values())
+            "instances": instances,
+            "ready": {name: bool(urls) for name, urls in ready_instances.items()},
+            "ready_instances": ready_instances,
+            "all_healthy": all(health_status.values()),
+            "all_ready": all(ready_instances.values()),
         }
     except Exception as e:
         return {
@@ -165,6 +385,11 @@ async def health():
             "error": str(e)
         }
 
+@app.get("/metrics/http_pool")
+def http_pool_metrics():
+    """Connection pool usage and request counters per downstream service."""
+    return {"services": clients.stats()}
+
 @app.get("/")
 def root():
     return {"service": "orchestrator", "docs": "/docs", "health": "/health"}
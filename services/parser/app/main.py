@@ -1,10 +1,10 @@
 import asyncio
 import json
 import os
-import csv
 from datetime import datetime
 from aiokafka import AIOKafkaConsumer, AIOKafkaProducer
 from packages.shared.topics import Topics
+from .pipe_parser import iter_pipe_row_chunks
 
 
 KAFKA_BROKERS = os.getenv("KAFKA_BROKERS", "kafka:9092")
@@ -12,30 +12,6 @@ GROUP_ID = os.getenv("PARSER_GROUP_ID", "parser-agent")
 OUTPUT_TOPIC = os.getenv("PARSER_OUTPUT_TOPIC", Topics.PARSED_JSON)
 
 
-def parse_pipe_file(file_path: str) -> list[dict]:
-    """Parse pipe-delimited file and return structured JSON rows."""
-    rows = []
-    with open(file_path, newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f, delimiter='|')
-        for i, row in enumerate(reader):
-            # Add metadata
-            parsed_row = {
-                "row_number": i + 1,
-                "raw_data": row,
-                "parsed_at": datetime.now().isoformat(),
-                "source_file": file_path,
-                # Map common fields to standardized names
-                "entity_name": row.get("EntityName", row.get("entity_name", "")),
-                "entity_type": row.get("EntityType", row.get("entity_type", "")),
-                "transaction_id": row.get("TransactionID", row.get("transaction_id", "")),
-                "amount": float(row.get("Amount", row.get("amount", "0"))) if row.get("Amount") or row.get("amount") else 0,
-                "status": row.get("Status", row.get("status", "")),
-                "date": row.get("Date", row.get("date", "")),
-            }
-            rows.append(parsed_row)
-    return rows
-
-
 async def handle_ingestion(message_value: bytes, producer: AIOKafkaProducer):
     """Handle ingestion message and emit parsed JSON rows."""
     evt = json.loads(message_value.decode("utf-8"))
@@ -49,22 +25,27 @@ async def handle_ingestion(message_value: bytes, producer: AIOKafkaProducer):
         return
     
     try:
-        # Parse the pipe-delimited file
-        rows = parse_pipe_file(upload_path)
-        print(f"[Parser] ✅ Parsed {len(rows)} rows from {upload_path}")
-        
-        # Emit each row to the parsed-json topic
-        for row in rows:
-            payload = {
-                "job_id": job_id,
-                "row": row,
-                "source_file": upload_path,
-                "parsed_at": datetime.now().isoformat(),
-            }
-            await producer.send_and_wait(OUTPUT_TOPIC, json.dumps(payload).encode("utf-8"))
-            print(f"[Parser] 📤 Emitted row {row['row_number']} to {OUTPUT_TOPIC}")
+        # Parse the pipe-delimited file in chunks; each chunk is fetched off the event loop
+        chunks = iter_pipe_row_chunks(upload_path)
+        row_count = 0
+        try:
+            while (rows := await asyncio.to_thread(next, chunks, None)) is not None:
+                # Emit each row to the parsed-json topic
+                for row in rows:
+                    payload = {
+                        "job_id": job_id,
+                        "row": row,
+                        "source_file": upload_path,
+                        "parsed_at": datetime.now().isoformat(),
+                    }
+                    await producer.send_and_wait(OUTPUT_TOPIC, json.dumps(payload).encode("utf-8"))
+                    print(f"[Parser] 📤 Emitted row {row['row_number']} to {OUTPUT_TOPIC}")
+                row_count += len(rows)
+        finally:
+            # Shuts the worker pool down if a send failed part-way; waits for running chunks
+            await asyncio.to_thread(chunks.close)
         
-        print(f"[Parser] ✅ Completed job {job_id} - {len(rows)} rows processed")
+        print(f"[Parser] ✅ Completed job {job_id} - {row_count} rows processed")
         
     except Exception as e:
         print(f"[Parser] ❌ Error processing job {job_id}: {e}")
@@ -0,0 +1,132 @@
+"""Streaming, parallel parser for pipe-delimited bank extracts.
+
+``parse_pipe_file`` used to read a whole file through ``csv.DictReader``
+into one list, so multi-GB extracts needed several times their size in
+memory and were parsed on a single core. ``iter_pipe_rows`` is a generator
+instead. After the header line, the file is split into byte ranges of about
+``chunk_bytes``, each ending on a line boundary. Worker processes parse the
+ranges (each reads its own range from disk), and rows are yielded in file
+order. At most ``max_pending`` chunks are in flight or waiting to be
+consumed, so memory is bounded by chunk size, not file size.
+
+Chunks are cut on newlines, so quoted fields must not contain line breaks.
+Pipe extracts do not quote fields; for files that do, pass ``workers=0``
+to parse sequentially (still streaming, chunk by chunk).
+
+Workers are started with the "spawn" method: the parser service runs the
+generator from a worker thread of an asyncio process, where forking is
+unsafe. Close the generator (or exhaust it) to shut the pool down.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Iterator
+import csv
+import io
+import multiprocessing
+import os
+
+
+PARSER_WORKERS = int(os.getenv("PARSER_WORKERS", str(os.cpu_count() or 1)))
+PARSER_CHUNK_BYTES = int(float(os.getenv("PARSER_CHUNK_MB", "8")) * 1024 * 1024)
+
+
+def standardize_row(row: dict, row_number: int | None, parsed_at: str, source_file: str) -> dict:
+    return {
+        "row_number": row_number,
+        "raw_data": row,
+        "parsed_at": parsed_at,
+        "source_file": source_file,
+        # Map common fields to standardized names
+        "entity_name": row.get("EntityName", row.get("entity_name", "")),
+        "entity_type": row.get("EntityType", row.get("entity_type", "")),
+        "transaction_id": row.get("TransactionID", row.get("transaction_id", "")),
+        "amount": float(row.get("Amount", row.get("amount", "0"))) if row.get("Amount") or row.get("amount") else 0,
+        "status": row.get("Status", row.get("status", "")),
+        "date": row.get("Date", row.get("date", "")),
+    }
+
+
+def read_header(file_path: str) -> tuple[list[str], int]:
+    """Field names from the first line, and the byte offset where the data starts."""
+    with open(file_path, "rb") as f:
+        line = f.readline()
+        offset = f.tell()
+    fieldnames = next(csv.reader(io.StringIO(line.decode("utf-8"), newline=""), delimiter="|"), [])
+    return fieldnames, offset
+
+
+def chunk_ranges(file_path: str, start: int, chunk_bytes: int) -> list[tuple[int, int]]:
+    """Split ``[start, EOF)`` into byte ranges of about ``chunk_bytes`` that end on line boundaries."""
+    size = os.path.getsize(file_path)
+    ranges = []
+    with open(file_path, "rb") as f:
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()  # move on to the end of the line the cut falls in
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_range(file_path: str, start: int, end: int, fieldnames: list[str], parsed_at: str) -> list[dict]:
+    """Parse the rows in bytes ``[start, end)``; row numbers are filled in by the caller."""
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+    reader = csv.DictReader(io.StringIO(text, newline=""), fieldnames=fieldnames, delimiter="|")
+    return [standardize_row(row, None, parsed_at, file_path) for row in reader]
+
+
+def iter_pipe_row_chunks(file_path: str, workers: int = PARSER_WORKERS, chunk_bytes: int = PARSER_CHUNK_BYTES,
+                         max_pending: int | None = None) -> Iterator[list[dict]]:
+    """Yield the file's rows chunk by chunk, in order, each row numbered from 1."""
+    fieldnames, offset = read_header(file_path)
+    ranges = chunk_ranges(file_path, offset, chunk_bytes)
+    parsed_at = datetime.now().isoformat()
+    row_number = 0
+
+    def numbered(rows: list[dict]) -> list[dict]:
+        nonlocal row_number
+        for row in rows:
+            row_number += 1
+            row["row_number"] = row_number
+        return rows
+
+    if workers <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield numbered(parse_range(file_path, start, end, fieldnames, parsed_at))
+        return
+
+    max_pending = max_pending or workers * 2
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending: deque = deque()
+        remaining = iter(ranges)
+        try:
+            for start, end in remaining:
+                pending.append(pool.submit(parse_range, file_path, start, end, fieldnames, parsed_at))
+                if len(pending) >= max_pending:
+                    break
+            while pending:
+                rows = pending.popleft().result()
+                # Keep the pool busy while the caller consumes this chunk
+                for start, end in remaining:
+                    pending.append(pool.submit(parse_range, file_path, start, end, fieldnames, parsed_at))
+                    break
+                yield numbered(rows)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def iter_pipe_rows(file_path: str, workers: int = PARSER_WORKERS, chunk_bytes: int = PARSER_CHUNK_BYTES) -> Iterator[dict]:
+    """Parse a pipe-delimited file into structured JSON rows, one at a time."""
+    for rows in iter_pipe_row_chunks(file_path, workers, chunk_bytes):
+        yield from rows
+
+
+def parse_pipe_file(file_path: str) -> list[dict]:
+    """Parse pipe-delimited file and return structured JSON rows."""
+    return list(iter_pipe_rows(file_path))
@@ -0,0 +1,185 @@
+"""In-memory cache of FAISS indexes and their corpora for the RAG service."""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import json
+import os
+import threading
+import time
+
+import faiss
+
+from packages.shared.index_params import apply_search_params, file_stamp, load_params, params_path
+
+
+class IndexUpdating(RuntimeError):
+    """The index files are being rewritten and no consistent copy is cached yet."""
+
+
+def content_version(params: dict, *stamps: list[int]) -> str:
+    """Version of a loaded index, used in result-cache keys.
+
+    template_fetcher stamps ``params["version"]`` on every build; indexes
+    without a stamp fall back to the files' size and mtime. Nothing is read
+    beyond the params, so an mmapped index stays out of memory.
+    """
+    if params.get("version"):
+        return params["version"]
+    return hashlib.sha256(json.dumps(stamps).encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class LoadedIndex:
+    cache_key: str
+    index: faiss.Index
+    corpus: list[str]
+    index_mtime_ns: int
+    meta_mtime_ns: int
+    version: str
+    params: dict = field(default_factory=dict)
+    mmap: bool = False
+    loaded_at: float = field(default_factory=time.time)
+
+
+class IndexCache:
+    """LRU cache of loaded indexes keyed by cache_key.
+
+    An entry is reloaded when the ``.faiss`` or ``.txt`` file's mtime changes,
+    or when it is invalidated explicitly (template_fetcher notifies the RAG
+    service after rebuilding an index). With ``mmap=True`` the index is read
+    with ``IO_FLAG_MMAP`` so several worker processes share its pages. Search
+    settings saved alongside an approximate index (nprobe / efSearch) are
+    applied after loading.
+    """
+
+    def __init__(self, index_dir: str, max_entries: int = 8, mmap: bool = False,
+                 retries: int = 20, retry_delay: float = 0.05):
+        self.index_dir = index_dir
+        self.max_entries = max_entries
+        self.mmap = mmap
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._entries: "OrderedDict[str, LoadedIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.inconsistent = 0
+
+    def paths(self, cache_key: str) -> tuple[str, str]:
+        return (
+            os.path.join(self.index_dir, f"{cache_key}.faiss"),
+            os.path.join(self.index_dir, f"{cache_key}.txt"),
+        )
+
+    def get(self, cache_key: str) -> LoadedIndex:
+        """Return the loaded index for ``cache_key``; raises FileNotFoundError if absent.
+
+        template_fetcher replaces the ``.faiss`` and ``.txt`` files one after
+        the other and then stamps both in the params file. A pair that does
+        not match its stamp, or that changes while it is being read, is
+        mid-rewrite: the cached entry keeps being served, or, with nothing
+        cached, the read is retried. IndexUpdating is raised if the files do
+        not settle within ``retries`` attempts.
+        """
+        index_path, meta_path = self.paths(cache_key)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.retry_delay)
+            index_stamp = file_stamp(index_path)
+            meta_stamp = file_stamp(meta_path)
+            with self._lock:
+                entry = self._entries.get(cache_key)
+                if entry is not None and (entry.index_mtime_ns, entry.meta_mtime_ns) == (index_stamp[1], meta_stamp[1]):
+                    self.hits += 1
+                    self._entries.move_to_end(cache_key)
+                    return entry
+
+                params = load_params(self.index_dir, cache_key)
+                stamped = params.get("files")
+                if stamped is not None and stamped != {"faiss": index_stamp, "txt": meta_stamp}:
+                    self.inconsistent += 1
+                    if entry is not None:
+                        self.hits += 1
+                        return entry
+                    continue
+
+                index = self._read_index(index_path)
+                corpus = self._read_corpus(meta_path)
+                if (file_stamp(index_path), file_stamp(meta_path)) != (index_stamp, meta_stamp):
+                    # Replaced while we were reading it
+                    self.inconsistent += 1
+                    continue
+                if entry is not None:
+                    self.reloads += 1
+                self.misses += 1
+                apply_search_params(index, params)
+                version_stamps = [index_stamp, meta_stamp]
+                if params:
+                    version_stamps.append(file_stamp(params_path(self.index_dir, cache_key)))
+                entry = LoadedIndex(
+                    cache_key=cache_key,
+                    index=index,
+                    corpus=corpus,
+                    index_mtime_ns=index_stamp[1],
+                    meta_mtime_ns=meta_stamp[1],
+                    version=content_version(params, *version_stamps),
+                    params=params,
+                    mmap=self.mmap,
+                )
+                self._entries[cache_key] = entry
+                self._entries.move_to_end(cache_key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+                return entry
+        raise IndexUpdating(f"Index {cache_key} is being rewritten")
+
+    def _read_index(self, index_path: str) -> faiss.Index:
+        if self.mmap:
+            try:
+                return faiss.read_index(index_path, faiss.IO_FLAG_MMAP)
+            except RuntimeError as e:
+                # Not every index type supports mmap; fall back to a private copy
+                print(f"Warning: mmap read failed for {index_path}, loading into memory: {e}")
+        return faiss.read_index(index_path)
+
+    @staticmethod
+    def _read_corpus(meta_path: str) -> list[str]:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return [line.strip() for line in f]
+
+    def invalidate(self, cache_key: str | None = None) -> int:
+        """Drop one entry, or every entry when no cache_key is given."""
+        with self._lock:
+            if cache_key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                removed = 1 if self._entries.pop(cache_key, None) is not None else 0
+            self.invalidations += removed
+            return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "mmap": self.mmap,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "inconsistent": self.inconsistent,
+                "cached": [
+                    {"cache_key": key, "version": e.version, "vectors": e.index.ntotal,
+                     "corpus_lines": len(e.corpus), "index_type": e.params.get("index_type", "flat"),
+                     "loaded_at": e.loaded_at}
+                    for key, e in self._entries.items()
+                ],
+            }
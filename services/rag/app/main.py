@@ -1,18 +1,43 @@
+import time
+_import_started = time.perf_counter()
+
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+import asyncio
 import os
-import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
+from .index_cache import IndexCache, IndexUpdating
+from .result_cache import ResultCache
+from packages.shared.embedding_cache import EmbeddingCache
+from packages.shared.readiness import Readiness
+from packages.shared.schema_model import SchemaModelStore
 
 
 app = FastAPI(title="RAG Retriever")
 
 INDEX_DIR = os.getenv("INDEX_DIR", "/data/indexes")
 EMBED_MODEL_NAME = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+INDEX_CACHE_SIZE = int(os.getenv("INDEX_CACHE_SIZE", "8"))
+INDEX_MMAP = os.getenv("INDEX_MMAP", "false").lower() in ("1", "true", "yes")
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "5000"))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "3600"))
+EMBED_CACHE_REDIS_URL = os.getenv("EMBED_CACHE_REDIS_URL")
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "true").lower() in ("1", "true", "yes")
+
+index_cache = IndexCache(INDEX_DIR, max_entries=INDEX_CACHE_SIZE, mmap=INDEX_MMAP)
+result_cache = ResultCache(max_entries=RESULT_CACHE_SIZE)
+embedding_cache = EmbeddingCache(EMBED_MODEL_NAME, max_entries=EMBED_CACHE_SIZE, ttl_seconds=EMBED_CACHE_TTL,
+                                 redis_url=EMBED_CACHE_REDIS_URL)
+# Structured schema models written by template_fetcher next to each index
+schema_models = SchemaModelStore(INDEX_DIR)
 
 _embedder: SentenceTransformer | None = None
 
+readiness = Readiness("rag", import_seconds=time.perf_counter() - _import_started)
+
 
 def get_embedder() -> SentenceTransformer:
     global _embedder
@@ -21,31 +46,121 @@ def get_embedder() -> SentenceTransformer:
     return _embedder
 
 
+def warm_up() -> None:
+    """Load the embedder and run one encode, bypassing the embedding cache."""
+    with readiness.phase("weight_load"):
+        embedder = get_embedder()
+    with readiness.phase("first_forward"):
+        embedder.encode(["warm up"], normalize_embeddings=True)
+
+
+@app.on_event("startup")
+async def startup():
+    if PRELOAD_MODELS:
+        readiness.start_warm_up(lambda: asyncio.to_thread(warm_up))
+    else:
+        readiness.mark_ready()  # lazy loading: the first query pays the load
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    readiness.stop()
+
+
 class QueryRequest(BaseModel):
     cache_key: str
     query: str
     k: int = 5
 
+class QueryBatchRequest(BaseModel):
+    queries: list[QueryRequest]
 
-@app.post("/query")
-def query(req: QueryRequest):
-    index_path = os.path.join(INDEX_DIR, f"{req.cache_key}.faiss")
-    meta_path = os.path.join(INDEX_DIR, f"{req.cache_key}.txt")
-    if not os.path.exists(index_path) or not os.path.exists(meta_path):
-        raise HTTPException(status_code=404, detail="Index not found; run template fetch first")
-    index = faiss.read_index(index_path)
-    with open(meta_path, "r", encoding="utf-8") as f:
-        corpus = [line.strip() for line in f.readlines()]
-    model = get_embedder()
-    q = model.encode([req.query], normalize_embeddings=True).astype(np.float32)
-    scores, idxs = index.search(q, req.k)
-    idxs = idxs[0]
-    scores = scores[0]
+class ReloadRequest(BaseModel):
+    cache_key: str | None = None
+
+
+def search_results(corpus: list[str], scores, idxs, k: int) -> list[dict]:
+    """Turn one row of FAISS output into result dicts, skipping empty slots."""
     results = []
-    for i, s in zip(idxs, scores):
+    for i, s in zip(idxs[:k], scores[:k]):
         if i < 0 or i >= len(corpus):
             continue
         results.append({"text": corpus[i], "score": float(s)})
+    return results
+
+
+@app.post("/query")
+def query(req: QueryRequest):
+    try:
+        loaded = index_cache.get(req.cache_key)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Index not found; run template fetch first")
+    except IndexUpdating as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    key = ResultCache.key(req.cache_key, req.query, req.k, loaded.version)
+    results = result_cache.get(key)
+    if results is None:
+        q = embedding_cache.encode(get_embedder(), [req.query])
+        scores, idxs = loaded.index.search(q, req.k)
+        results = search_results(loaded.corpus, scores[0], idxs[0], req.k)
+        result_cache.put(key, results)
+    return {"results": results}
+
+
+@app.post("/query_batch")
+def query_batch(req: QueryBatchRequest):
+    """Run many (cache_key, query, k) lookups in one call.
+
+    Cached results are served directly. The remaining distinct query strings
+    are embedded in a single encoder call, then each index is searched once
+    with every uncached query that targets it. Results come back in request
+    order; a missing index yields a per-item error.
+    """
+    results: list[dict] = [{} for _ in req.queries]
+    groups: dict[str, list[int]] = {}
+    for i, q in enumerate(req.queries):
+        groups.setdefault(q.cache_key, []).append(i)
+
+    pending: dict[str, tuple] = {}
+    for cache_key, members in groups.items():
+        try:
+            loaded = index_cache.get(cache_key)
+        except FileNotFoundError:
+            for i in members:
+                results[i] = {"cache_key": cache_key, "query": req.queries[i].query,
+                              "error": "Index not found; run template fetch first", "results": []}
+            continue
+        except IndexUpdating as e:
+            for i in members:
+                results[i] = {"cache_key": cache_key, "query": req.queries[i].query,
+                              "error": str(e), "results": []}
+            continue
+        misses = []
+        for i in members:
+            q = req.queries[i]
+            cached = result_cache.get(ResultCache.key(cache_key, q.query, q.k, loaded.version))
+            if cached is None:
+                misses.append(i)
+            else:
+                results[i] = {"cache_key": cache_key, "query": q.query, "results": cached}
+        if misses:
+            pending[cache_key] = (loaded, misses)
+
+    texts = list(dict.fromkeys(req.queries[i].query for _, misses in pending.values() for i in misses))
+    if not texts:
+        return {"results": results}
+    position = {text: i for i, text in enumerate(texts)}
+    vectors = embedding_cache.encode(get_embedder(), texts)
+
+    for cache_key, (loaded, misses) in pending.items():
+        k = max(req.queries[i].k for i in misses)
+        q = vectors[[position[req.queries[i].query] for i in misses]]
+        scores, idxs = loaded.index.search(q, k)
+        for row, i in enumerate(misses):
+            item = req.queries[i]
+            hits = search_results(loaded.corpus, scores[row], idxs[row], item.k)
+            result_cache.put(ResultCache.key(cache_key, item.query, item.k, loaded.version), hits)
+            results[i] = {"cache_key": cache_key, "query": item.query, "results": hits}
     return {"results": results}
 
 
@@ -56,6 +171,53 @@ def root():
 
 @app.get("/health")
 def health():
-    return {"ok": True}
+    return {"ok": True, "ready": readiness.ready}
+
+
+@app.get("/ready")
+def ready():
+    """200 once the embedder is loaded and warmed up, 503 before."""
+    if not readiness.ready:
+        raise HTTPException(status_code=503, detail=readiness.status())
+    return readiness.status()
+
+
+@app.post("/reload")
+def reload_index(req: ReloadRequest):
+    """Hot-reload hook: drop a cached index (or all) so the next query reads it from disk."""
+    removed = index_cache.invalidate(req.cache_key)
+    result_cache.invalidate(req.cache_key)
+    schema_models.invalidate(req.cache_key)
+    return {"invalidated": removed, "cache_key": req.cache_key}
+
+
+@app.get("/schema/{cache_key}")
+def schema_model(cache_key: str, kind: str | None = None, path_prefix: str | None = None):
+    """Parsed schema model for an indexed XSD, optionally filtered by kind or path prefix (``/Root``, ``#TypeName``)."""
+    model = schema_models.get(cache_key)
+    if model is None:
+        raise HTTPException(status_code=404, detail="Schema model not found; run template fetch first")
+    if kind is None and path_prefix is None:
+        return model
+    chunks = [
+        c for c in model["chunks"]
+        if (kind is None or c["kind"] == kind) and (path_prefix is None or c["path"].startswith(path_prefix))
+    ]
+    return {**model, "chunks": chunks}
+
+
+@app.get("/metrics/index_cache")
+def index_cache_metrics():
+    return index_cache.stats()
+
+
+@app.get("/metrics/result_cache")
+def result_cache_metrics():
+    return result_cache.stats()
+
+
+@app.get("/metrics/embedding_cache")
+def embedding_cache_metrics():
+    return embedding_cache.stats()
 
 
@@ -0,0 +1,67 @@
+"""Cache of top-k retrieval results for the RAG service."""
+from collections import OrderedDict
+import threading
+
+from packages.shared.embedding_cache import normalize_text
+
+
+class ResultCache:
+    """LRU cache of results keyed by (cache_key, query, k, index version).
+
+    The index version is a content hash, so a rebuilt index never serves
+    stale results; ``invalidate`` also drops a key's entries eagerly when
+    template_fetcher reports a rebuild.
+    """
+
+    def __init__(self, max_entries: int = 5000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, list[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(cache_key: str, query: str, k: int, version: str) -> tuple:
+        return (cache_key, normalize_text(query), k, version)
+
+    def get(self, key: tuple) -> list[dict] | None:
+        with self._lock:
+            results = self._entries.get(key)
+            if results is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return results
+
+    def put(self, key: tuple, results: list[dict]) -> None:
+        with self._lock:
+            self._entries[key] = results
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, cache_key: str | None = None) -> int:
+        """Drop results for one index, or for every index when cache_key is None."""
+        with self._lock:
+            stale = [key for key in self._entries if cache_key is None or key[0] == cache_key]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+            return len(stale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
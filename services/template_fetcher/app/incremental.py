@@ -0,0 +1,202 @@
+"""Incremental re-indexing for template_fetcher.
+
+Each index has a ``{cache_key}.manifest.json`` recording the hash of the XSD
+it was built from and a stable vector id for every corpus line (keyed by the
+line's hash). On re-index an unchanged XSD is skipped outright; otherwise
+only new lines are embedded and added, and vectors for lines that disappeared
+are removed by id. Line ``i`` of the ``.txt`` corpus holds the text for
+vector id ``i``; removed ids leave a blank line so the other ids stay valid.
+
+Lines are embedded in fixed-size batches, and each batch is added to the
+index before the next is encoded. Peak vector memory is one batch plus the
+IVF training sample, whatever the corpus size; the sample's vectors are
+added to the index too, so no line is embedded twice. Batches can be staged as
+float16 (``staging_dtype``); they are widened back to float32 only when
+handed to FAISS.
+"""
+from dataclasses import dataclass, field
+import hashlib
+import json
+import os
+from typing import Callable, Iterable, Iterator
+
+import faiss
+import numpy as np
+
+from packages.shared.atomic_files import atomic_path
+from .index_builder import choose_index_type, needs_training, new_index, training_indices
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def line_hash(line: str) -> str:
+    return hashlib.sha1(line.encode("utf-8")).hexdigest()
+
+
+def manifest_path(index_dir: str, cache_key: str) -> str:
+    return os.path.join(index_dir, f"{cache_key}.manifest.json")
+
+
+@dataclass
+class IndexManifest:
+    xsd_sha256: str = ""
+    index_type: str = ""
+    next_id: int = 0
+    line_ids: dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, index_dir: str, cache_key: str) -> "IndexManifest | None":
+        path = manifest_path(index_dir, cache_key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def save(self, index_dir: str, cache_key: str) -> None:
+        with atomic_path(manifest_path(index_dir, cache_key)) as tmp:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.__dict__, f)
+
+
+@dataclass
+class IndexUpdate:
+    index: faiss.Index
+    params: dict
+    manifest: IndexManifest
+    lines: dict[str, str]
+    added: int = 0
+    removed: int = 0
+    rebuilt: bool = False
+
+
+def is_unchanged(index_dir: str, cache_key: str, xsd_sha256: str, index_type: str = "auto") -> bool:
+    """True when the index on disk was built from exactly this XSD (and index type)."""
+    manifest = IndexManifest.load(index_dir, cache_key)
+    return (
+        manifest is not None
+        and manifest.xsd_sha256 == xsd_sha256
+        and index_type in ("auto", manifest.index_type)
+        and os.path.exists(os.path.join(index_dir, f"{cache_key}.faiss"))
+        and os.path.exists(os.path.join(index_dir, f"{cache_key}.txt"))
+    )
+
+
+class BatchEncoder:
+    """Embeds texts batch by batch, staging vectors in ``staging_dtype``."""
+
+    def __init__(self, encode: Callable[[list[str]], np.ndarray], batch_size: int = 256,
+                 staging_dtype: str = "float32", progress: Callable[[int, int], None] | None = None):
+        self.encode = encode
+        self.batch_size = batch_size
+        self.staging_dtype = np.dtype(staging_dtype)
+        self.progress = progress
+
+    def batches(self, texts: list[str], report: bool = True, done: int = 0,
+                total: int | None = None) -> Iterator[tuple[int, np.ndarray]]:
+        """Yield (offset, vectors) for consecutive slices of ``texts``.
+
+        Progress is reported as ``done + offset`` of ``total`` (default: ``len(texts)``),
+        so one job's progress can span several calls.
+        """
+        total = len(texts) if total is None else total
+        for start in range(0, len(texts), self.batch_size):
+            if report and self.progress is not None:
+                self.progress(done + start, total)
+            vectors = self.encode(texts[start:start + self.batch_size])
+            yield start, np.asarray(vectors, dtype=self.staging_dtype)
+
+    def stack(self, texts: list[str], report: bool = False, total: int | None = None) -> np.ndarray:
+        return np.concatenate([vectors for _, vectors in self.batches(texts, report, total=total)])
+
+
+def as_float32(vectors: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def _add_batches(index: faiss.Index, batches: Iterable[tuple[int, np.ndarray]], ids: np.ndarray) -> None:
+    """Add each (offset, vectors) batch under ``ids[offset:offset + len(vectors)]``."""
+    for offset, vectors in batches:
+        index.add_with_ids(as_float32(vectors), ids[offset:offset + len(vectors)])
+
+
+def _build(lines: dict[str, str], encoder: BatchEncoder, index_type: str, xsd_sha256: str) -> IndexUpdate:
+    hashes = list(lines)
+    texts = [lines[h] for h in hashes]
+    if not texts:
+        raise ValueError("Cannot build an index from an empty corpus")
+    if index_type == "auto":
+        index_type = choose_index_type(len(texts))
+
+    ids = np.arange(len(texts), dtype=np.int64)
+    if needs_training(index_type):
+        sample = training_indices(len(texts)).astype(np.int64)
+        train = encoder.stack([texts[i] for i in sample], report=True, total=len(texts))
+        index, params = new_index(train.shape[1], len(texts), index_type, train, with_ids=True)
+        # The training sample is already embedded: add it, in batches, then embed only the rest
+        _add_batches(index, ((start, train[start:start + encoder.batch_size])
+                             for start in range(0, len(train), encoder.batch_size)), sample)
+        del train
+        rest = np.setdiff1d(ids, sample, assume_unique=True)
+        _add_batches(index, encoder.batches([texts[i] for i in rest], done=len(sample), total=len(texts)), rest)
+    else:
+        batches = encoder.batches(texts)
+        # The first batch tells us the dimension
+        first = next(batches)
+        index, params = new_index(first[1].shape[1], len(texts), index_type, with_ids=True)
+        _add_batches(index, [first], ids)
+        _add_batches(index, batches, ids)
+    params["ntotal"] = int(index.ntotal)
+
+    manifest = IndexManifest(
+        xsd_sha256=xsd_sha256,
+        index_type=params["index_type"],
+        next_id=len(hashes),
+        line_ids=dict(zip(hashes, range(len(hashes)))),
+    )
+    return IndexUpdate(index, params, manifest, lines, added=len(hashes), rebuilt=True)
+
+
+def update_index(index: faiss.Index | None, params: dict, manifest: IndexManifest | None, corpus: Iterable[str],
+                 encoder: BatchEncoder, index_type: str = "auto", xsd_sha256: str = "") -> IndexUpdate:
+    """Bring ``index`` in line with ``corpus``, embedding only lines it lacks.
+
+    Builds from scratch when there is no usable existing index (first fetch,
+    an index written before manifests existed, or a different explicit
+    index_type), or when lines must be removed from an HNSW index, which
+    does not support deletion.
+    """
+    lines = {line_hash(line): line for line in corpus}
+    if index is None or manifest is None or index_type not in ("auto", manifest.index_type):
+        return _build(lines, encoder, index_type, xsd_sha256)
+
+    removed = [i for h, i in manifest.line_ids.items() if h not in lines]
+    added = [h for h in lines if h not in manifest.line_ids]
+    if removed and manifest.index_type == "hnsw":
+        return _build(lines, encoder, "hnsw", xsd_sha256)
+
+    if removed:
+        index.remove_ids(np.array(removed, dtype=np.int64))
+    if added:
+        _add_batches(index, encoder.batches([lines[h] for h in added]),
+                     np.arange(manifest.next_id, manifest.next_id + len(added), dtype=np.int64))
+        manifest.line_ids.update(zip(added, range(manifest.next_id, manifest.next_id + len(added))))
+        manifest.next_id += len(added)
+    for h in set(manifest.line_ids) - set(lines):
+        del manifest.line_ids[h]
+    manifest.xsd_sha256 = xsd_sha256
+    params = {**params, "ntotal": int(index.ntotal)}
+    return IndexUpdate(index, params, manifest, lines, added=len(added), removed=len(removed))
+
+
+def corpus_by_id(manifest: IndexManifest, lines: dict[str, str]) -> Iterator[str]:
+    """Corpus lines in vector id order, blank where an id was removed."""
+    by_id = {i: h for h, i in manifest.line_ids.items()}
+    for i in range(manifest.next_id):
+        h = by_id.get(i)
+        yield lines[h] if h is not None else ""
@@ -0,0 +1,134 @@
+"""FAISS index construction for template_fetcher.
+
+Small corpora use an exact ``IndexFlatIP``. Larger ones can use approximate
+indexes (IVF-Flat, IVF-PQ or HNSW), trained on a sample of the corpus. Each
+index's search settings (nprobe / efSearch) are saved in a
+``{cache_key}.params.json`` file next to it, and the RAG service applies them
+when it loads the index.
+"""
+import math
+import os
+
+import faiss
+import numpy as np
+
+from packages.shared.index_params import apply_search_params
+
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# Automatic selection thresholds (number of vectors)
+FLAT_MAX_VECTORS = int(os.getenv("FLAT_MAX_VECTORS", "20000"))
+IVF_FLAT_MAX_VECTORS = int(os.getenv("IVF_FLAT_MAX_VECTORS", "1000000"))
+
+MAX_TRAIN_VECTORS = int(os.getenv("MAX_TRAIN_VECTORS", "100000"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+
+
+def choose_index_type(n_vectors: int) -> str:
+    """Pick an index type from the corpus size."""
+    if n_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if n_vectors <= IVF_FLAT_MAX_VECTORS:
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def _nlist(n_vectors: int) -> int:
+    # ~4*sqrt(n) lists, with at least 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def _pq_subquantizers(dim: int) -> int:
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dim % m == 0 and dim // m >= 4:
+            return m
+    return 1
+
+
+def create_index(dim: int, n_vectors: int, index_type: str = "auto") -> tuple[faiss.Index, dict]:
+    """Create an empty (untrained) inner-product index and its search params."""
+    if index_type == "auto":
+        index_type = choose_index_type(n_vectors)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    params: dict = {"index_type": index_type, "dim": dim}
+    if index_type == "flat":
+        return faiss.IndexFlatIP(dim), params
+
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        params.update({"M": HNSW_M, "efConstruction": HNSW_EF_CONSTRUCTION, "efSearch": HNSW_EF_SEARCH})
+        return index, params
+
+    nlist = _nlist(n_vectors)
+    quantizer = faiss.IndexFlatIP(dim)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+        m = _pq_subquantizers(dim)
+        # 8-bit codes need 256 centroids per sub-space; use fewer bits for small corpora
+        nbits = 8 if n_vectors >= 256 * 39 else max(1, int(math.log2(max(2, n_vectors // 39))))
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, m, nbits, faiss.METRIC_INNER_PRODUCT)
+        params.update({"pq_m": m, "pq_nbits": nbits})
+    params.update({"nlist": nlist, "nprobe": min(nlist, IVF_NPROBE)})
+    return index, params
+
+
+def training_indices(n_vectors: int, max_vectors: int = MAX_TRAIN_VECTORS, seed: int = 0) -> np.ndarray:
+    """Sorted positions of a random subset used to train IVF centroids / PQ codebooks."""
+    if n_vectors <= max_vectors:
+        return np.arange(n_vectors)
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(n_vectors, size=max_vectors, replace=False))
+
+
+def training_sample(vectors: np.ndarray, max_vectors: int = MAX_TRAIN_VECTORS, seed: int = 0) -> np.ndarray:
+    """Random subset of the vectors to train IVF centroids / PQ codebooks."""
+    if len(vectors) <= max_vectors:
+        return vectors
+    return vectors[training_indices(len(vectors), max_vectors, seed)]
+
+
+def needs_training(index_type: str) -> bool:
+    return index_type in ("ivf_flat", "ivf_pq")
+
+
+def new_index(dim: int, n_vectors: int, index_type: str = "auto", train_vectors: np.ndarray | None = None,
+              with_ids: bool = False) -> tuple[faiss.Index, dict]:
+    """Create an empty index ready for ``add`` (or ``add_with_ids`` when ``with_ids``).
+
+    IVF types are trained on ``train_vectors``. Flat and HNSW indexes are
+    wrapped in an ``IndexIDMap2`` when ids are wanted; IVF indexes take ids
+    natively.
+    """
+    index, params = create_index(dim, n_vectors, index_type)
+    if not index.is_trained:
+        index.train(np.ascontiguousarray(train_vectors, dtype=np.float32))
+    if with_ids and params["index_type"] in ("flat", "hnsw"):
+        index = faiss.IndexIDMap2(index)
+    apply_search_params(index, params)
+    return index, params
+
+
+def build_index(vectors: np.ndarray, index_type: str = "auto",
+                ids: np.ndarray | None = None) -> tuple[faiss.Index, dict]:
+    """Create, train and fill an index for ``vectors`` (normalized float32).
+
+    With ``ids`` the vectors are added under those ids, so they can later be
+    removed or extended without renumbering.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index, params = new_index(vectors.shape[1], len(vectors), index_type, training_sample(vectors),
+                              with_ids=ids is not None)
+    if ids is None:
+        index.add(vectors)
+    else:
+        index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    params["ntotal"] = int(index.ntotal)
+    return index, params
@@ -0,0 +1,165 @@
+"""Background indexing jobs for template_fetcher.
+
+Fetch requests are queued as jobs rather than run inside the request
+handler. Jobs run on the event loop, and their blocking steps (hashing,
+parsing, embedding, writing the index) go to a thread pool, so one large
+schema does not stall every other caller. At most one job per cache_key is
+active at a time; a second request for the same key gets the running job.
+
+Cancellation is cooperative. A queued job is dropped immediately. A running
+job stops at its next progress checkpoint, which is always before any index
+file is written.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+import asyncio
+import threading
+import time
+import uuid
+
+from fastapi import HTTPException
+
+
+ACTIVE_STATES = ("queued", "running")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    cache_key: str
+    kind: str
+    status: str = "queued"  # queued | running | succeeded | failed | cancelled
+    stage: str = "queued"
+    progress: float = 0.0
+    result: dict | None = None
+    error: str | None = None
+    error_status: int | None = None  # HTTP status for a failed job: the HTTPException's, else 500
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    cancel_requested: threading.Event = field(default_factory=threading.Event, repr=False)
+    task: asyncio.Task | None = field(default=None, repr=False)
+
+    def update(self, stage: str, progress: float | None = None) -> None:
+        """Record progress; raises JobCancelled if cancellation was requested."""
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+        self.stage = stage
+        if progress is not None:
+            self.progress = round(min(max(progress, 0.0), 1.0), 4)
+
+    async def wait(self) -> "Job":
+        if self.task is not None:
+            await asyncio.wait({self.task})
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "cache_key": self.cache_key,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """Runs indexing jobs, at most ``workers`` at a time, deduplicated by cache_key."""
+
+    def __init__(self, workers: int = 2, history: int = 200):
+        self.workers = workers
+        self.history = history
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="indexer")
+        self._slots = asyncio.Semaphore(workers)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active: dict[str, Job] = {}
+
+    def submit(self, cache_key: str, kind: str, work: Callable[[Job], Awaitable[dict]]) -> tuple[Job, bool]:
+        """Start a job, or return the active job for ``cache_key``. The bool is True if a new job was created."""
+        active = self._active.get(cache_key)
+        if active is not None:
+            return active, False
+        job = Job(id=uuid.uuid4().hex, cache_key=cache_key, kind=kind)
+        self._jobs[job.id] = job
+        self._active[cache_key] = job
+        job.task = asyncio.create_task(self._run(job, work))
+        job.task.add_done_callback(lambda _: self._finish(job))
+        self._trim()
+        return job, True
+
+    async def _run(self, job: Job, work: Callable[[Job], Awaitable[dict]]) -> None:
+        try:
+            async with self._slots:
+                job.update("starting", 0.0)
+                job.status = "running"
+                job.started_at = time.time()
+                job.result = await work(job)
+                job.status = "succeeded"
+                job.stage = "done"
+                job.progress = 1.0
+        except (JobCancelled, asyncio.CancelledError):
+            job.status = "cancelled"
+        except HTTPException as e:
+            job.status = "failed"
+            job.error = str(e.detail)
+            job.error_status = e.status_code
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.error_status = 500
+
+    def _finish(self, job: Job) -> None:
+        # Also runs for a task cancelled before it ever started
+        if job.status in ACTIVE_STATES:
+            job.status = "cancelled"
+        job.finished_at = time.time()
+        if self._active.get(job.cache_key) is job:
+            del self._active[job.cache_key]
+
+    async def run_blocking(self, fn: Callable, *args):
+        """Run a blocking step of a job on the indexing thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def list(self, status: str | None = None) -> list[Job]:
+        return [job for job in self._jobs.values() if status is None or job.status == status]
+
+    def cancel(self, job_id: str) -> Job | None:
+        job = self._jobs.get(job_id)
+        if job is None or job.status not in ACTIVE_STATES:
+            return job
+        job.cancel_requested.set()
+        if job.status == "queued" and job.task is not None:
+            # Still waiting for a slot, so nothing has run yet
+            job.task.cancel()
+        return job
+
+    def _trim(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status not in ACTIVE_STATES]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def shutdown(self) -> None:
+        for job in self._active.values():
+            job.cancel_requested.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        counts: dict[str, int] = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "active": len(self._active), "jobs": counts}
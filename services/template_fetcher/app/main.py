@@ -1,12 +1,31 @@
-from fastapi import FastAPI, HTTPException
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, HTTPException, Response
 from pydantic import BaseModel, HttpUrl
+import asyncio
 import os
+import shutil
+import threading
+import uuid
 import httpx
 import xmlschema
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
+from itertools import islice
 from pathlib import Path
+from typing import Iterable
+from packages.shared.http_clients import ServiceClients, ServiceConfig
+from packages.shared.embedding_cache import EmbeddingCache
+from packages.shared.atomic_files import atomic_path
+from packages.shared.index_params import file_stamp, load_params, save_params
+from packages.shared.readiness import Readiness
+from packages.shared.schema_model import (build_schema_model, chunk_text, load_schema_model, save_schema_model,
+                                          schema_model_path)
+from .incremental import BatchEncoder, IndexManifest, IndexUpdate, corpus_by_id, file_sha256, is_unchanged, update_index
+from .index_builder import INDEX_TYPES
+from .jobs import Job, JobManager
 
 
 app = FastAPI(title="Template Fetcher")
@@ -14,108 +33,257 @@ app = FastAPI(title="Template Fetcher")
 TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", "/data/templates")
 INDEX_DIR = os.getenv("INDEX_DIR", "/data/indexes")
 EMBED_MODEL_NAME = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+RAG_SERVICE_URL = os.getenv("RAG_SERVICE_URL", "http://127.0.0.1:8083")
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "50000"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "86400"))
+EMBED_CACHE_REDIS_URL = os.getenv("EMBED_CACHE_REDIS_URL")
+INDEX_WORKERS = int(os.getenv("INDEX_WORKERS", "2"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+EMBED_STAGING_DTYPE = os.getenv("EMBED_STAGING_DTYPE", "float32")  # float32 | float16
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "true").lower() in ("1", "true", "yes")
 
 os.makedirs(TEMPLATES_DIR, exist_ok=True)
 os.makedirs(INDEX_DIR, exist_ok=True)
 
 _embedder: SentenceTransformer | None = None
+_embedder_lock = threading.Lock()
+
+# Embeddings of schema lines; unchanged lines are not re-encoded on re-index
+embedding_cache = EmbeddingCache(EMBED_MODEL_NAME, max_entries=EMBED_CACHE_SIZE, ttl_seconds=EMBED_CACHE_TTL,
+                                 redis_url=EMBED_CACHE_REDIS_URL)
+
+# Indexing runs as background jobs on a small thread pool
+jobs = JobManager(workers=INDEX_WORKERS)
+
+# Pooled client used to tell the RAG service about rebuilt indexes
+clients = ServiceClients({
+    "rag": ServiceConfig(RAG_SERVICE_URL, timeout=5),
+})
+
+
+readiness = Readiness("template_fetcher", import_seconds=time.perf_counter() - _import_started)
+
+
+@app.on_event("startup")
+async def startup():
+    await clients.start()
+    if PRELOAD_MODELS:
+        readiness.start_warm_up(lambda: asyncio.to_thread(warm_up))
+    else:
+        readiness.mark_ready()  # lazy loading: the first index job pays the load
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    readiness.stop()
+    jobs.shutdown()
+    await clients.close()
 
 
 def get_embedder() -> SentenceTransformer:
     global _embedder
-    if _embedder is None:
-        _embedder = SentenceTransformer(EMBED_MODEL_NAME)
+    with _embedder_lock:
+        if _embedder is None:
+            _embedder = SentenceTransformer(EMBED_MODEL_NAME)
     return _embedder
 
 
+def warm_up() -> None:
+    """Load the embedder and run one encode, bypassing the embedding cache."""
+    with readiness.phase("weight_load"):
+        embedder = get_embedder()
+    with readiness.phase("first_forward"):
+        embedder.encode(["warm up"], normalize_embeddings=True)
+
+
 class FetchRequest(BaseModel):
     xsd_url: HttpUrl | None = None
     xsd_file: str | None = None
     cache_key: str | None = None
+    index_type: str = "auto"  # auto | flat | ivf_flat | ivf_pq | hnsw
 
 
-def extract_xsd_text(xsd_path: str) -> list[str]:
-    """Extract text from XSD for indexing."""
-    schema = xmlschema.XMLSchema(xsd_path)
-    lines: list[str] = []
-    
-    # Extract element definitions
-    for qname, elem in schema.elements.items():
-        lines.append(f"element:{qname} type={getattr(elem.type, 'name', '')}")
-    
-    # Extract type definitions
-    for qname, typ in schema.types.items():
-        lines.append(f"type:{qname}")
-    
-    # Extract attribute definitions
-    for qname, attr in schema.attributes.items():
-        lines.append(f"attribute:{qname} type={getattr(attr.type, 'name', '')}")
-    
-    # Extract complex type content
-    for qname, typ in schema.types.items():
-        if hasattr(typ, 'content'):
-            lines.append(f"complex_type:{qname} content={str(typ.content)[:100]}")
-    
-    return lines
+def extract_schema_model(xsd_path: str, xsd_sha256: str = "") -> dict:
+    """Compile the XSD once and describe it as structured chunks (see packages.shared.schema_model)."""
+    return build_schema_model(xmlschema.XMLSchema(xsd_path), xsd_sha256)
 
 
-@app.post("/fetch")
-async def fetch(req: FetchRequest):
-    """Fetch and index XSD from URL or local file."""
-    if req.xsd_url:
-        # Download from URL
-        cache_key = req.cache_key or os.path.basename(str(req.xsd_url))
-        xsd_path = os.path.join(TEMPLATES_DIR, cache_key)
-        
-        if not os.path.exists(xsd_path):
+async def notify_index_updated(cache_key: str):
+    """Ask the RAG service to drop its cached copy of a rebuilt index."""
+    try:
+        r = await clients.get("rag").post("/reload", json={"cache_key": cache_key})
+        if r.status_code != 200:
+            print(f"Warning: RAG reload for {cache_key} failed: {r.status_code}")
+    except Exception as e:
+        print(f"Warning: RAG reload notification failed for {cache_key}: {e}")
+
+
+def batch_encoder(job: Job) -> BatchEncoder:
+    """Batched embedder for a job, reporting progress (0.3 -> 0.9) and honouring cancellation."""
+    return BatchEncoder(
+        lambda texts: embedding_cache.encode(get_embedder(), texts),
+        batch_size=EMBED_BATCH_SIZE,
+        staging_dtype=EMBED_STAGING_DTYPE,
+        progress=lambda done, total: job.update("embedding", 0.3 + 0.6 * done / total),
+    )
+
+
+def write_index(job: Job, cache_key: str, corpus: Iterable[str], index_type: str = "auto",
+                xsd_sha256: str = "") -> IndexUpdate:
+    """Bring the index for ``cache_key`` up to date with ``corpus`` (blocking).
+
+    Only lines the existing index lacks are embedded; vectors for lines that
+    are gone are removed by id. Every file is replaced atomically, in the
+    order index, corpus, params (stamped with the first two and a fresh
+    ``version``), manifest, so RAG never loads a partial file and can detect
+    a mismatched pair.
+    """
+    index_path = os.path.join(INDEX_DIR, f"{cache_key}.faiss")
+    manifest = IndexManifest.load(INDEX_DIR, cache_key)
+    index = faiss.read_index(index_path) if manifest is not None and os.path.exists(index_path) else None
+    update = update_index(index, load_params(INDEX_DIR, cache_key), manifest, corpus,
+                          batch_encoder(job),
+                          index_type=index_type, xsd_sha256=xsd_sha256)
+
+    job.update("writing", 0.95)
+    if update.rebuilt or update.added or update.removed:
+        with atomic_path(index_path) as tmp:
+            faiss.write_index(update.index, tmp)
+        meta_path = os.path.join(INDEX_DIR, f"{cache_key}.txt")
+        with atomic_path(meta_path) as tmp:
+            with open(tmp, "w", encoding="utf-8") as f:
+                for line in corpus_by_id(update.manifest, update.lines):
+                    f.write(line + "\n")
+        update.params["files"] = {"faiss": file_stamp(index_path), "txt": file_stamp(meta_path)}
+        update.params["version"] = uuid.uuid4().hex[:16]
+        save_params(INDEX_DIR, cache_key, update.params)
+    # Saved even when no line changed (e.g. only XSD comments did) to record the new hash
+    update.manifest.save(INDEX_DIR, cache_key)
+    return update
+
+
+def index_xsd(job: Job, cache_key: str, source_path: str, index_type: str = "auto") -> dict:
+    """Index an XSD and copy it into the templates directory, unless it is unchanged (blocking).
+
+    The copy and the schema model are written after the index, so a job
+    cancelled before its "writing" checkpoint leaves no files behind.
+    """
+    xsd_path = os.path.join(TEMPLATES_DIR, cache_key)
+    job.update("hashing", 0.1)
+    xsd_sha256 = file_sha256(source_path)
+    if (is_unchanged(INDEX_DIR, cache_key, xsd_sha256, index_type)
+            and load_schema_model(INDEX_DIR, cache_key, xsd_sha256) is not None):
+        manifest = IndexManifest.load(INDEX_DIR, cache_key)
+        return {
+            "cache_key": cache_key,
+            "xsd_path": xsd_path,
+            "index_path": os.path.join(INDEX_DIR, f"{cache_key}.faiss"),
+            "index_type": manifest.index_type,
+            "status": "unchanged",
+            "items_indexed": len(manifest.line_ids),
+        }
+
+    job.update("parsing", 0.2)
+    try:
+        model = extract_schema_model(source_path, xsd_sha256)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"XSD parse error: {e}")
+
+    corpus = (chunk_text(chunk) for chunk in model["chunks"])
+    update = write_index(job, cache_key, corpus, index_type, xsd_sha256)
+    if os.path.abspath(source_path) != os.path.abspath(xsd_path):
+        shutil.copy2(source_path, xsd_path)
+    save_schema_model(INDEX_DIR, cache_key, model)
+    return {
+        "cache_key": cache_key,
+        "xsd_path": xsd_path,
+        "index_path": os.path.join(INDEX_DIR, f"{cache_key}.faiss"),
+        "index_type": update.params["index_type"],
+        "index_params": update.params,
+        "status": "rebuilt" if update.rebuilt else "updated",
+        "items_indexed": len(update.manifest.line_ids),
+        "items_added": update.added,
+        "items_removed": update.removed,
+        "corpus_preview": list(islice(update.lines.values(), 5))  # Show first 5 items
+    }
+
+
+async def run_index_job(job: Job, cache_key: str, source_path: str | None = None, xsd_url: str | None = None,
+                        index_type: str = "auto") -> dict:
+    """Job body: download if needed, index on the worker pool, then notify the RAG service."""
+    if xsd_url:
+        source_path = os.path.join(TEMPLATES_DIR, cache_key)
+        if not os.path.exists(source_path):
+            job.update("downloading", 0.05)
             async with httpx.AsyncClient(timeout=60) as client:
-                r = await client.get(str(req.xsd_url))
+                r = await client.get(xsd_url)
                 if r.status_code != 200:
                     raise HTTPException(status_code=400, detail=f"Failed to download XSD: {r.status_code}")
-                with open(xsd_path, "wb") as f:
+                with open(source_path, "wb") as f:
                     f.write(r.content)
-    
+
+    result = await jobs.run_blocking(index_xsd, job, cache_key, source_path, index_type)
+    if result["status"] != "unchanged":
+        await notify_index_updated(cache_key)
+    return result
+
+
+@app.post("/fetch")
+async def fetch(req: FetchRequest, response: Response, wait: bool = False):
+    """Queue fetching and indexing an XSD from a URL or local file.
+
+    Returns the job at once (202); poll ``/jobs/{job_id}`` for progress. A
+    request for a cache_key that already has an active job gets that job.
+    With ``wait=true`` the response is sent when the job finishes: the
+    indexing result (``items_indexed``, ``xsd_path``, ``index_path``, ...)
+    with 200, or the job's error with its status code (400 for a bad XSD).
+    """
+    if req.index_type != "auto" and req.index_type not in INDEX_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unknown index_type: {req.index_type}")
+
+    if req.xsd_url:
+        cache_key = req.cache_key or os.path.basename(str(req.xsd_url))
+        work = lambda job: run_index_job(job, cache_key, xsd_url=str(req.xsd_url), index_type=req.index_type)
     elif req.xsd_file:
-        # Use local file
         cache_key = req.cache_key or os.path.basename(req.xsd_file)
-        local_path = Path(req.xsd_file)
-        if not local_path.exists():
+        if not Path(req.xsd_file).exists():
             raise HTTPException(status_code=404, detail=f"Local XSD file not found: {req.xsd_file}")
-        
-        xsd_path = os.path.join(TEMPLATES_DIR, cache_key)
-        # Copy local file to templates directory
-        import shutil
-        shutil.copy2(local_path, xsd_path)
-    
+        work = lambda job: run_index_job(job, cache_key, source_path=req.xsd_file, index_type=req.index_type)
     else:
         raise HTTPException(status_code=400, detail="Either xsd_url or xsd_file must be provided")
 
-    try:
-        corpus = extract_xsd_text(xsd_path)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"XSD parse error: {e}")
+    job, created = jobs.submit(cache_key, "fetch", work)
+    if not wait:
+        response.status_code = 202
+        return {**job.to_dict(), "deduplicated": not created}
 
-    model = get_embedder()
-    vectors = model.encode(corpus, normalize_embeddings=True)
-    dim = vectors.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(np.array(vectors, dtype=np.float32))
+    await job.wait()
+    if job.status == "failed":
+        raise HTTPException(status_code=job.error_status or 500, detail=job.error)
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job {job.id} was {job.status}")
+    return {**job.result, "job_id": job.id, "deduplicated": not created}
 
-    index_path = os.path.join(INDEX_DIR, f"{cache_key}.faiss")
-    faiss.write_index(index, index_path)
 
-    meta_path = os.path.join(INDEX_DIR, f"{cache_key}.txt")
-    with open(meta_path, "w", encoding="utf-8") as f:
-        for line in corpus:
-            f.write(line + "\n")
+@app.get("/jobs")
+def list_jobs(status: str | None = None):
+    return {"jobs": [job.to_dict() for job in jobs.list(status)], **jobs.stats()}
 
-    return {
-        "cache_key": cache_key, 
-        "xsd_path": xsd_path, 
-        "index_path": index_path, 
-        "items_indexed": len(corpus),
-        "corpus_preview": corpus[:5]  # Show first 5 items
-    }
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str):
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 
 @app.get("/")
@@ -125,7 +293,20 @@ def root():
 
 @app.get("/health")
 def health():
-    return {"ok": True}
+    return {"ok": True, "ready": readiness.ready}
+
+
+@app.get("/ready")
+def ready():
+    """200 once the embedder is loaded and warmed up, 503 before."""
+    if not readiness.ready:
+        raise HTTPException(status_code=503, detail=readiness.status())
+    return readiness.status()
+
+
+@app.get("/metrics/embedding_cache")
+def embedding_cache_metrics():
+    return embedding_cache.stats()
 
 
 @app.get("/list")
@@ -150,6 +331,7 @@ def list_templates():
                 "xsd_path": os.path.join(TEMPLATES_DIR, file),
                 "has_index": os.path.exists(index_path),
                 "has_meta": os.path.exists(meta_path),
+                "has_schema_model": os.path.exists(schema_model_path(INDEX_DIR, cache_key)),
                 "size_bytes": os.path.getsize(os.path.join(TEMPLATES_DIR, file)),
                 "format_type": format_type
             })
@@ -172,53 +354,42 @@ async def fetch_builtin_formats():
         }
     ]
     
+    submitted = []
     results = []
     for format_info in builtin_formats:
-        try:
-            # Check if file exists
-            if not os.path.exists(format_info["path"]):
-                results.append({
-                    "name": format_info["name"],
-                    "status": "error",
-                    "message": f"File not found: {format_info['path']}"
-                })
-                continue
-            
-            # Copy to templates directory
-            cache_key = format_info["name"]
-            xsd_path = os.path.join(TEMPLATES_DIR, cache_key)
-            import shutil
-            shutil.copy2(format_info["path"], xsd_path)
-            
-            # Index the XSD
-            corpus = extract_xsd_text(xsd_path)
-            model = get_embedder()
-            vectors = model.encode(corpus, normalize_embeddings=True)
-            dim = vectors.shape[1]
-            index = faiss.IndexFlatIP(dim)
-            index.add(np.array(vectors, dtype=np.float32))
-
-            index_path = os.path.join(INDEX_DIR, f"{cache_key}.faiss")
-            faiss.write_index(index, index_path)
+        # Check if file exists
+        if not os.path.exists(format_info["path"]):
+            results.append({
+                "name": format_info["name"],
+                "status": "error",
+                "message": f"File not found: {format_info['path']}"
+            })
+            continue
+        cache_key = format_info["name"]
+        job, _ = jobs.submit(cache_key, "fetch_builtin",
+                             lambda job, info=format_info: run_index_job(job, info["name"], source_path=info["path"]))
+        submitted.append((format_info, job))
 
-            meta_path = os.path.join(INDEX_DIR, f"{cache_key}.txt")
-            with open(meta_path, "w", encoding="utf-8") as f:
-                for line in corpus:
-                    f.write(line + "\n")
-            
+    for format_info, job in submitted:
+        await job.wait()
+        if job.status == "succeeded":
             results.append({
                 "name": format_info["name"],
-                "status": "success",
-                "cache_key": cache_key,
-                "items_indexed": len(corpus),
+                "status": "unchanged" if job.result["status"] == "unchanged" else "success",
+                "cache_key": job.cache_key,
+                "job_id": job.id,
+                "index_type": job.result["index_type"],
+                "items_indexed": job.result["items_indexed"],
+                "items_added": job.result.get("items_added", 0),
+                "items_removed": job.result.get("items_removed", 0),
                 "description": format_info["description"]
             })
-            
-        except Exception as e:
+        else:
             results.append({
                 "name": format_info["name"],
                 "status": "error",
-                "message": str(e)
+                "job_id": job.id,
+                "message": job.error or job.status
             })
     
     return {"results": results}
@@ -0,0 +1,109 @@
+"""Bulk validation of many documents against one schema on a process pool.
+
+Documents are sent to worker processes in chunks. Each worker keeps its own
+SchemaCache, so a schema is compiled once per worker and then reused for every
+later chunk and batch that targets it. Workers are spawned rather than
+forked: the service process runs threads (uvicorn, the schema cache) whose
+locks a forked child could inherit in a held state.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Iterable
+import asyncio
+import multiprocessing
+import os
+
+from .fast_validation import fast_validate, parse_xml, xmlschema_errors
+from .schema_cache import SchemaCache
+
+
+VALIDATE_WORKERS = int(os.getenv("VALIDATE_WORKERS", str(os.cpu_count() or 1)))
+VALIDATE_CHUNK_SIZE = int(os.getenv("VALIDATE_CHUNK_SIZE", "64"))
+VALIDATION_MODES = ("fast", "full")
+
+_pool: ProcessPoolExecutor | None = None
+_worker_cache: SchemaCache | None = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=VALIDATE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def full_validate(schema_cache: SchemaCache, cache_key: str, xsd_path: str, xml_string: str) -> dict:
+    """Validate with xmlschema, collecting every error."""
+    xml_doc, errors = parse_xml(xml_string)
+    if xml_doc is not None:
+        errors = xmlschema_errors(schema_cache.get(cache_key, xsd_path), xml_doc)
+    result = {"valid": not errors, "engine": "xmlschema", "error_count": len(errors), "errors": errors}
+    if errors:
+        result["error"] = errors[0]["message"]
+    return result
+
+
+def validate_chunk(cache_key: str, xsd_path: str, mode: str, chunk: list[tuple[int, str | None, str]]) -> list[dict]:
+    """Validate a chunk of (index, id, xml_string) documents inside a worker process."""
+    global _worker_cache
+    if _worker_cache is None:
+        _worker_cache = SchemaCache(max_entries=4)
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"Unknown validation mode: {mode}")
+    validate = fast_validate if mode == "fast" else full_validate
+    results = []
+    for index, doc_id, xml_string in chunk:
+        try:
+            result = validate(_worker_cache, cache_key, xsd_path, xml_string)
+        except Exception as e:
+            result = {"valid": False, "error": f"Validation process failed: {str(e)}"}
+        result.update({"index": index, "id": doc_id})
+        results.append(result)
+    return results
+
+
+def _chunks(documents: Iterable, size: int) -> Iterable[list]:
+    chunk = []
+    for item in documents:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def stream_validation(documents: Iterable[tuple[int, str | None, str] | dict], cache_key: str,
+                            xsd_path: str, mode: str) -> AsyncIterator[dict]:
+    """Validate documents across the process pool, yielding results as chunks finish.
+
+    Items that are already dicts (e.g. malformed input lines) are passed
+    through as results. At most two chunks per worker are in flight.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    max_in_flight = VALIDATE_WORKERS * 2
+    pending = set()
+    for chunk in _chunks(documents, VALIDATE_CHUNK_SIZE):
+        work = [item for item in chunk if not isinstance(item, dict)]
+        for item in chunk:
+            if isinstance(item, dict):
+                yield item
+        if work:
+            pending.add(loop.run_in_executor(pool, validate_chunk, cache_key, xsd_path, mode, work))
+        if len(pending) >= max_in_flight:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                for result in future.result():
+                    yield result
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for future in done:
+            for result in future.result():
+                yield result
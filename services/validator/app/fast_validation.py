@@ -0,0 +1,83 @@
+"""Single-pass error collection for the validator's fast mode.
+
+Fast mode validates with libxml2 through ``lxml.etree.XMLSchema`` (XSD 1.0,
+runs in C) and reports every error with its line and column. Schemas that
+libxml2 cannot compile fall back to xmlschema's ``iter_errors``, which also
+collects all errors in one pass but is pure Python.
+"""
+import threading
+
+from lxml import etree
+import xmlschema
+
+
+class LxmlValidator:
+    """Compiled libxml2 schema with a lock around validation.
+
+    An ``etree.XMLSchema`` keeps its ``error_log`` on the schema object, so
+    concurrent validations with one instance must be serialised.
+    """
+
+    def __init__(self, xsd_path: str):
+        self.schema = etree.XMLSchema(etree.parse(xsd_path))
+        self._lock = threading.Lock()
+
+    def iter_errors(self, xml_doc) -> list[dict]:
+        with self._lock:
+            if self.schema.validate(xml_doc):
+                return []
+            return [
+                {
+                    "message": entry.message,
+                    "line": entry.line,
+                    "column": entry.column,
+                    "path": entry.path,
+                }
+                for entry in self.schema.error_log
+            ]
+
+
+def parse_xml(xml_string: str):
+    """Parse an XML string, returning (document, errors)."""
+    try:
+        return etree.fromstring(xml_string.encode("utf-8")), []
+    except etree.XMLSyntaxError as e:
+        line, column = e.position
+        return None, [{"message": f"XML parsing error: {e.msg}", "line": line, "column": column, "path": None}]
+
+
+def xmlschema_errors(schema: xmlschema.XMLSchema, xml_doc) -> list[dict]:
+    """Collect every xmlschema validation error for a parsed document."""
+    errors = []
+    for error in schema.iter_errors(xml_doc):
+        errors.append({
+            "message": error.reason or str(error.message),
+            "line": getattr(error, "sourceline", None),
+            "column": None,
+            "path": error.path,
+        })
+    return errors
+
+
+def fast_validate(schema_cache, cache_key: str, xsd_path: str, xml_string: str) -> dict:
+    """Validate with lxml when the schema allows it, otherwise with xmlschema.
+
+    Returns every error found in one pass rather than stopping at the first.
+    """
+    xml_doc, errors = parse_xml(xml_string)
+    if xml_doc is None:
+        return {"valid": False, "engine": "lxml", "error_count": len(errors), "errors": errors,
+                "error": errors[0]["message"]}
+
+    try:
+        engine = "lxml"
+        errors = schema_cache.get(cache_key, xsd_path, engine="lxml").iter_errors(xml_doc)
+    except etree.XMLSchemaParseError:
+        # Outside what libxml2 supports (e.g. XSD 1.1); use xmlschema for diagnostics
+        engine = "xmlschema"
+        errors = xmlschema_errors(schema_cache.get(cache_key, xsd_path), xml_doc)
+
+    result = {"valid": not errors, "engine": engine, "error_count": len(errors), "errors": errors}
+    if errors:
+        result["error"] = f"Schema validation failed: {errors[0]['message']}"
+    return result
@@ -1,22 +1,86 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+import json
 import os
+import tempfile
+import time
 import xmlschema
 from lxml import etree
+from .schema_cache import SchemaCache
+from .fast_validation import fast_validate
+from .batch import VALIDATE_WORKERS, VALIDATION_MODES, shutdown_pool, stream_validation
 
 
 app = FastAPI(title="XML Validator")
 
 TEMPLATES_DIR = os.getenv("TEMPLATES_DIR", "/data/templates")
+SCHEMA_CACHE_SIZE = int(os.getenv("SCHEMA_CACHE_SIZE", "16"))
+BATCH_SPOOL_BYTES = int(os.getenv("BATCH_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+# Map format types to XSD files
+FORMAT_MAPPING = {
+    "format1_complex": "format1_complex.xsd",
+    "format2_simple": "format2_simple.xsd"
+}
+
+schema_cache = SchemaCache(max_entries=SCHEMA_CACHE_SIZE)
 
 
 class ValidateRequest(BaseModel):
     xml_string: str
     cache_key: str
+    mode: str = "full"  # "full" (xmlschema, first error) or "fast" (lxml, all errors)
 
 class ValidateWithFormatRequest(BaseModel):
     xml_string: str
     format_type: str  # "format1_complex" or "format2_simple"
+    mode: str = "full"  # "full" (xmlschema, first error) or "fast" (lxml, all errors)
+
+class InvalidateRequest(BaseModel):
+    cache_key: str | None = None
+
+class BatchDocument(BaseModel):
+    xml_string: str
+    id: str | None = None
+
+class ValidateBatchRequest(BaseModel):
+    documents: list[BatchDocument | str]
+    format_type: str | None = None
+    cache_key: str | None = None
+    mode: str = "fast"
+
+
+@app.on_event("startup")
+def warm_schema_cache():
+    """Compile the built-in format schemas before the first request."""
+    for xsd_file in FORMAT_MAPPING.values():
+        xsd_path = os.path.join(TEMPLATES_DIR, xsd_file)
+        if not os.path.exists(xsd_path):
+            continue
+        try:
+            schema_cache.get(xsd_file, xsd_path)
+        except Exception as e:
+            print(f"Warning: Failed to precompile {xsd_file}: {e}")
+
+
+@app.on_event("shutdown")
+def stop_validation_pool():
+    shutdown_pool()
+
+
+def resolve_xsd(format_type: str | None, cache_key: str | None) -> tuple[str, str]:
+    """Map a format_type or cache_key to (cache_key, xsd_path)."""
+    if format_type:
+        if format_type not in FORMAT_MAPPING:
+            raise HTTPException(status_code=400, detail="Invalid format type")
+        cache_key = FORMAT_MAPPING[format_type]
+    if not cache_key:
+        raise HTTPException(status_code=400, detail="Either format_type or cache_key must be provided")
+    xsd_path = os.path.join(TEMPLATES_DIR, cache_key)
+    if not os.path.exists(xsd_path):
+        raise HTTPException(status_code=404, detail=f"XSD file not found: {cache_key}")
+    return cache_key, xsd_path
 
 
 @app.post("/validate")
@@ -25,8 +89,14 @@ def validate(req: ValidateRequest):
     if not os.path.exists(xsd_path):
         raise HTTPException(status_code=404, detail="XSD not found")
     
+    if req.mode == "fast":
+        try:
+            return fast_validate(schema_cache, req.cache_key, xsd_path, req.xml_string)
+        except Exception as e:
+            return {"valid": False, "error": f"Validation process failed: {str(e)}"}
+    
     try:
-        schema = xmlschema.XMLSchema(xsd_path)
+        schema = schema_cache.get(req.cache_key, xsd_path)
         
         # First, try to parse the XML string
         try:
@@ -52,23 +122,25 @@ def validate(req: ValidateRequest):
 @app.post("/validate_with_format")
 def validate_with_format(req: ValidateWithFormatRequest):
     """Validate XML against a specific XSD format."""
-    # Map format types to XSD files
-    format_mapping = {
-        "format1_complex": "format1_complex.xsd",
-        "format2_simple": "format2_simple.xsd"
-    }
-    
-    if req.format_type not in format_mapping:
+    if req.format_type not in FORMAT_MAPPING:
         raise HTTPException(status_code=400, detail="Invalid format type")
     
-    xsd_file = format_mapping[req.format_type]
+    xsd_file = FORMAT_MAPPING[req.format_type]
     xsd_path = os.path.join(TEMPLATES_DIR, xsd_file)
     
     if not os.path.exists(xsd_path):
         raise HTTPException(status_code=404, detail=f"XSD file not found: {xsd_file}")
     
+    if req.mode == "fast":
+        try:
+            result = fast_validate(schema_cache, xsd_file, xsd_path, req.xml_string)
+        except Exception as e:
+            result = {"valid": False, "error": f"Validation process failed: {str(e)}"}
+        result["format_type"] = req.format_type
+        return result
+    
     try:
-        schema = xmlschema.XMLSchema(xsd_path)
+        schema = schema_cache.get(xsd_file, xsd_path)
         
         # First, try to parse the XML string
         try:
@@ -115,6 +187,93 @@ def validate_with_format(req: ValidateWithFormatRequest):
         }
 
 
+@app.post("/validate_batch")
+async def validate_batch(request: Request, format_type: str | None = None, cache_key: str | None = None,
+                         mode: str = "fast"):
+    """Validate many documents against one schema and stream per-document results as NDJSON.
+
+    Accepts a JSON body (``ValidateBatchRequest``) or an NDJSON body with one
+    ``{"id": ..., "xml_string": ...}`` object per line, in which case
+    format_type/cache_key/mode come from the query string. Documents are
+    validated on a process pool; the last line is a ``summary`` record.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        try:
+            body = ValidateBatchRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+        format_type = body.format_type or format_type
+        cache_key = body.cache_key or cache_key
+        mode = body.mode
+        documents = (
+            (i, None, doc) if isinstance(doc, str) else (i, doc.id, doc.xml_string)
+            for i, doc in enumerate(body.documents)
+        )
+    else:
+        # Spool the body first: the streaming response owns the receive channel once it starts
+        spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES)
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        documents = iter_ndjson_documents(spool)
+    
+    if mode not in VALIDATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid mode {mode!r}; expected one of {list(VALIDATION_MODES)}")
+    cache_key, xsd_path = resolve_xsd(format_type, cache_key)
+    # Compile once up front so a broken schema fails the request, not every document
+    try:
+        schema_cache.get(cache_key, xsd_path, engine="lxml" if mode == "fast" else "xmlschema")
+    except etree.XMLSchemaParseError:
+        pass  # fast mode falls back to xmlschema per document
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Schema compilation failed: {str(e)}")
+    
+    return StreamingResponse(stream_batch_results(documents, cache_key, xsd_path, mode),
+                             media_type="application/x-ndjson")
+
+
+def iter_ndjson_documents(lines):
+    """Yield (index, id, xml_string) from an NDJSON file, or error records for bad lines."""
+    try:
+        index = 0
+        for raw in lines:
+            if not raw.strip():
+                continue
+            try:
+                doc = BatchDocument.model_validate_json(raw)
+                yield (index, doc.id, doc.xml_string)
+            except ValidationError as e:
+                yield {"index": index, "id": None, "valid": False, "error": f"Invalid document: {e.errors()[0]['msg']}"}
+            index += 1
+    finally:
+        lines.close()
+
+
+async def stream_batch_results(documents, cache_key: str, xsd_path: str, mode: str):
+    started = time.perf_counter()
+    total = 0
+    valid = 0
+    async for result in stream_validation(documents, cache_key, xsd_path, mode):
+        total += 1
+        valid += 1 if result.get("valid") else 0
+        yield (json.dumps(result) + "\n").encode("utf-8")
+    elapsed = time.perf_counter() - started
+    summary = {
+        "summary": {
+            "total": total,
+            "valid": valid,
+            "invalid": total - valid,
+            "cache_key": cache_key,
+            "mode": mode,
+            "workers": VALIDATE_WORKERS,
+            "elapsed_s": round(elapsed, 3),
+            "docs_per_sec": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+        }
+    }
+    yield (json.dumps(summary) + "\n").encode("utf-8")
+
+
 @app.get("/")
 def root():
     return {"service": "validator", "docs": "/docs", "health": "/health"}
@@ -125,3 +284,16 @@ def health():
     return {"ok": True}
 
 
+@app.get("/metrics/schema_cache")
+def schema_cache_metrics():
+    """Hit/miss counts and contents of the compiled schema cache."""
+    return schema_cache.stats()
+
+
+@app.post("/schema_cache/invalidate")
+def invalidate_schema_cache(req: InvalidateRequest):
+    """Drop a cached schema (or all of them) so the next request recompiles."""
+    removed = schema_cache.invalidate(req.cache_key)
+    return {"invalidated": removed, "cache_key": req.cache_key}
+
+
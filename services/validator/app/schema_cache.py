@@ -0,0 +1,142 @@
+"""Process-wide cache of compiled XSD schemas for the validator service."""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import hashlib
+import os
+import threading
+import time
+
+import xmlschema
+
+from .fast_validation import LxmlValidator
+
+
+# Compilers for each validation engine; entries compile each engine lazily
+COMPILERS = {
+    "xmlschema": xmlschema.XMLSchema,
+    "lxml": LxmlValidator,
+}
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@dataclass
+class _Entry:
+    path: str
+    mtime_ns: int
+    size: int
+    digest: str
+    compiled: dict = field(default_factory=dict)
+    failures: dict = field(default_factory=dict)
+    loaded_at: float = field(default_factory=time.time)
+
+
+class SchemaCache:
+    """LRU cache of compiled schemas keyed by cache_key.
+
+    An entry stays valid while the file's mtime and size are unchanged. When
+    they change the file is re-hashed, and the schema is only recompiled if
+    the content hash differs, so a touched-but-identical file stays cached.
+    Each entry holds one compiled object per engine ("xmlschema" or "lxml").
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.compile_seconds = 0.0
+
+    def get(self, cache_key: str, xsd_path: str, engine: str = "xmlschema"):
+        """Return the compiled schema for ``cache_key``, compiling it on a miss.
+
+        A schema that failed to compile for an engine re-raises the same error
+        until the file changes, instead of being recompiled on every call.
+        """
+        st = os.stat(xsd_path)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry.path == xsd_path:
+                if (entry.mtime_ns, entry.size) != (st.st_mtime_ns, st.st_size):
+                    digest = file_digest(xsd_path)
+                    if digest == entry.digest:
+                        entry.mtime_ns, entry.size = st.st_mtime_ns, st.st_size
+                    else:
+                        entry = None
+            else:
+                entry = None
+
+            if entry is None:
+                entry = _Entry(xsd_path, st.st_mtime_ns, st.st_size, file_digest(xsd_path))
+                self._entries[cache_key] = entry
+            self._entries.move_to_end(cache_key)
+
+            if engine in entry.compiled:
+                self.hits += 1
+                return entry.compiled[engine]
+            if engine in entry.failures:
+                self.hits += 1
+                raise entry.failures[engine]
+
+            self.misses += 1
+            started = time.perf_counter()
+            try:
+                compiled = COMPILERS[engine](xsd_path)
+            except Exception as e:
+                entry.failures[engine] = e
+                raise
+            finally:
+                self.compile_seconds += time.perf_counter() - started
+                self._evict()
+            entry.compiled[engine] = compiled
+            return compiled
+
+    def _evict(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, cache_key: str | None = None) -> int:
+        """Drop one entry, or every entry when no cache_key is given."""
+        with self._lock:
+            if cache_key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                removed = 1 if self._entries.pop(cache_key, None) is not None else 0
+            self.invalidations += removed
+            return removed
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "compile_seconds": round(self.compile_seconds, 4),
+                "cached": [
+                    {
+                        "cache_key": key,
+                        "digest": e.digest[:12],
+                        "engines": sorted(e.compiled),
+                        "failed_engines": sorted(e.failures),
+                        "loaded_at": e.loaded_at,
+                    }
+                    for key, e in self._entries.items()
+                ],
+            }
@@ -0,0 +1,65 @@
+"""Benchmark recall and query latency of the approximate index types.
+
+Builds each index type over the same synthetic corpus of clustered,
+normalized vectors (shaped like sentence embeddings) and compares it with the
+exact IndexFlatIP baseline: build time, then recall@k of the true top-k and
+per-query latency across a sweep of nprobe / efSearch values.
+
+    python tests/bench_ann_recall.py [n_vectors] [dim]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import faiss
+import numpy as np
+
+from packages.shared.index_params import apply_search_params
+from services.template_fetcher.app.index_builder import INDEX_TYPES, build_index
+
+K = 10
+N_QUERIES = 500
+SWEEPS = {"nprobe": (1, 4, 16, 64), "efSearch": (16, 64, 256)}
+
+
+def synthetic_corpus(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 384
+    vectors = synthetic_corpus(n, dim)
+    queries = synthetic_corpus(N_QUERIES, dim, seed=1)
+    print(f"ANN benchmark: {n} vectors, dim {dim}, {N_QUERIES} queries, recall@{K} vs flat")
+
+    truth = None
+    for index_type in INDEX_TYPES:
+        started = time.perf_counter()
+        index, params = build_index(vectors, index_type)
+        print(f"  {index_type:<9} build {time.perf_counter() - started:7.2f} s")
+
+        if truth is None:
+            _, truth = index.search(queries, K)
+        knob = next((name for name in SWEEPS if name in params), None)
+        for value in SWEEPS[knob] if knob else (None,):
+            if knob:
+                apply_search_params(index, {knob: value})
+            started = time.perf_counter()
+            _, ids = index.search(queries, K)
+            query_ms = (time.perf_counter() - started) * 1000 / N_QUERIES
+            label = f"{knob}={value}" if knob else "exact"
+            print(f"    {label:<13} recall@{K} {recall_at_k(ids, truth):.3f} | {query_ms:7.3f} ms/query")
+
+if __name__ == "__main__":
+    main()
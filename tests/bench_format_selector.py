@@ -0,0 +1,84 @@
+"""Benchmark format selection throughput.
+
+Scores synthetic cases of increasing size with the original multi-pass
+scorer and with XSDFormatSelector, then posts the whole batch as one
+NDJSON file to the format selector's /analyze_batch (in-process, through
+the ASGI test client) and compares with one /analyze call per case.
+Finally classifies one large case file with the streaming selector, with
+and without early exit, against reading it whole.
+
+    python tests/bench_format_selector.py [cases]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.testclient import TestClient
+
+from sar_agent.core.xsd_format_selector import XSDFormatSelector
+from services.format_selector.app import main as format_selector
+from tests.test_format_selector import random_case, reference_metrics
+
+
+def rate(count: int, fn) -> float:
+    started = time.perf_counter()
+    fn()
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(0)
+    selector = XSDFormatSelector()
+    print(f"Format selector benchmark ({count} cases per size)")
+    for lines in (2, 10, 100, 1000):
+        n = max(20, count * 10 // lines)
+        cases = [random_case(rng, lines) for _ in range(n)]
+        old = rate(n, lambda: [reference_metrics(c) for c in cases])
+        new = rate(n, lambda: selector.get_format_recommendations(cases))
+        print(f"   {lines:5d} lines/case: multi-pass {old:9.0f} cases/s | one-pass {new:9.0f} cases/s | "
+              f"{new / old:4.1f}x")
+
+    client = TestClient(format_selector.app)
+    cases = [random_case(rng, 10) for _ in range(count)]
+    body = "\n".join(json.dumps({"case_id": str(i), "pipe_data": c}) for i, c in enumerate(cases))
+    per_case = rate(count, lambda: [client.post("/analyze", json={"pipe_data": c}) for c in cases])
+    started = time.perf_counter()
+    r = client.post("/analyze_batch", content=body, headers={"content-type": "application/x-ndjson"})
+    batch = count / (time.perf_counter() - started)
+    summary = json.loads(r.text.splitlines()[-1])["summary"]
+    print(f"   /analyze per case {per_case:9.0f} cases/s | /analyze_batch {batch:9.0f} cases/s "
+          f"(server-side {summary['cases_per_sec']:.0f} cases/s) | {summary['formats']}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "case.txt")
+        with open(path, "w") as f:
+            for _ in range(200):
+                f.write(random_case(rng, 1000) + "\n")
+        size_mb = os.path.getsize(path) / 2**20
+
+        def whole():
+            with open(path) as f:
+                return selector.get_format_recommendation(f.read())
+
+        for label, fn in (("read whole", whole),
+                          ("stream, full metrics", lambda: selector.get_format_recommendation_file(path, True)),
+                          ("stream, early exit", lambda: selector.get_format_recommendation_file(path))):
+            tracemalloc.start()
+            started = time.perf_counter()
+            format_type, _, metrics = fn()
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"   {size_mb:.1f} MB case, {label:<21} {elapsed * 1000:9.1f} ms | peak {peak / 2**20:7.2f} MB | "
+                  f"{format_type.value} (complete={metrics.complete})")
+
+
+if __name__ == "__main__":
+    main()
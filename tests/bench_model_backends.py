@@ -0,0 +1,78 @@
+"""Benchmark startup and generation latency and memory per inference backend.
+
+Loads the configured ``MODEL_NAME`` (the llm_filler default unless set)
+once per backend, each in a fresh subprocess so peak RSS is not shared
+between modes, and reports load time, model size, peak RSS, the first
+generate call (which includes torch.compile / ORT warm-up) and the median
+of the following calls.
+
+    MODEL_NAME=sshleifer/tiny-gpt2 python tests/bench_model_backends.py [backends] [max_new_tokens] [runs]
+
+``backends`` is a comma-separated subset of default,int8,bf16,compile,onnx.
+Set ``MODEL_CLASS=AutoModelForSeq2SeqLM`` for the sar_agent engine's model.
+"""
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+MODEL_NAME = os.getenv("MODEL_NAME", "sshleifer/tiny-gpt2")
+MODEL_CLASS = os.getenv("MODEL_CLASS", "AutoModelForCausalLM")
+PROMPT = ("Generate a valid XML document for format2_simple.\n\nData to include:\n"
+          '{"EntityName": "Acme Holdings", "TransactionID": "TX-1001", "Amount": 15000.0}\n\nXML:')
+
+
+def run_backend(backend: str, max_new_tokens: int, runs: int) -> dict:
+    import torch
+    import transformers
+    from packages.shared.model_backends import timed_load
+
+    tokenizer = transformers.AutoTokenizer.from_pretrained(MODEL_NAME)
+    if tokenizer.pad_token is None and tokenizer.eos_token is not None:
+        tokenizer.pad_token = tokenizer.eos_token
+    model, info = timed_load(getattr(transformers, MODEL_CLASS), MODEL_NAME, backend)
+    inputs = tokenizer(PROMPT, return_tensors="pt")
+    latencies = []
+    for _ in range(runs + 1):
+        started = time.perf_counter()
+        with torch.inference_mode():
+            model.generate(**inputs, max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens,
+                           do_sample=False, pad_token_id=tokenizer.pad_token_id)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        **info,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "first_ms": latencies[0],
+        "median_ms": statistics.median(latencies[1:]),
+        "tokens_per_sec": max_new_tokens / (statistics.median(latencies[1:]) / 1000),
+    }
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(run_backend(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))))
+        return
+    backends = sys.argv[1].split(",") if len(sys.argv) > 1 else ["default", "int8", "bf16", "compile", "onnx"]
+    max_new_tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    print(f"Backend benchmark for {MODEL_NAME} ({max_new_tokens} new tokens, {runs} runs after warm-up)")
+    for backend in backends:
+        proc = subprocess.run([sys.executable, __file__, "--child", backend, str(max_new_tokens), str(runs)],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"   {backend:<8} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        label = backend if r["backend"] == backend else f"{backend}->{r['backend']}"
+        print(f"   {label:<16} load {r['load_seconds']:6.2f} s | model {r['model_bytes'] / 2**20:8.1f} MB | "
+              f"peak RSS {r['peak_rss_mb']:7.0f} MB | first {r['first_ms']:8.1f} ms | "
+              f"median {r['median_ms']:8.1f} ms | {r['tokens_per_sec']:7.1f} tok/s")
+
+
+if __name__ == "__main__":
+    main()
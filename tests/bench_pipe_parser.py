@@ -0,0 +1,95 @@
+"""Benchmark the pipe-file parser: rows/sec and peak RSS.
+
+Writes a synthetic extract, then parses it in fresh subprocesses with the
+original implementation (csv.DictReader into one list, a timestamp per
+row), the streaming parser in-process, and the streaming parser on a
+process pool. Peak RSS is reported for the parsing process and for the
+largest pool worker.
+
+    python tests/bench_pipe_parser.py [rows] [workers] [chunk_mb]
+"""
+import csv
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from services.parser.app.pipe_parser import iter_pipe_rows
+
+
+def legacy_parse_pipe_file(file_path: str) -> list[dict]:
+    """parse_pipe_file as it was before the streaming parser."""
+    rows = []
+    with open(file_path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f, delimiter='|')
+        for i, row in enumerate(reader):
+            rows.append({
+                "row_number": i + 1,
+                "raw_data": row,
+                "parsed_at": datetime.now().isoformat(),
+                "source_file": file_path,
+                "entity_name": row.get("EntityName", row.get("entity_name", "")),
+                "entity_type": row.get("EntityType", row.get("entity_type", "")),
+                "transaction_id": row.get("TransactionID", row.get("transaction_id", "")),
+                "amount": float(row.get("Amount", row.get("amount", "0"))) if row.get("Amount") or row.get("amount") else 0,
+                "status": row.get("Status", row.get("status", "")),
+                "date": row.get("Date", row.get("date", "")),
+            })
+    return rows
+
+
+def write_extract(path: str, rows: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("EntityName|EntityType|TransactionID|Amount|Status|Date|Counterparty|Country|Channel\n")
+        for i in range(rows):
+            f.write(f"Entity {i % 5000}|Company|TX-{i:09d}|{(i * 37) % 100000}.{i % 100:02d}|"
+                    f"{'Completed' if i % 7 else 'Suspicious'}|2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}|"
+                    f"Counterparty {i % 997}|{('US', 'GB', 'DE', 'SG')[i % 4]}|{('WIRE', 'ACH', 'CARD')[i % 3]}\n")
+
+
+def run_mode(mode: str, path: str, workers: int, chunk_bytes: int) -> dict:
+    started = time.perf_counter()
+    if mode == "legacy":
+        count = len(legacy_parse_pipe_file(path))
+    else:
+        count = sum(1 for _ in iter_pipe_rows(path, workers=workers if mode == "parallel" else 0,
+                                              chunk_bytes=chunk_bytes))
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": count,
+        "seconds": elapsed,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "worker_peak_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(run_mode(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))))
+        return
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    chunk_bytes = int(float(sys.argv[3]) * 1024 * 1024) if len(sys.argv) > 3 else 8 * 1024 * 1024
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "extract.txt")
+        write_extract(path, rows)
+        size_mb = os.path.getsize(path) / 2**20
+        print(f"Pipe parser benchmark ({rows} rows, {size_mb:.0f} MB, {workers} workers, "
+              f"{chunk_bytes / 2**20:.0f} MB chunks)")
+        for mode in ("legacy", "streaming", "parallel"):
+            proc = subprocess.run([sys.executable, __file__, "--child", mode, path, str(workers), str(chunk_bytes)],
+                                  capture_output=True, text=True, check=True)
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            workers_rss = f" | worker peak RSS {r['worker_peak_rss_mb']:6.0f} MB" if mode == "parallel" else ""
+            print(f"   {mode:<10} {r['rows'] / r['seconds']:10.0f} rows/s | {r['seconds']:6.2f} s | "
+                  f"peak RSS {r['peak_rss_mb']:6.0f} MB{workers_rss}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark time-to-first-token with and without the prefix KV-cache.
+
+Uses a randomly initialised GPT-2-shaped model (no download) and a
+byte-level tokenizer, with a schema-context prefix of realistic length and
+a short per-record data suffix, which is the shape of fill_with_data
+prompts. Generation is capped at one token, so the time is the prefill.
+
+    python tests/bench_prefix_cache.py [requests] [prefix_chars]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from services.llm_filler.app.generation import GenerationWorker
+from services.llm_filler.app.prefix_cache import PrefixCache
+from tests.test_generation import CharTokenizer
+
+
+def make_model():
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=257, n_positions=2048, n_embd=256, n_layer=4, n_head=4,
+                        bos_token_id=0, eos_token_id=0)
+    return GPT2LMHeadModel(config).eval()
+
+
+def bench(worker: GenerationWorker, prefix: str, requests: int) -> list[float]:
+    async def run():
+        samples = []
+        for i in range(requests):
+            started = time.perf_counter()
+            await worker.generate(f'{{"EntityName": "Entity {i}", "Amount": {i * 100}}}\n\nXML:',
+                                  max_new_tokens=1, prefix=prefix)
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples
+    try:
+        return asyncio.run(run())
+    finally:
+        worker.stop()
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    prefix_chars = int(sys.argv[2]) if len(sys.argv) > 2 else 1200
+    context = "".join(f"- element:/Report/Field{i} type=xs:string cardinality=1..1\n" for i in range(200))
+    prefix = f"Schema Context:\n{context[:prefix_chars]}\nIMPORTANT: Generate valid XML only.\n\nData to include:\n"
+    model, tokenizer = make_model(), CharTokenizer()
+    print(f"Prefix cache benchmark ({requests} sequential requests, prefix {len(prefix)} tokens)")
+    for label, cache in (("no cache", None), ("prefix cache", PrefixCache())):
+        worker = GenerationWorker(lambda: (tokenizer, model), max_wait_ms=0, prefix_cache=cache)
+        samples = bench(worker, prefix, requests)[1:]  # first request loads / fills the cache
+        print(f"   {label:<13} TTFT mean {statistics.mean(samples):7.2f} ms | "
+              f"p95 {sorted(samples)[int(0.95 * (len(samples) - 1))]:7.2f} ms | "
+              f"prefill tokens {worker.stats()['prefill_tokens']}")
+
+
+if __name__ == "__main__":
+    main()
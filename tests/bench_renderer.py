@@ -0,0 +1,51 @@
+"""Benchmark the deterministic renderer in llm_filler.
+
+Times the one-off compile of each built-in format and the steady-state
+rendering rate for the complex pipe sample, and checks the output against
+the XSD once.
+
+    python tests/bench_renderer.py [records]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from lxml import etree
+
+from services.llm_filler.app.main import parse_pipe_data
+from services.llm_filler.app.renderer import FormatRenderer
+
+XSD_DIR = os.path.join(os.path.dirname(__file__), "..", "sar_agent", "regulator_xsds")
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "sar_agent", "sample_files", "complex_pipe_sample.txt")
+FORMATS = {"format1_complex": "format1_complex.xsd", "format2_simple": "format2_simple.xsd"}
+
+
+def bench_format(format_name: str, data: dict, records: int) -> None:
+    started = time.perf_counter()
+    renderer = FormatRenderer.from_config(format_name)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    schema = etree.XMLSchema(etree.parse(os.path.join(XSD_DIR, FORMATS[format_name])))
+    valid = schema.validate(etree.fromstring(renderer.render(data).encode("utf-8")))
+
+    started = time.perf_counter()
+    for _ in range(records):
+        renderer.render(data, pretty_print=False)
+    elapsed = time.perf_counter() - started
+    print(f"   {format_name:<16} compile {compile_ms:8.2f} ms | {records / elapsed:8.0f} docs/sec "
+          f"({len(data) * records / elapsed:9.0f} fields/sec) | valid={valid}")
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(SAMPLE, "r", encoding="utf-8") as f:
+        data = parse_pipe_data(f.read())
+    print(f"Renderer benchmark ({records} records of {len(data)} fields)")
+    for format_name in FORMATS:
+        bench_format(format_name, data, records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark the validator's engines on the built-in formats.
+
+Compares compile time and per-document validation time for xmlschema (the
+"full" mode) and lxml/libxml2 (the "fast" mode), using cached schemas so only
+validation is timed in the loop.
+
+    python tests/bench_validator_engines.py [iterations]
+"""
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from lxml import etree
+
+from services.validator.app.fast_validation import xmlschema_errors
+from services.validator.app.schema_cache import SchemaCache
+
+XSD_DIR = os.path.join(os.path.dirname(__file__), "..", "sar_agent", "regulator_xsds")
+
+SIMPLE_VALID = """<SimpleReport xmlns="http://www.regulator.gov/simple">
+  <ReportID>SAR-2024-001</ReportID>
+  <FilingDate>2024-12-15</FilingDate>
+  <ReportType>Initial</ReportType>
+  <Priority>High</Priority>
+  <InstitutionName>Global Financial Services Inc</InstitutionName>
+  <InstitutionType>Commercial Bank</InstitutionType>
+  <InstitutionAddress>123 Financial District, New York, NY 10001</InstitutionAddress>
+  <InstitutionContact>Compliance Department</InstitutionContact>
+  <EntityName>TechCorp Solutions LLC</EntityName>
+  <EntityType>Company</EntityType>
+  <EntityAddress>456 Innovation Drive, San Francisco, CA 94105</EntityAddress>
+  <TransactionID>TXN-001</TransactionID>
+  <TransactionDate>2024-12-10</TransactionDate>
+  <TransactionAmount>50000.00</TransactionAmount>
+  <TransactionCurrency>USD</TransactionCurrency>
+  <TransactionType>Wire</TransactionType>
+  <TransactionStatus>Completed</TransactionStatus>
+  <TransactionDescription>Outbound wire</TransactionDescription>
+  <RiskLevel>High</RiskLevel>
+  <SuspiciousActivityType>Money Laundering</SuspiciousActivityType>
+  <SuspiciousActivityNarrative>Structured transfers to offshore accounts.</SuspiciousActivityNarrative>
+  <ContactName>Michael Compliance Officer</ContactName>
+</SimpleReport>"""
+
+# Three errors: bad date, bad enumeration, missing required elements at the end
+SIMPLE_INVALID = (
+    SIMPLE_VALID
+    .replace("<FilingDate>2024-12-15</FilingDate>", "<FilingDate>15/12/2024</FilingDate>")
+    .replace("<TransactionType>Wire</TransactionType>", "<TransactionType>Teleport</TransactionType>")
+    .replace("  <ContactName>Michael Compliance Officer</ContactName>\n", "")
+)
+
+COMPLEX_MINIMAL = """<ComplexReport xmlns="http://www.regulator.gov/complex" reportId="SAR-2024-001" version="1.0">
+  <ReportHeader>
+    <FilingDate>2024-12-15T10:30:00Z</FilingDate>
+    <ReportType>Initial</ReportType>
+    <Priority>High</Priority>
+    <Jurisdiction>US</Jurisdiction>
+    <RegulatoryFramework>BSA</RegulatoryFramework>
+  </ReportHeader>
+</ComplexReport>"""
+
+DOCUMENTS = {
+    "format2_simple.xsd": {"valid": SIMPLE_VALID, "invalid": SIMPLE_INVALID},
+    "format1_complex.xsd": {"partial": COMPLEX_MINIMAL},
+}
+
+
+def time_calls(fn, iterations: int) -> dict:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "mean_ms": statistics.mean(samples),
+        "p95_ms": sorted(samples)[int(0.95 * (len(samples) - 1))],
+    }
+
+
+def bench_format(xsd_file: str, documents: dict, iterations: int) -> None:
+    xsd_path = os.path.join(XSD_DIR, xsd_file)
+    print(f"\n== {xsd_file} ({os.path.getsize(xsd_path)} bytes)")
+    cache = SchemaCache()
+    engines = {}
+    for engine in ("xmlschema", "lxml"):
+        started = time.perf_counter()
+        try:
+            engines[engine] = cache.get(xsd_file, xsd_path, engine=engine)
+        except Exception as e:
+            print(f"   {engine:<9} compile failed: {str(e).splitlines()[0]}")
+            continue
+        print(f"   {engine:<9} compile: {(time.perf_counter() - started) * 1000:8.2f} ms")
+
+    for label, xml_string in documents.items():
+        doc = etree.fromstring(xml_string.encode("utf-8"))
+        row = []
+        if "xmlschema" in engines:
+            schema = engines["xmlschema"]
+            t = time_calls(lambda: xmlschema_errors(schema, doc), iterations)
+            row.append(f"xmlschema {t['mean_ms']:7.3f} ms (p95 {t['p95_ms']:.3f}, {len(xmlschema_errors(schema, doc))} errors)")
+        if "lxml" in engines:
+            validator = engines["lxml"]
+            t = time_calls(lambda: validator.iter_errors(doc), iterations)
+            row.append(f"lxml {t['mean_ms']:7.3f} ms (p95 {t['p95_ms']:.3f}, {len(validator.iter_errors(doc))} errors)")
+        print(f"   {label:<8} " + " | ".join(row) if row else f"   {label:<8} skipped (no engine compiled)")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print(f"Validator engine benchmark ({iterations} iterations per document)")
+    for xsd_file, documents in DOCUMENTS.items():
+        bench_format(xsd_file, documents, iterations)
+
+
+if __name__ == "__main__":
+    main()
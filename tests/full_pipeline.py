@@ -55,7 +55,7 @@ async def main():
         
         print("📥 Step 2: Fetching XSD template...")
         xsd_url = 'https://www.w3.org/2001/XMLSchema.xsd'
-        r = await client.post(f'{base2}/fetch', json={'xsd_url': xsd_url, 'cache_key': 'Schema.xsd'})
+        r = await client.post(f'{base2}/fetch', params={'wait': 'true'}, json={'xsd_url': xsd_url, 'cache_key': 'Schema.xsd'})
         print(f"📊 Template fetch result: {r.status_code}")
         if r.status_code == 200:
             result = r.json()
@@ -46,7 +46,7 @@ async def main():
             print(f"❌ FinCEN XSD not found: {fincen_xsd_path}")
             return
         
-        r = await client.post(f'{base2}/fetch', json={
+        r = await client.post(f'{base2}/fetch', params={'wait': 'true'}, json={
             'xsd_file': fincen_xsd_path, 
             'cache_key': 'fincen_sar.xsd'
         })
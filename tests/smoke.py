@@ -36,7 +36,7 @@ async def main():
         await wait_healthy(client, f'{base6}/health')
         await wait_healthy(client, f'{base7}/health')
 
-        r = await client.post(f'{base2}/fetch', json={'xsd_url': xsd_url, 'cache_key': 'Schema.xsd'})
+        r = await client.post(f'{base2}/fetch', params={'wait': 'true'}, json={'xsd_url': xsd_url, 'cache_key': 'Schema.xsd'})
         print('fetch:', r.status_code, r.text[:200])
         r.raise_for_status()
 
@@ -0,0 +1,104 @@
+import asyncio
+import os
+
+from lxml import etree
+import pytest
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from services.llm_filler.app.constrained import DONE, ValueConstraint, get_automaton
+from services.llm_filler.app.generation import GenerationWorker
+from services.llm_filler.app.renderer import get_renderer
+from tests.test_generation import CharTokenizer
+
+XSD_DIR = os.path.join(os.path.dirname(__file__), "..", "sar_agent", "regulator_xsds")
+
+
+def long_context_model():
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=257, n_positions=2048, n_embd=32, n_layer=1, n_head=2,
+                        bos_token_id=0, eos_token_id=0)
+    return GPT2LMHeadModel(config).eval()
+
+
+class TestXmlAutomaton:
+    """Test the schema automaton behind constrained decoding."""
+
+    @pytest.mark.parametrize("format_name", ["format1_complex", "format2_simple"])
+    @pytest.mark.parametrize("pretty_print", [False, True])
+    def test_accepts_rendered_documents(self, format_name, pretty_print):
+        automaton = get_automaton(format_name)
+        data = {"ReportID": "SAR-1", "TransactionID1": "T1", "TransactionID2": "T2", "TransactionAmount1": "12.50"}
+        xml = get_renderer(format_name).render(data, pretty_print=pretty_print).strip()
+        assert automaton.feed(automaton.initial, xml).mode == DONE
+
+    def test_rejects_out_of_schema_text(self):
+        automaton = get_automaton("format2_simple")
+        start = automaton.feed(automaton.initial, '<SimpleReport xmlns="http://www.regulator.gov/simple">')
+        assert start is not None
+        assert automaton.feed(automaton.initial, "<Bogus") is None
+        assert automaton.feed(start, "<FilingDate>") is None  # ReportID comes first
+        assert automaton.feed(start, "<ReportID>a<b") is None
+        assert automaton.feed(start, "</SimpleReport>") is None  # required children missing
+
+    def test_value_constraints(self):
+        day = ValueConstraint("date", [], [])
+        assert day.accepts("2024-1") and not day.accepts("2024-13")
+        assert not day.accepts("2024-02-3")  # no completion exists
+        assert day.complete("2024-12-31") and not day.complete("2024-12")
+        enum = ValueConstraint("string", ["Low", "Medium"], [])
+        assert enum.accepts("Me") and not enum.accepts("Mx")
+        pattern = ValueConstraint("string", [], [r"[A-Za-z0-9\-_\.]+"])
+        assert pattern.accepts("SAR-1") and not pattern.accepts("SAR 1")
+
+    def test_closing_mode_skips_optional_content(self):
+        automaton = get_automaton("format2_simple")
+        state = automaton.feed(automaton.initial, '<SimpleReport xmlns="http://www.regulator.gov/simple"><ReportID>')
+        assert automaton.feed(state, "x", closing=False) is not None
+        assert automaton.feed(state, "x", closing=True) is None  # an empty string is already complete
+        assert automaton.feed(state, "</ReportID>", closing=True) is not None
+        assert automaton.feed(state, "</ReportID>\n", closing=True) is None
+        state = automaton.feed(state, "</ReportID><FilingDate>2024-12-3", closing=True)
+        assert automaton.feed(state, "1<", closing=True) is not None
+        assert automaton.chars_to_finish(automaton.feed(state, "1</FilingDate>")) < automaton.chars_to_finish(state)
+
+        xml = get_renderer("format2_simple").render({}, pretty_print=False)
+        state = automaton.feed(automaton.initial, xml[:xml.index("</EntityAddress>") + len("</EntityAddress>")])
+        assert automaton.feed(state, "<EntityID>", closing=False) is not None
+        assert automaton.feed(state, "<EntityID>", closing=True) is None
+        assert automaton.feed(state, "<TransactionID>", closing=True) is not None
+
+
+class TestConstrainedGeneration:
+    """Test generation through the schema logits processor."""
+
+    def test_random_model_produces_valid_reports(self):
+        model = long_context_model()
+        worker = GenerationWorker(lambda: (CharTokenizer(), model), max_wait_ms=20)
+        schema = etree.XMLSchema(etree.parse(os.path.join(XSD_DIR, "format2_simple.xsd")))
+
+        async def go():
+            return await asyncio.gather(*(
+                worker.generate("XML:", max_new_tokens=1200, do_sample=True, temperature=0.7,
+                                constraint="format2_simple")
+                for _ in range(2)
+            ))
+
+        try:
+            results = asyncio.run(go())
+        finally:
+            worker.stop()
+        for result in results:
+            assert result.complete
+            assert schema.validate(etree.fromstring(result.generated_text.encode("utf-8"))), schema.error_log
+        assert worker.stats()["constrained_incomplete"] == 0
+
+    def test_too_small_budget_is_reported_incomplete(self):
+        model = long_context_model()
+        worker = GenerationWorker(lambda: (CharTokenizer(), model), max_wait_ms=1)
+        try:
+            result = asyncio.run(worker.generate("XML:", max_new_tokens=50, constraint="format2_simple"))
+        finally:
+            worker.stop()
+        assert result.complete is False
+        assert result.generated_text.startswith("<SimpleReport")
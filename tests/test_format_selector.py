@@ -0,0 +1,197 @@
+import json
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from sar_agent.core.xsd_format_selector import ComplexityMetrics, FormatType, XSDFormatSelector
+from services.format_selector.app import main as format_selector
+
+SIMPLE_CASE = """EntityName|Test Corp|Type:Company|Structure:LLC
+TransactionID|TXN-001|Type:Wire|Status:Completed|Amount:50000.00"""
+
+COMPLEX_CASE = """EntityName|TechCorp Solutions LLC|Type:Company|Structure:LLC
+RelatedEntity1|TechCorp Holdings Inc|Type:Parent Company|Relationship:100% Ownership
+RelatedEntity2|TechCorp International Ltd|Type:Subsidiary|Relationship:Majority Control
+TransactionID1|TXN-001|Type:Wire|Status:Completed|Amount:50000.00
+TransactionID2|TXN-002|Type:ACH|Status:Suspicious|Amount:75000.00
+RiskFactors|Unusual Transaction Pattern|Severity:High|Confidence:85%|Source:AI Analysis
+Document1|Corporate Registration|Type:Legal|Date:2020-03-15|Status:Valid
+Note1|Initial review indicates potential structuring activity."""
+
+VOCABULARY = ["EntityName", "entity", "Transaction", "TXN", "tx", "Relationship", "RelatedEntity", "Document7",
+              "NoteX", "Type", "STATUS", "amount", "Lat", "lon", "geo", "Intermediary", "Beneficial", "Owner",
+              "Risk", "Severity", "Confidence", "Corp", "Wire", "50000.00", "İstanbul", "notes", "entity_2"]
+
+
+def reference_metrics(pipe_data: str) -> ComplexityMetrics:
+    """The original multi-pass scorer, kept as an oracle for the one-pass one."""
+    raw = pipe_data.replace("|", " ").replace(":", " ").replace(",", " ")
+    tokens = [t.lower() for t in raw.split() if t]
+    m = ComplexityMetrics()
+    m.entity_count = sum(tok.startswith("entity") for tok in tokens)
+    m.transaction_count = sum(tok.startswith("transaction") or tok in {"txn", "tx"} for tok in tokens)
+    m.relationship_count = tokens.count("relationship") + tokens.count("relatedentity")
+    m.document_count = sum(tok.startswith("document") for tok in tokens)
+    m.note_count = sum(tok.startswith("note") for tok in tokens)
+    m.custom_field_count = tokens.count("type") + tokens.count("status") + tokens.count("amount")
+    m.geographic_coordinates = tokens.count("lat") + tokens.count("lon") + tokens.count("geo")
+    m.intermediary_count = tokens.count("intermediary")
+    m.beneficial_owner_count = tokens.count("beneficial") + tokens.count("owner")
+    m.risk_factors_count = tokens.count("risk") + tokens.count("severity") + tokens.count("confidence")
+    score = (1.0 * m.entity_count + 1.5 * m.transaction_count + 1.5 * m.relationship_count
+             + 1.0 * m.document_count + 0.5 * m.note_count + 0.5 * m.custom_field_count
+             + 1.0 * m.geographic_coordinates + 1.0 * m.intermediary_count
+             + 1.0 * m.beneficial_owner_count + 1.0 * m.risk_factors_count)
+    if len(tokens) > 30:
+        score += 3.0
+    elif len(tokens) > 15:
+        score += 1.5
+    m.total_complexity_score = score
+    return m
+
+
+def random_case(rng: random.Random, lines: int) -> str:
+    return "\n".join(
+        "|".join(rng.choice(VOCABULARY) + rng.choice(["", ":", ",", " "]) + rng.choice(VOCABULARY)
+                 for _ in range(rng.randint(1, 6)))
+        for _ in range(lines)
+    )
+
+
+class TestComplexityScoring:
+    """Test the one-pass complexity scorer against the original heuristics."""
+
+    def test_known_cases(self):
+        selector = XSDFormatSelector()
+        assert selector.get_format_recommendation(SIMPLE_CASE)[0] is FormatType.SIMPLE
+        format_type, reasoning, metrics = selector.get_format_recommendation(COMPLEX_CASE)
+        assert format_type is FormatType.COMPLEX
+        assert metrics == reference_metrics(COMPLEX_CASE)
+        assert reasoning.endswith(f"score={metrics.total_complexity_score:.2f}")
+
+    @pytest.mark.parametrize("lines", [0, 1, 5, 40])
+    def test_matches_reference_on_random_cases(self, lines):
+        rng = random.Random(lines)
+        selector = XSDFormatSelector()
+        for _ in range(50):
+            case = random_case(rng, lines)
+            assert selector.get_format_recommendation(case)[2] == reference_metrics(case), case
+
+    def test_batch_matches_single(self):
+        rng = random.Random(7)
+        cases = [random_case(rng, rng.randint(1, 20)) for _ in range(30)]
+        selector = XSDFormatSelector()
+        assert selector.get_format_recommendations(cases) == [selector.get_format_recommendation(c) for c in cases]
+
+
+class TestAnalyzeBatch:
+    """Test the NDJSON batch endpoint of the format selector service."""
+
+    def test_batch_results_keep_order_and_report_errors(self):
+        client = TestClient(format_selector.app)
+        body = "\n".join([
+            json.dumps({"case_id": "simple", "pipe_data": SIMPLE_CASE}),
+            "",
+            json.dumps({"pipe_data": COMPLEX_CASE}),
+            "{not json",
+        ])
+        r = client.post("/analyze_batch", content=body, headers={"content-type": "application/x-ndjson"})
+        assert r.status_code == 200
+        records = [json.loads(line) for line in r.text.splitlines()]
+        assert [rec.get("case_id") for rec in records[:3]] == ["simple", "1", None]
+        assert records[0]["recommended_format"] == "format2_simple"
+        assert records[1]["recommended_format"] == "format1_complex"
+        single = client.post("/analyze", json={"pipe_data": COMPLEX_CASE}).json()
+        assert records[1]["complexity_metrics"] == single["complexity_metrics"]
+        assert records[2]["success"] is False
+        summary = records[3]["summary"]
+        assert summary["total"] == 3 and summary["failed"] == 1
+        assert summary["formats"] == {"format2_simple": 1, "format1_complex": 1}
+
+    def test_batch_body_is_read_in_chunks_and_checked_for_utf8(self):
+        client = TestClient(format_selector.app)
+        body = "\n".join(json.dumps({"case_id": f"c{i}", "pipe_data": "Entität|Zürich"}) for i in range(50)).encode("utf-8")
+        # Chunks of 7 bytes split the two-byte characters
+        r = client.post("/analyze_batch", content=(body[i:i + 7] for i in range(0, len(body), 7)))
+        records = [json.loads(line) for line in r.text.splitlines()]
+        assert r.status_code == 200 and records[-1]["summary"]["total"] == 50
+        assert [rec["case_id"] for rec in records[:-1]] == [f"c{i}" for i in range(50)]
+
+        r = client.post("/analyze_batch", content=b'{"pipe_data": "ok"}\n{"pipe_data": "\xff\xfe"}\n')
+        assert r.status_code == 400
+        assert "UTF-8" in r.json()["detail"]
+        r = client.post("/analyze_batch", content=b'{"pipe_data": "truncated \xc3')
+        assert r.status_code == 400
+
+
+def chunked(data: bytes, rng: random.Random):
+    start = 0
+    while start < len(data):
+        size = rng.randint(1, 16)
+        yield data[start:start + size]
+        start += size
+
+
+class TestStreamingSelection:
+    """Test incremental scoring over lines and byte chunks, with early exit."""
+
+    def test_full_metrics_match_whole_text_for_any_chunking(self):
+        rng = random.Random(3)
+        selector = XSDFormatSelector()
+        for _ in range(40):
+            case = random_case(rng, rng.randint(0, 12))
+            expected = selector.get_format_recommendation(case)
+            assert selector.get_format_recommendation_stream(chunked(case.encode("utf-8"), rng), True) == expected
+            assert selector.get_format_recommendation_stream(case.splitlines(keepends=True), True) == expected
+
+    def test_stops_reading_once_complex(self):
+        consumed = []
+
+        def lines():
+            for line in COMPLEX_CASE.splitlines(keepends=True) * 1000:
+                consumed.append(line)
+                yield line
+
+        format_type, reasoning, metrics = XSDFormatSelector().get_format_recommendation_stream(lines())
+        assert format_type is FormatType.COMPLEX
+        assert not metrics.complete and "stopped early" in reasoning
+        assert metrics.total_complexity_score > XSDFormatSelector.SIMPLE_THRESHOLD
+        assert len(consumed) < 8
+
+    def test_simple_case_is_read_to_the_end(self):
+        format_type, _, metrics = XSDFormatSelector().get_format_recommendation_stream(SIMPLE_CASE.splitlines(keepends=True))
+        assert format_type is FormatType.SIMPLE
+        assert metrics.complete
+        assert metrics == reference_metrics(SIMPLE_CASE)
+
+    def test_large_file_in_bounded_memory(self, tmp_path):
+        import tracemalloc
+
+        path = tmp_path / "case.txt"
+        line = "Comment|free text without any scored field names at all\n"
+        with open(path, "w") as f:
+            for _ in range(50_000):
+                f.write(line)
+        selector = XSDFormatSelector()
+        tracemalloc.start()
+        format_type, _, metrics = selector.get_format_recommendation_file(str(path), full_metrics=True)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert metrics.complete and format_type is FormatType.SIMPLE  # 0 scored tokens + bonus 3.0
+        assert metrics.total_complexity_score == 3.0
+        assert peak < 2 * 1024 * 1024, f"peak {peak} bytes for a {path.stat().st_size} byte file"
+
+    def test_stream_endpoint(self):
+        client = TestClient(format_selector.app)
+        body = (COMPLEX_CASE + "\n").encode("utf-8") * 200
+        r = client.post("/analyze_stream", content=(body[i:i + 256] for i in range(0, len(body), 256)))
+        assert r.status_code == 200
+        result = r.json()
+        assert result["recommended_format"] == "format1_complex"
+        assert result["complexity_metrics"]["complete"] is False
+
+        r = client.post("/analyze_stream?full_metrics=true", content=SIMPLE_CASE.encode("utf-8"))
+        single = client.post("/analyze", json={"pipe_data": SIMPLE_CASE}).json()
+        assert r.json()["complexity_metrics"] == single["complexity_metrics"]
+        assert r.json()["bytes_read"] == len(SIMPLE_CASE)
@@ -0,0 +1,204 @@
+import asyncio
+
+import pytest
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from services.llm_filler.app.generation import GenerationWorker
+from services.llm_filler.app.prefix_cache import PrefixCache
+
+
+class CharTokenizer:
+    """Byte-level tokenizer with the slice of the HF interface the worker uses."""
+
+    pad_token_id = 0
+    eos_token_id = 0
+    all_special_ids = [0]
+
+    def __len__(self):
+        return 257
+
+    def __call__(self, prompts, return_tensors="pt", padding=True, truncation=True, max_length=None,
+                 add_special_tokens=True):
+        ids = [self.special(add_special_tokens) + [b + 1 for b in p.encode("utf-8")] for p in prompts]
+        ids = [x[:max_length] for x in ids]
+        width = max(len(x) for x in ids)
+        # Left padding, as the real tokenizer is configured
+        input_ids = [[self.pad_token_id] * (width - len(x)) + x for x in ids]
+        mask = [[0] * (width - len(x)) + [1] * len(x) for x in ids]
+        return {"input_ids": torch.tensor(input_ids), "attention_mask": torch.tensor(mask)}
+
+    def special(self, add_special_tokens: bool) -> list[int]:
+        return []
+
+    def decode(self, ids, skip_special_tokens=True):
+        return bytes(int(i) - 1 for i in ids if 0 < int(i) < 257).decode("utf-8", errors="replace")
+
+
+class BosCharTokenizer(CharTokenizer):
+    """CharTokenizer that starts every sequence with a BOS token, like Llama/SentencePiece tokenizers."""
+
+    bos_token_id = 257
+    all_special_ids = [0, 257]
+
+    def __len__(self):
+        return 258
+
+    def special(self, add_special_tokens: bool) -> list[int]:
+        return [self.bos_token_id] if add_special_tokens else []
+
+
+def tiny_model(vocab_size: int = 257):
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=vocab_size, n_positions=256, n_embd=32, n_layer=1, n_head=2,
+                        bos_token_id=0, eos_token_id=0)
+    return GPT2LMHeadModel(config).eval()
+
+
+@pytest.fixture
+def worker():
+    loads = []
+
+    def load():
+        loads.append(1)
+        return CharTokenizer(), tiny_model()
+
+    w = GenerationWorker(load, max_batch_size=4, max_wait_ms=50)
+    w.loads = loads
+    yield w
+    w.stop()
+
+
+class TestGenerationWorker:
+    """Test batched generation on the worker thread."""
+
+    def test_concurrent_prompts_share_a_batch(self, worker):
+        prompts = ["<a>", "<report>", "<b", "<transaction id="]
+
+        async def run():
+            return await asyncio.gather(*(worker.generate(p, max_new_tokens=5) for p in prompts))
+
+        results = asyncio.run(run())
+        assert [r.batch_size for r in results] == [4, 4, 4, 4]
+        assert [r.prompt_tokens for r in results] == [len(p) for p in prompts]
+        assert all(r.text.startswith(p) for r, p in zip(results, prompts))
+        stats = worker.stats()
+        assert (stats["batches"], stats["requests"], stats["batch_sizes"]) == (1, 4, {4: 1})
+        assert stats["generated_tokens"] > 0 and stats["tokens_per_sec"] > 0
+        assert stats["queue_depth"] == 0
+        assert len(worker.loads) == 1
+
+    def test_batched_output_matches_single_prompt(self, worker):
+        async def alone():
+            return await worker.generate("<report>", max_new_tokens=6)
+
+        async def together():
+            return await asyncio.gather(worker.generate("<report>", max_new_tokens=6),
+                                        worker.generate("a much longer prompt <x>", max_new_tokens=2))
+
+        single = asyncio.run(alone())
+        batched, short = asyncio.run(together())
+        assert batched.generated_text == single.generated_text
+        assert short.new_tokens <= 2
+
+    def test_sampling_settings_are_not_mixed(self, worker):
+        async def run():
+            return await asyncio.gather(
+                worker.generate("<a>", max_new_tokens=2),
+                worker.generate("<b>", max_new_tokens=2, do_sample=True, temperature=0.7),
+                worker.generate("<c>", max_new_tokens=2),
+            )
+
+        greedy_a, sampled, greedy_c = asyncio.run(run())
+        assert (greedy_a.batch_size, sampled.batch_size, greedy_c.batch_size) == (2, 1, 2)
+
+    def test_load_failure_is_raised_to_callers(self):
+        def load():
+            raise RuntimeError("no model")
+
+        w = GenerationWorker(load, max_wait_ms=1)
+        try:
+            with pytest.raises(RuntimeError, match="no model"):
+                asyncio.run(w.generate("<a>"))
+            assert w.stats()["failed"] == 1
+        finally:
+            w.stop()
+
+
+PREFIX = "Schema Context:\n- element:/Report/EntityName\n\nIMPORTANT: Generate valid XML only.\n\nData to include:\n"
+SUFFIXES = ['{"EntityName": "A"}\n\nXML:', '{"EntityName": "Longer name", "Amount": 5}\n\nXML:']
+
+
+class TestPrefixCache:
+    """Test prefix KV-cache reuse in the generation worker."""
+
+    def run(self, worker, with_prefix: bool):
+        async def go():
+            return await asyncio.gather(*(
+                worker.generate(s, max_new_tokens=6, prefix=PREFIX) if with_prefix
+                else worker.generate(PREFIX + s, max_new_tokens=6)
+                for s in SUFFIXES
+            ))
+        return asyncio.run(go())
+
+    def test_cached_prefix_gives_the_same_output(self):
+        model = tiny_model()
+        plain = GenerationWorker(lambda: (CharTokenizer(), model), max_wait_ms=50)
+        cached = GenerationWorker(lambda: (CharTokenizer(), model), max_wait_ms=50, prefix_cache=PrefixCache())
+        try:
+            expected = [r.text for r in self.run(plain, with_prefix=False)]
+            first = self.run(cached, with_prefix=True)
+            second = self.run(cached, with_prefix=True)
+            assert [r.text for r in first] == expected
+            assert [r.text for r in second] == expected
+            stats = cached.stats()["prefix_cache"]
+            assert (stats["entries"], stats["hits"], stats["misses"]) == (1, 1, 1)
+            assert stats["prefill_tokens_saved"] == len(PREFIX) * len(SUFFIXES)
+            assert cached.stats()["prefill_tokens"] < 2 * plain.stats()["prefill_tokens"]
+        finally:
+            plain.stop()
+            cached.stop()
+
+    def test_bos_is_not_repeated_after_the_prefix(self):
+        model = tiny_model(vocab_size=258)
+        plain = GenerationWorker(lambda: (BosCharTokenizer(), model), max_wait_ms=50)
+        cached = GenerationWorker(lambda: (BosCharTokenizer(), model), max_wait_ms=50, prefix_cache=PrefixCache())
+        try:
+            expected = self.run(plain, with_prefix=False)
+            for _ in range(2):  # computing the entry, then reusing it
+                results = self.run(cached, with_prefix=True)
+                assert [r.prompt_tokens for r in results] == [len(PREFIX + s) + 1 for s in SUFFIXES]
+                assert [r.text for r in results] == [r.text for r in expected]
+        finally:
+            plain.stop()
+            cached.stop()
+
+    def test_different_prefixes_are_not_batched(self):
+        worker = GenerationWorker(lambda: (CharTokenizer(), tiny_model()), max_wait_ms=50, prefix_cache=PrefixCache())
+
+        async def go():
+            return await asyncio.gather(
+                worker.generate("x", max_new_tokens=2, prefix="format1: "),
+                worker.generate("y", max_new_tokens=2, prefix="format2: "),
+                worker.generate("z", max_new_tokens=2, prefix="format1: "),
+            )
+
+        try:
+            a, b, c = asyncio.run(go())
+            assert (a.batch_size, b.batch_size, c.batch_size) == (2, 1, 2)
+            assert worker.stats()["prefix_cache"]["entries"] == 2
+        finally:
+            worker.stop()
+
+    def test_lru_eviction_by_bytes(self):
+        model = tiny_model()
+        tokenizer = CharTokenizer()
+        cache = PrefixCache(max_entries=8)
+        entries = {p: cache.compute(model, tokenizer([p])["input_ids"][0]) for p in ("aaaa", "bbbb", "cccc")}
+        cache.max_bytes = 2 * entries["aaaa"].nbytes
+        for p, entry in entries.items():
+            cache.put(("m", p), entry)
+        assert cache.get(("m", "aaaa")) is None
+        assert cache.get(("m", "cccc")) is entries["cccc"]
+        assert cache.stats()["evictions"] == 1
+        assert cache.bytes == 2 * entries["aaaa"].nbytes
@@ -0,0 +1,63 @@
+import asyncio
+
+import httpx
+
+from packages.shared.http_clients import ServiceClients, ServiceConfig
+
+
+def make_clients():
+    clients = ServiceClients({
+        "validator": ServiceConfig("http://validator.test", timeout=5, max_connections=4),
+        "rag": ServiceConfig("http://rag.test"),
+    })
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/fail":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, json={"path": request.url.path, "host": request.url.host})
+
+    return clients, handler
+
+
+class TestServiceClients:
+    """Test the shared pooled client registry."""
+
+    def test_clients_are_reused_and_metered(self):
+        async def run():
+            clients, handler = make_clients()
+            await clients.start()
+            client = clients.get("validator")
+            client._transport.inner = httpx.MockTransport(handler)
+            assert clients.get("validator") is client
+
+            r = await client.post("/validate_with_format", json={})
+            assert r.json() == {"path": "/validate_with_format", "host": "validator.test"}
+            try:
+                await client.get("/fail")
+            except httpx.ConnectError:
+                pass
+
+            stats = clients.stats()
+            await clients.close()
+            return stats, client
+
+        stats, client = asyncio.run(run())
+        assert stats["validator"]["requests"] == 2
+        assert stats["validator"]["errors"] == 1
+        assert stats["validator"]["in_flight"] == 0
+        assert stats["validator"]["max_connections"] == 4
+        assert stats["rag"]["open"] is True
+        assert client.is_closed
+
+    def test_get_reopens_after_close(self):
+        async def run():
+            clients, _ = make_clients()
+            await clients.start()
+            first = clients.get("rag")
+            await clients.close()
+            second = clients.get("rag")
+            await clients.close()
+            return first, second
+
+        first, second = asyncio.run(run())
+        assert first is not second
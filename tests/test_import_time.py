@@ -0,0 +1,47 @@
+"""Import-time regression checks for the services that need no ML stack.
+
+Each entrypoint is imported in a fresh interpreter under ``python -X importtime``.
+The test fails if a heavy ML module gets pulled in at import, or if the total
+import time goes over ``IMPORT_TIME_BUDGET_MS``. The budget is loose enough
+for a slow CI box but well under what torch + transformers alone cost. Run
+with ``-s`` to see the slowest imports.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), "..")
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers", "faiss", "numpy", "pandas", "fitz", "docx")
+LIGHT_ENTRYPOINTS = ("services.format_selector.app.main", "services.orchestrator.app.main", "sar_agent.app")
+IMPORT_TIME_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "2500"))
+
+
+def import_profile(module: str) -> dict[str, float]:
+    """Cumulative import time in ms of every module loaded by ``import module``."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=REPO_ROOT, capture_output=True, text=True)
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    profile = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = int(cumulative) / 1000
+    return profile
+
+
+class TestImportTime:
+    """Light services must start without importing the ML stack."""
+
+    @pytest.mark.parametrize("entrypoint", LIGHT_ENTRYPOINTS)
+    def test_no_heavy_imports(self, entrypoint):
+        profile = import_profile(entrypoint)
+        heavy = sorted(name for name in profile if name.split(".")[0] in HEAVY_MODULES)
+        assert not heavy, f"{entrypoint} imports {heavy[:5]}"
+
+        total = profile[entrypoint]
+        slowest = sorted(((ms, name) for name, ms in profile.items() if "." not in name), reverse=True)[:5]
+        print(f"\n{entrypoint}: {total:.0f} ms; " + ", ".join(f"{name} {ms:.0f} ms" for ms, name in slowest))
+        assert total < IMPORT_TIME_BUDGET_MS
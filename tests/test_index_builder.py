@@ -0,0 +1,164 @@
+import faiss
+import numpy as np
+import pytest
+
+from packages.shared.index_params import load_params, save_params
+from services.rag.app.index_cache import IndexCache
+from services.template_fetcher.app.incremental import BatchEncoder, IndexManifest, corpus_by_id, is_unchanged, update_index
+from services.template_fetcher.app import incremental, index_builder
+from services.template_fetcher.app.index_builder import build_index, choose_index_type
+
+
+def clustered_vectors(n, dim=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=n)] + 0.1 * rng.standard_normal((n, dim)).astype(np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+class TestIndexBuilder:
+    """Test template_fetcher's index type selection and construction."""
+
+    def test_auto_selection_by_corpus_size(self, monkeypatch):
+        monkeypatch.setattr(index_builder, "FLAT_MAX_VECTORS", 100)
+        monkeypatch.setattr(index_builder, "IVF_FLAT_MAX_VECTORS", 1000)
+        assert choose_index_type(50) == "flat"
+        assert choose_index_type(500) == "ivf_flat"
+        assert choose_index_type(5000) == "ivf_pq"
+
+    @pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "ivf_pq", "hnsw"])
+    def test_each_type_finds_exact_matches(self, index_type):
+        vectors = clustered_vectors(2000)
+        index, params = build_index(vectors, index_type)
+        assert params["index_type"] == index_type
+        assert index.ntotal == params["ntotal"] == 2000
+        _, ids = index.search(vectors[:50], 1)
+        if index_type == "ivf_pq":
+            # PQ codes are lossy: the best hit should at least be in the query's cluster
+            similarity = np.einsum("ij,ij->i", vectors[:50], vectors[ids[:, 0]])
+            assert (similarity > 0.8).all()
+        else:
+            assert sum(int(ids[i, 0]) == i for i in range(50)) >= 48
+
+    def test_unknown_type_is_rejected(self):
+        with pytest.raises(ValueError):
+            build_index(clustered_vectors(10), "lsh")
+
+    def test_saved_params_are_applied_by_rag(self, tmp_path):
+        vectors = clustered_vectors(2000)
+        index, params = build_index(vectors, "ivf_flat")
+        params["nprobe"] = 3
+        faiss.write_index(index, str(tmp_path / "big.xsd.faiss"))
+        (tmp_path / "big.xsd.txt").write_text("\n".join(f"line {i}" for i in range(2000)) + "\n")
+        save_params(str(tmp_path), "big.xsd", params)
+
+        assert load_params(str(tmp_path), "big.xsd")["nprobe"] == 3
+        assert load_params(str(tmp_path), "missing.xsd") == {}
+        loaded = IndexCache(str(tmp_path)).get("big.xsd")
+        assert faiss.extract_index_ivf(loaded.index).nprobe == 3
+        assert loaded.params["index_type"] == "ivf_flat"
+
+
+class CountingEncoder:
+    """Deterministic per-line vectors that record which lines were embedded."""
+
+    def __init__(self, dim=16):
+        self.dim = dim
+        self.encoded = []
+
+    def __call__(self, texts):
+        self.encoded.extend(texts)
+        vectors = np.stack([
+            np.random.default_rng(abs(hash(text)) % (2 ** 32)).standard_normal(self.dim).astype(np.float32)
+            for text in texts
+        ])
+        faiss.normalize_L2(vectors)
+        return vectors
+
+
+class TestIncrementalIndex:
+    """Test content-hash based incremental re-indexing."""
+
+    def test_only_new_lines_are_embedded(self):
+        encode = CountingEncoder()
+        first = update_index(None, {}, None, ["a", "b", "c"], BatchEncoder(encode), xsd_sha256="v1")
+        assert first.rebuilt and encode.encoded == ["a", "b", "c"]
+
+        encode.encoded.clear()
+        second = update_index(first.index, first.params, first.manifest, ["a", "c", "d"], BatchEncoder(encode),
+                              xsd_sha256="v2")
+        assert not second.rebuilt
+        assert encode.encoded == ["d"]
+        assert (second.added, second.removed) == (1, 1)
+        assert second.index.ntotal == 3
+
+        lines = list(corpus_by_id(second.manifest, second.lines))
+        assert lines == ["a", "", "c", "d"]
+        _, ids = second.index.search(encode(["d"]), 1)
+        assert lines[ids[0, 0]] == "d"
+
+    def test_ivf_index_supports_removal(self):
+        corpus = [f"line {i}" for i in range(500)]
+        encode = BatchEncoder(CountingEncoder())
+        first = update_index(None, {}, None, corpus, encode, index_type="ivf_flat")
+        second = update_index(first.index, first.params, first.manifest, corpus[10:], encode)
+        assert not second.rebuilt and second.removed == 10
+        assert second.index.ntotal == 490
+
+    @pytest.mark.parametrize("max_train", [10_000, 150])
+    def test_ivf_training_sample_is_embedded_once(self, monkeypatch, max_train):
+        monkeypatch.setattr(incremental, "training_indices",
+                            lambda n: index_builder.training_indices(n, max_vectors=max_train))
+        encode = CountingEncoder()
+        progress = []
+        encoder = BatchEncoder(encode, batch_size=64, progress=lambda done, total: progress.append(done / total))
+        corpus = [f"line {i}" for i in range(500)]
+        update = update_index(None, {}, None, corpus, encoder, index_type="ivf_flat")
+        assert sorted(encode.encoded) == sorted(corpus)
+        assert progress == sorted(progress)
+        update.index.nprobe = update.params["nlist"]
+        _, ids = update.index.search(encode(["line 321"]), 1)
+        assert list(corpus_by_id(update.manifest, update.lines))[ids[0, 0]] == "line 321"
+
+    @pytest.mark.parametrize("index_type", ["auto", "flat", "ivf_pq", "hnsw"])
+    def test_empty_corpus_is_rejected(self, index_type):
+        with pytest.raises(ValueError, match="empty corpus"):
+            update_index(None, {}, None, [], BatchEncoder(CountingEncoder()), index_type=index_type)
+
+    def test_hnsw_removal_rebuilds(self):
+        encode = BatchEncoder(CountingEncoder())
+        first = update_index(None, {}, None, ["a", "b"], encode, index_type="hnsw")
+        second = update_index(first.index, first.params, first.manifest, ["a"], encode)
+        assert second.rebuilt and second.params["index_type"] == "hnsw"
+
+    def test_unchanged_xsd_is_detected(self, tmp_path):
+        update = update_index(None, {}, None, ["a"], BatchEncoder(CountingEncoder()), xsd_sha256="abc")
+        assert not is_unchanged(str(tmp_path), "x.xsd", "abc")
+        update.manifest.save(str(tmp_path), "x.xsd")
+        faiss.write_index(update.index, str(tmp_path / "x.xsd.faiss"))
+        (tmp_path / "x.xsd.txt").write_text("a\n")
+        assert IndexManifest.load(str(tmp_path), "x.xsd") == update.manifest
+        assert is_unchanged(str(tmp_path), "x.xsd", "abc")
+        assert not is_unchanged(str(tmp_path), "x.xsd", "def")
+        assert not is_unchanged(str(tmp_path), "x.xsd", "abc", index_type="hnsw")
+
+    def test_batches_are_bounded_and_staged(self):
+        encode = CountingEncoder()
+        sizes, progress = [], []
+
+        def recording(texts):
+            sizes.append(len(texts))
+            return encode(texts)
+
+        encoder = BatchEncoder(recording, batch_size=64, staging_dtype="float16",
+                               progress=lambda done, total: progress.append(done / total))
+        corpus = (f"line {i}" for i in range(1000))
+        update = update_index(None, {}, None, corpus, encoder, index_type="flat")
+        assert max(sizes) == 64 and sum(sizes) == 1000
+        assert progress[0] == 0 and progress == sorted(progress)
+        assert update.index.ntotal == 1000
+        batch = next(encoder.batches(["x"]))[1]
+        assert batch.dtype == np.float16
+        _, ids = update.index.search(encode(["line 500"]), 1)
+        assert list(corpus_by_id(update.manifest, update.lines))[ids[0, 0]] == "line 500"
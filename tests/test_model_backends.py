@@ -0,0 +1,71 @@
+import pytest
+import torch
+from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+from transformers import AutoModelForCausalLM, GPT2Config, GPT2LMHeadModel
+
+from packages.shared import model_backends
+from packages.shared.model_backends import apply_backend, load_model, model_bytes
+
+
+def tiny_model():
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=257, n_positions=64, n_embd=64, n_layer=2, n_head=2,
+                        bos_token_id=0, eos_token_id=0)
+    return GPT2LMHeadModel(config).eval()
+
+
+INPUT_IDS = torch.tensor([[5, 17, 42, 99, 3]])
+
+
+class TestModelBackends:
+    """Backends convert a loaded model without changing what it predicts (beyond rounding)."""
+
+    def test_conv1d_layers_become_equivalent_linears(self):
+        model = tiny_model()
+        expected = model(INPUT_IDS).logits
+        converted = model_backends._conv1d_to_linear(tiny_model())
+        assert isinstance(converted.transformer.h[0].attn.c_attn, torch.nn.Linear)
+        assert torch.allclose(converted(INPUT_IDS).logits, expected, atol=1e-5)
+
+    def test_int8_quantizes_linears_and_shrinks_the_model(self):
+        model = tiny_model()
+        expected = model(INPUT_IDS).logits
+        quantized = apply_backend(tiny_model(), "int8")
+        assert isinstance(quantized.transformer.h[0].mlp.c_fc, DynamicLinear)
+        assert model_bytes(quantized) < model_bytes(model)
+        with torch.inference_mode():
+            logits = quantized(INPUT_IDS).logits
+        assert (logits - expected).abs().max() < 0.1
+        out = quantized.generate(INPUT_IDS, max_new_tokens=4, do_sample=False, pad_token_id=0)
+        assert out.shape == (1, 9)
+
+    def test_bf16_halves_weights_or_keeps_fp32_when_unsupported(self, monkeypatch):
+        model = tiny_model()
+        monkeypatch.setattr(model_backends, "bf16_supported", lambda: True)
+        assert apply_backend(tiny_model(), "bf16").transformer.wte.weight.dtype == torch.bfloat16
+        assert model_bytes(apply_backend(tiny_model(), "bf16")) == model_bytes(model) // 2
+        monkeypatch.setattr(model_backends, "bf16_supported", lambda: False)
+        assert apply_backend(tiny_model(), "bf16").transformer.wte.weight.dtype == torch.float32
+
+    @pytest.mark.parametrize("capability, supported", [("AVX512_BF16", True), ("AMX", True),
+                                                        ("AVX512", False), ("AVX2", False)])
+    def test_bf16_needs_native_cpu_support(self, monkeypatch, capability, supported):
+        monkeypatch.setattr(torch.cuda, "is_available", lambda: False)
+        monkeypatch.setattr(torch.backends.cpu, "get_cpu_capability", lambda: capability)
+        assert model_backends.bf16_supported() is supported
+
+    def test_load_model_from_disk(self, tmp_path, monkeypatch):
+        tiny_model().save_pretrained(tmp_path)
+        model, backend = load_model(AutoModelForCausalLM, str(tmp_path), "int8", device_map="auto")
+        assert backend == "int8"
+        assert isinstance(model.lm_head, DynamicLinear)
+
+        # Without optimum installed the ONNX backend falls back to eager weights
+        monkeypatch.setattr(model_backends, "_load_onnx", lambda model_cls, name: None)
+        model, backend = load_model(AutoModelForCausalLM, str(tmp_path), "onnx")
+        assert backend == "default"
+        assert isinstance(model, GPT2LMHeadModel)
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError, match="Unknown inference backend"):
+            load_model(AutoModelForCausalLM, "unused", "fp4")
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.orchestrator.app import main as orchestrator
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def fake_format_selector(pipe_data):
+        if "boom" in pipe_data:
+            raise RuntimeError("selector down")
+        return {"recommended_format": "format2_simple", "reasoning": "test", "complexity_metrics": {}}
+
+    async def fake_llm_filler(pipe_data, use_rag):
+        return {"xml": "<SimpleReport/>"}
+
+    async def fake_validator(xml_string, format_type):
+        return {"valid": True, "format_type": format_type}
+
+    async def fake_templates():
+        return None
+
+    monkeypatch.setattr(orchestrator, "call_format_selector", fake_format_selector)
+    monkeypatch.setattr(orchestrator, "call_llm_filler", fake_llm_filler)
+    monkeypatch.setattr(orchestrator, "call_validator", fake_validator)
+    monkeypatch.setattr(orchestrator, "ensure_templates_available", fake_templates)
+    return TestClient(orchestrator.app)
+
+
+def read_ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+class TestPipelineBatch:
+    """Test the batch pipeline endpoint against stubbed downstream services."""
+
+    def test_ndjson_batch_streams_results_and_summary(self, client):
+        body = "\n".join(
+            json.dumps({"case_id": f"case-{i}", "pipe_data": f"EntityName|Corp {i}"}) for i in range(25)
+        )
+        r = client.post("/pipeline_batch?concurrency=4", content=body,
+                        headers={"content-type": "application/x-ndjson"})
+        assert r.status_code == 200
+        records = read_ndjson(r)
+        summary = records[-1]["summary"]
+        results = records[:-1]
+        assert len(results) == 25
+        assert {rec["case_id"] for rec in results} == {f"case-{i}" for i in range(25)}
+        assert all(rec["success"] for rec in results)
+        assert results[0]["result"]["recommended_format"] == "format2_simple"
+        assert summary["total"] == 25
+        assert summary["succeeded"] == 25
+        assert summary["concurrency"] == 4
+        assert set(summary["latency_ms"]) == {"mean", "p50", "p95", "p99", "max"}
+
+    def test_failed_and_malformed_cases_are_reported(self, client):
+        body = "\n".join([
+            json.dumps({"pipe_data": "EntityName|Good"}),
+            json.dumps({"pipe_data": "boom"}),
+            json.dumps({"case_id": "no-data"}),
+        ])
+        r = client.post("/pipeline_batch", content=body)
+        records = read_ndjson(r)
+        results = {rec["index"]: rec for rec in records[:-1]}
+        assert results[0]["success"] is True
+        assert results[0]["case_id"] == "0"
+        assert results[1]["success"] is False
+        assert "selector down" in results[1]["error"]
+        assert results[2]["success"] is False
+        assert records[-1]["summary"]["failed"] == 2
+
+    def test_invalid_utf8_line_fails_only_that_case(self, client):
+        lines = [json.dumps({"case_id": f"case-{i}", "pipe_data": f"EntityName|Corp {i}"}).encode() for i in range(5)]
+        lines[2] = b'{"case_id": "bad", "pipe_data": "EntityName|Caf\xe9"}'
+        r = client.post("/pipeline_batch", content=b"\n".join(lines))
+        records = read_ndjson(r)
+        results = {rec["index"]: rec for rec in records[:-1]}
+        assert sorted(results) == [0, 1, 2, 3, 4]
+        assert results[2]["success"] is False
+        assert "UTF-8" in results[2]["error"]
+        assert [results[i]["case_id"] for i in (3, 4)] == ["case-3", "case-4"]
+        assert records[-1]["summary"]["succeeded"] == 4
+
+        files = [("files", ("cases.ndjson", b"\n".join(lines), "application/x-ndjson")),
+                 ("files", ("latin1.txt", b"EntityName|Caf\xe9", "text/plain"))]
+        records = read_ndjson(client.post("/pipeline_batch", files=files))
+        assert records[-1]["summary"]["succeeded"] == 4
+        assert records[-1]["summary"]["failed"] == 2
+
+    def test_multipart_upload(self, client):
+        cases = "\n".join(json.dumps({"pipe_data": f"EntityName|Corp {i}"}) for i in range(3))
+        files = [
+            ("files", ("cases.ndjson", cases.encode(), "application/x-ndjson")),
+            ("files", ("single.txt", b"EntityName|Solo Corp", "text/plain")),
+        ]
+        r = client.post("/pipeline_batch", files=files)
+        records = read_ndjson(r)
+        assert records[-1]["summary"]["succeeded"] == 4
+        assert "single.txt" in {rec["case_id"] for rec in records[:-1]}
+
+    def test_rejects_out_of_range_concurrency(self, client):
+        r = client.post("/pipeline_batch?concurrency=0", content="")
+        assert r.status_code == 400
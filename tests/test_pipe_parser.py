@@ -0,0 +1,94 @@
+import csv
+import multiprocessing
+
+import pytest
+
+from services.parser.app.pipe_parser import chunk_ranges, iter_pipe_row_chunks, iter_pipe_rows, parse_pipe_file, read_header
+
+
+def reference_rows(file_path: str) -> list[dict]:
+    """The original single-pass csv.DictReader parse, minus the per-row timestamp."""
+    rows = []
+    with open(file_path, newline="", encoding="utf-8") as f:
+        for i, row in enumerate(csv.DictReader(f, delimiter="|")):
+            rows.append({
+                "row_number": i + 1,
+                "raw_data": row,
+                "entity_name": row.get("EntityName", row.get("entity_name", "")),
+                "transaction_id": row.get("TransactionID", row.get("transaction_id", "")),
+                "amount": float(row.get("Amount", row.get("amount", "0"))) if row.get("Amount") or row.get("amount") else 0,
+            })
+    return rows
+
+
+def comparable(row: dict) -> dict:
+    return {k: row[k] for k in ("row_number", "raw_data", "entity_name", "transaction_id", "amount")}
+
+
+def write_extract(path, rows: int, newline: str = "\n") -> None:
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("EntityName|TransactionID|Amount|Status" + newline)
+        for i in range(rows):
+            if i % 97 == 0:
+                f.write(newline)  # blank lines are skipped
+            if i % 89 == 0:
+                f.write(f"Zürich Ünternehmen {i}|TX-{i}" + newline)  # short row: missing fields are None
+            elif i % 83 == 0:
+                f.write(f"Corp {i}|TX-{i}|{i}.5|Open|extra|fields" + newline)  # long row: extras under None
+            else:
+                f.write(f"Corp {i}|TX-{i}|{i * 10}.25|{'Open' if i % 2 else ''}" + newline)
+
+
+class TestPipeParser:
+    """Test the chunked parser against the original csv.DictReader behaviour."""
+
+    @pytest.mark.parametrize("newline", ["\n", "\r\n"])
+    @pytest.mark.parametrize("workers,chunk_bytes", [(0, 1 << 20), (0, 100), (2, 100), (3, 1000)])
+    def test_matches_reference(self, tmp_path, newline, workers, chunk_bytes):
+        path = tmp_path / "extract.txt"
+        write_extract(path, 2000, newline)
+        rows = list(iter_pipe_rows(str(path), workers=workers, chunk_bytes=chunk_bytes))
+        assert [comparable(r) for r in rows] == reference_rows(str(path))
+        assert len({r["parsed_at"] for r in rows}) == 1
+        assert rows[0]["source_file"] == str(path)
+
+    def test_chunks_end_on_line_boundaries(self, tmp_path):
+        path = tmp_path / "extract.txt"
+        write_extract(path, 500)
+        fieldnames, offset = read_header(str(path))
+        assert fieldnames == ["EntityName", "TransactionID", "Amount", "Status"]
+        ranges = chunk_ranges(str(path), offset, 64)
+        data = path.read_bytes()
+        assert ranges[0][0] == offset and ranges[-1][1] == len(data)
+        assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+        assert all(data[end - 1:end] == b"\n" for _, end in ranges[:-1])
+
+    def test_no_trailing_newline_and_header_only(self, tmp_path):
+        path = tmp_path / "extract.txt"
+        path.write_text("EntityName|Amount\nA|1\nB|2")
+        assert [r["amount"] for r in iter_pipe_rows(str(path), workers=2, chunk_bytes=4)] == [1.0, 2.0]
+        path.write_text("EntityName|Amount\n")
+        assert parse_pipe_file(str(path)) == []
+
+    def test_bad_amount_fails_the_parse(self, tmp_path):
+        path = tmp_path / "extract.txt"
+        path.write_text("EntityName|Amount\n" + "A|1\n" * 100 + "B|n/a\n")
+        with pytest.raises(ValueError):
+            list(iter_pipe_rows(str(path), workers=2, chunk_bytes=64))
+
+    def test_rows_stream_in_bounded_chunks(self, tmp_path):
+        path = tmp_path / "extract.txt"
+        write_extract(path, 5000)
+        sizes = [len(rows) for rows in iter_pipe_row_chunks(str(path), workers=2, chunk_bytes=4096, max_pending=2)]
+        assert len(sizes) > 10
+        assert max(sizes) < 200
+        assert sum(sizes) == len(reference_rows(str(path)))
+
+    def test_closing_early_shuts_the_pool_down(self, tmp_path):
+        path = tmp_path / "extract.txt"
+        write_extract(path, 5000)
+        chunks = iter_pipe_row_chunks(str(path), workers=2, chunk_bytes=4096)
+        assert next(chunks)
+        assert multiprocessing.active_children()
+        chunks.close()
+        assert not multiprocessing.active_children()
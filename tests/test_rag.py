@@ -0,0 +1,216 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+from packages.shared.embedding_cache import EmbeddingCache
+from packages.shared.index_params import save_params
+from services.rag.app.index_cache import IndexCache
+from services.rag.app.result_cache import ResultCache
+
+
+def write_index(index_dir, cache_key, lines, dim=8):
+    vectors = np.random.default_rng(len(lines)).random((len(lines), dim), dtype=np.float32)
+    index = faiss.IndexFlatIP(dim)
+    index.add(vectors)
+    faiss.write_index(index, os.path.join(index_dir, f"{cache_key}.faiss"))
+    with open(os.path.join(index_dir, f"{cache_key}.txt"), "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(line + "\n")
+
+
+class TestIndexCache:
+    """Test the RAG service's loaded-index cache."""
+
+    def test_repeated_gets_hit_the_cache(self, tmp_path):
+        write_index(tmp_path, "a.xsd", ["element:a", "element:b"])
+        cache = IndexCache(str(tmp_path))
+        first = cache.get("a.xsd")
+        assert cache.get("a.xsd") is first
+        assert first.corpus == ["element:a", "element:b"]
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_rewritten_index_is_reloaded(self, tmp_path):
+        write_index(tmp_path, "a.xsd", ["element:a"])
+        cache = IndexCache(str(tmp_path))
+        cache.get("a.xsd")
+        write_index(tmp_path, "a.xsd", ["element:a", "element:b", "element:c"])
+        path = tmp_path / "a.xsd.faiss"
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        assert cache.get("a.xsd").index.ntotal == 3
+        assert cache.reloads == 1
+
+    def test_version_is_the_build_stamp_or_file_stamps(self, tmp_path):
+        write_index(tmp_path, "a.xsd", ["element:a"])
+        unstamped = IndexCache(str(tmp_path)).get("a.xsd").version
+        assert IndexCache(str(tmp_path)).get("a.xsd").version == unstamped
+        write_index(tmp_path, "a.xsd", ["element:a", "element:b"])
+        assert IndexCache(str(tmp_path)).get("a.xsd").version != unstamped
+        save_params(str(tmp_path), "a.xsd", {"index_type": "flat", "version": "build-1"})
+        assert IndexCache(str(tmp_path)).get("a.xsd").version == "build-1"
+
+    def test_eviction_and_invalidation(self, tmp_path):
+        write_index(tmp_path, "a.xsd", ["element:a"])
+        write_index(tmp_path, "b.xsd", ["element:b"])
+        cache = IndexCache(str(tmp_path), max_entries=1)
+        cache.get("a.xsd")
+        cache.get("b.xsd")
+        assert cache.evictions == 1
+        assert cache.invalidate("b.xsd") == 1
+        assert cache.stats()["entries"] == 0
+
+    def test_missing_index_raises(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            IndexCache(str(tmp_path)).get("missing.xsd")
+
+    def test_mmap_mode_loads_index(self, tmp_path):
+        write_index(tmp_path, "a.xsd", ["element:a", "element:b"])
+        loaded = IndexCache(str(tmp_path), mmap=True).get("a.xsd")
+        assert loaded.index.ntotal == 2
+
+
+class FakeEmbedder:
+    """Deterministic stand-in for SentenceTransformer that counts encode calls."""
+
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = []
+
+    def encode(self, texts, normalize_embeddings=True, **kwargs):
+        self.calls.append(list(texts))
+        rows = []
+        for text in texts:
+            rng = np.random.default_rng(sum(map(ord, text)))
+            v = rng.random(self.dim, dtype=np.float32)
+            rows.append(v / np.linalg.norm(v))
+        return np.array(rows, dtype=np.float32)
+
+
+@pytest.fixture
+def rag_client(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from services.rag.app import main as rag
+
+    write_index(tmp_path, "a.xsd", [f"element:a{i}" for i in range(6)])
+    write_index(tmp_path, "b.xsd", [f"element:b{i}" for i in range(4)])
+    embedder = FakeEmbedder()
+    monkeypatch.setattr(rag, "index_cache", IndexCache(str(tmp_path)))
+    monkeypatch.setattr(rag, "get_embedder", lambda: embedder)
+    monkeypatch.setattr(rag, "embedding_cache", EmbeddingCache("fake"))
+    monkeypatch.setattr(rag, "result_cache", ResultCache())
+    return TestClient(rag.app), embedder
+
+
+class TestQueryBatch:
+    """Test the batched retrieval endpoint."""
+
+    def test_batch_encodes_once_and_keeps_order(self, rag_client):
+        client, embedder = rag_client
+        queries = [
+            {"cache_key": "a.xsd", "query": "report header", "k": 2},
+            {"cache_key": "b.xsd", "query": "transaction amount", "k": 3},
+            {"cache_key": "a.xsd", "query": "transaction amount", "k": 1},
+            {"cache_key": "missing.xsd", "query": "anything", "k": 2},
+        ]
+        r = client.post("/query_batch", json={"queries": queries})
+        assert r.status_code == 200
+        results = r.json()["results"]
+        assert len(embedder.calls) == 1
+        assert sorted(embedder.calls[0]) == ["report header", "transaction amount"]
+        assert [len(item["results"]) for item in results] == [2, 3, 1, 0]
+        assert results[1]["results"][0]["text"].startswith("element:b")
+        assert "error" in results[3]
+
+    def test_batch_matches_single_queries(self, rag_client):
+        client, _ = rag_client
+        single = client.post("/query", json={"cache_key": "a.xsd", "query": "entity", "k": 3}).json()
+        batch = client.post("/query_batch", json={"queries": [
+            {"cache_key": "a.xsd", "query": "entity", "k": 3},
+            {"cache_key": "a.xsd", "query": "other", "k": 5},
+        ]}).json()
+        assert batch["results"][0]["results"] == single["results"]
+
+
+class TestResultCache:
+    """Test that repeated queries skip the embedder and FAISS."""
+
+    def test_repeat_query_is_served_from_cache(self, rag_client, monkeypatch):
+        from services.rag.app import main as rag
+        client, embedder = rag_client
+        body = {"cache_key": "a.xsd", "query": "report header", "k": 2}
+        first = client.post("/query", json=body).json()
+        monkeypatch.setattr(rag, "get_embedder", lambda: pytest.fail("embedder called on a cached query"))
+        assert client.post("/query", json=body).json() == first
+        batch = client.post("/query_batch", json={"queries": [body]}).json()
+        assert batch["results"][0]["results"] == first["results"]
+        assert rag.result_cache.stats()["hits"] == 2
+
+    def test_rebuilt_index_changes_version(self, rag_client, tmp_path):
+        from services.rag.app import main as rag
+        client, embedder = rag_client
+        body = {"cache_key": "b.xsd", "query": "amount", "k": 10}
+        assert len(client.post("/query", json=body).json()["results"]) == 4
+        write_index(tmp_path, "b.xsd", [f"element:new{i}" for i in range(7)])
+        client.post("/reload", json={"cache_key": "b.xsd"})
+        results = client.post("/query", json=body).json()["results"]
+        assert len(results) == 7
+        assert rag.result_cache.invalidations == 1
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self):
+        return self
+
+    def setex(self, key, ttl, value):
+        self.data[key] = value
+
+    def execute(self):
+        pass
+
+
+class TestEmbeddingCache:
+    """Test the shared (model, text) embedding cache."""
+
+    def test_only_uncached_texts_are_encoded(self):
+        embedder = FakeEmbedder()
+        cache = EmbeddingCache("fake")
+        first = cache.encode(embedder, ["format1_complex XML structure", "entity"])
+        second = cache.encode(embedder, ["format1_complex  XML structure ", "new text", "entity"])
+        assert embedder.calls == [["format1_complex XML structure", "entity"], ["new text"]]
+        np.testing.assert_array_equal(second[0], first[0])
+        np.testing.assert_array_equal(second[2], first[1])
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (2, 3)
+
+    def test_ttl_expiry_and_size_bound(self, monkeypatch):
+        embedder = FakeEmbedder()
+        cache = EmbeddingCache("fake", max_entries=2, ttl_seconds=10)
+        cache.encode(embedder, ["a", "b", "c"])
+        assert cache.stats()["entries"] == 2
+        assert cache.evictions == 1
+
+        import packages.shared.embedding_cache as module
+        now = module.time.time()
+        monkeypatch.setattr(module.time, "time", lambda: now + 60)
+        cache.encode(embedder, ["c"])
+        assert cache.expired == 1
+        assert embedder.calls[-1] == ["c"]
+
+    def test_redis_tier_is_shared(self):
+        redis = FakeRedis()
+        warm, cold = EmbeddingCache("fake"), EmbeddingCache("fake")
+        warm._redis = cold._redis = redis
+        embedder = FakeEmbedder()
+        vectors = warm.encode(embedder, ["shared query"])
+        again = cold.encode(embedder, ["shared query"])
+        assert len(embedder.calls) == 1
+        np.testing.assert_array_equal(vectors, again)
+        assert cold.stats()["redis_hits"] == 1
@@ -0,0 +1,167 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from packages.shared.http_clients import NoReadyInstance, ServiceClients, ServiceConfig
+from packages.shared.readiness import Readiness
+from services.llm_filler.app import main as llm_filler
+from services.llm_filler.app.generation import GenerationWorker
+from tests.test_generation import CharTokenizer, tiny_model
+
+
+class TestReadiness:
+    """Test the warm-up state machine and its timing breakdown."""
+
+    def test_warm_up_marks_ready_with_timings(self):
+        readiness = Readiness("svc", import_seconds=0.5)
+
+        async def warm_up():
+            with readiness.phase("weight_load"):
+                await asyncio.sleep(0.01)
+
+        async def run():
+            assert not readiness.ready
+            await readiness.start_warm_up(warm_up)
+
+        asyncio.run(run())
+        status = readiness.status()
+        assert status["ready"] and status["state"] == "ready"
+        assert status["timings"]["import"] == 0.5
+        assert status["timings"]["weight_load"] >= 0.01
+        assert "time_to_ready" in status["timings"]
+
+    def test_failed_warm_up_is_reported(self):
+        readiness = Readiness("svc")
+
+        async def warm_up():
+            raise OSError("weights not found")
+
+        async def run():
+            await readiness.start_warm_up(warm_up)
+
+        asyncio.run(run())
+        assert not readiness.ready
+        assert readiness.status()["error"] == "OSError: weights not found"
+
+
+def make_clients(ready: dict[str, bool]):
+    clients = ServiceClients({
+        "llm_filler": ServiceConfig("http://a.test, http://b.test", ready_path="/ready"),
+        "validator": ServiceConfig("http://validator.test"),
+    })
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/ready":
+            return httpx.Response(200 if ready[request.url.host] else 503)
+        return httpx.Response(200, json={"host": request.url.host})
+
+    async def start():
+        await clients.start()
+        for client in clients._clients.values():
+            client._transport.inner = httpx.MockTransport(handler)
+
+    return clients, start
+
+
+class TestReadyRouting:
+    """Test that clients only route to instances that passed their readiness probe."""
+
+    def test_only_ready_instances_get_traffic(self):
+        ready = {"a.test": False, "b.test": False}
+
+        async def run():
+            clients, start = make_clients(ready)
+            await start()
+            with pytest.raises(NoReadyInstance):
+                clients.get("llm_filler")
+            # Services without a probe are always routed to
+            assert (await clients.get("validator").get("/x")).json()["host"] == "validator.test"
+
+            ready["b.test"] = True
+            assert await clients.refresh_readiness() == {
+                "llm_filler": ["http://b.test"], "validator": ["http://validator.test"],
+            }
+            hosts = [(await clients.get("llm_filler").get("/x")).json()["host"] for _ in range(3)]
+            assert hosts == ["b.test"] * 3
+
+            ready["a.test"] = True
+            await clients.refresh_readiness()
+            hosts = {(await clients.get("llm_filler").get("/x")).json()["host"] for _ in range(4)}
+            assert hosts == {"a.test", "b.test"}
+
+            ready["a.test"] = ready["b.test"] = False
+            await clients.refresh_readiness()
+            with pytest.raises(NoReadyInstance):
+                clients.get("llm_filler")
+            stats = clients.stats()
+            await clients.close()
+            return stats
+
+        stats = asyncio.run(run())
+        assert stats["llm_filler"]["instances"] == 2
+        assert stats["llm_filler"]["ready_instances"] == 0
+        assert stats["llm_filler"]["requests"] == 3 * 2 + 3 + 4
+
+
+    def test_liveness_ignores_readiness(self):
+        ready = {"a.test": False, "b.test": False}
+
+        async def run():
+            clients, start = make_clients(ready)
+            await start()
+            live = await clients.check_liveness()
+            await clients.close()
+            return clients, live
+
+        clients, live = asyncio.run(run())
+        # Warming up is not down: both instances answer /health before either is ready
+        assert live == {
+            "llm_filler": {"http://a.test": True, "http://b.test": True},
+            "validator": {"http://validator.test": True},
+        }
+        assert clients.ready_urls("llm_filler") == []
+
+    def test_orchestrator_health_reports_warming_services_as_alive(self, monkeypatch):
+        from fastapi.testclient import TestClient
+        from services.orchestrator.app import main as orchestrator
+
+        clients, start = make_clients({"a.test": False, "b.test": False})
+        asyncio.run(start())
+        asyncio.run(clients.refresh_readiness())
+        monkeypatch.setattr(orchestrator, "clients", clients)
+        health = TestClient(orchestrator.app).get("/health").json()
+        assert health["dependent_services"] == {"llm_filler": True, "validator": True}
+        assert health["all_healthy"]
+        assert health["ready"] == {"llm_filler": False, "validator": True}
+        assert not health["all_ready"]
+
+
+class TestLLMFillerReady:
+    """Test that llm_filler only reports ready after its warm-up generation."""
+
+    def test_ready_after_warm_up(self, monkeypatch):
+        model, tokenizer = tiny_model(), CharTokenizer()
+        loaded = []
+
+        def load():
+            time.sleep(0.2)
+            loaded.append(True)
+            return tokenizer, model
+
+        monkeypatch.setattr(llm_filler, "generator", GenerationWorker(load, max_wait_ms=1))
+        monkeypatch.setattr(llm_filler, "readiness", Readiness("llm_filler"))
+        monkeypatch.setattr(llm_filler, "PRELOAD_MODELS", True)
+        with TestClient(llm_filler.app) as client:
+            r = client.get("/ready")
+            assert r.status_code == 503
+            assert client.get("/health").json() == {"ok": True, "ready": False}
+            deadline = time.time() + 10
+            while r.status_code != 200 and time.time() < deadline:
+                time.sleep(0.05)
+                r = client.get("/ready")
+            assert r.status_code == 200
+            assert loaded == [True]
+            assert "first_forward" in r.json()["timings"]
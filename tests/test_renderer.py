@@ -0,0 +1,102 @@
+import os
+
+from lxml import etree
+import pytest
+from fastapi.testclient import TestClient
+
+from services.llm_filler.app import main as llm_filler
+from services.llm_filler.app.main import parse_pipe_data
+import xmlschema
+
+from packages.shared.schema_model import build_schema_model
+from services.llm_filler.app import renderer as renderer_module
+from services.llm_filler.app.renderer import FormatRenderer, coerce_enum, coerce_value, get_renderer
+
+XSD_DIR = os.path.join(os.path.dirname(__file__), "..", "sar_agent", "regulator_xsds")
+SAMPLE = os.path.join(os.path.dirname(__file__), "..", "sar_agent", "sample_files", "complex_pipe_sample.txt")
+FORMATS = {"format1_complex": "format1_complex.xsd", "format2_simple": "format2_simple.xsd"}
+
+
+def validate(format_name: str, xml: str) -> list[str]:
+    schema = etree.XMLSchema(etree.parse(os.path.join(XSD_DIR, FORMATS[format_name])))
+    schema.validate(etree.fromstring(xml.encode("utf-8")))
+    return [e.message for e in schema.error_log]
+
+
+@pytest.fixture(scope="module")
+def sample_data():
+    with open(SAMPLE, "r", encoding="utf-8") as f:
+        return parse_pipe_data(f.read())
+
+
+class TestRenderer:
+    """Test the deterministic per-format XML renderer."""
+
+    @pytest.mark.parametrize("format_name", list(FORMATS))
+    def test_sample_renders_valid(self, format_name, sample_data):
+        assert validate(format_name, get_renderer(format_name).render(sample_data)) == []
+
+    @pytest.mark.parametrize("format_name", list(FORMATS))
+    def test_empty_record_is_valid(self, format_name):
+        assert validate(format_name, get_renderer(format_name).render({})) == []
+
+    def test_numbered_fields_become_occurrences(self, sample_data):
+        root = etree.fromstring(get_renderer("format1_complex").render(sample_data).encode("utf-8"))
+        ns = {"c": "http://www.regulator.gov/complex"}
+        ids = root.xpath("//c:Transactions/c:Transaction/c:TransactionID/text()", namespaces=ns)
+        assert ids == ["TXN-001", "TXN-002", "TXN-003"]
+        currencies = root.xpath("//c:Transaction/c:Amount/@currency", namespaces=ns)
+        assert currencies == ["USD", "USD", "USD"]
+
+    def test_occurrences_are_capped(self):
+        ns = {"c": "http://www.regulator.gov/complex"}
+        renderer = get_renderer("format1_complex")
+        count = lambda xml: len(etree.fromstring(xml.encode("utf-8")).xpath("//c:Transaction", namespaces=ns))
+        assert count(renderer.render({"TransactionID1000000": "TXN-X"})) == 1
+        assert count(renderer.render({"TransactionID" + "9" * 5000: "TXN-X"})) == 1
+        assert count(renderer.render({"TransactionID": [f"T{i}" for i in range(10_000)]})) == \
+            renderer_module.RENDER_MAX_OCCURRENCES
+
+        xsd = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema">
+          <xs:element name="R"><xs:complexType><xs:sequence>
+            <xs:element name="Item" type="xs:string" maxOccurs="2"/>
+          </xs:sequence></xs:complexType></xs:element>
+        </xs:schema>"""
+        bounded = FormatRenderer("bounded", build_schema_model(xmlschema.XMLSchema(xsd)), None, {})
+        root = etree.fromstring(bounded.render({"Item": ["a", "b", "c"], "Item5": "e"}).encode("utf-8"))
+        assert root.xpath("Item/text()") == ["a", "b"]
+
+    def test_values_are_escaped_and_coerced(self):
+        xml = get_renderer("format2_simple").render({
+            "ReportID": "A<&>B",
+            "TransactionAmount": "$1,250.50",
+            "TransactionDate": "12/01/2024",
+        })
+        assert validate("format2_simple", xml) == []
+        root = etree.fromstring(xml.encode("utf-8"))
+        ns = {"s": "http://www.regulator.gov/simple"}
+        assert root.findtext("s:ReportID", namespaces=ns) == "A<&>B"
+        assert root.findtext("s:TransactionAmount", namespaces=ns) == "1250.50"
+        assert root.findtext("s:TransactionDate", namespaces=ns) == "2024-12-01"
+
+    def test_coercion_helpers(self):
+        assert coerce_enum("Commercial Bank", ["Bank", "CreditUnion", "Other"]) == "Bank"
+        assert coerce_enum("credit union", ["Bank", "CreditUnion", "Other"]) == "CreditUnion"
+        assert coerce_enum("Unmapped", ["Bank", "CreditUnion", "Other"]) == "Other"
+        assert coerce_value("not a number", "decimal") is None
+        assert coerce_value("2024-12-15T10:30:00Z", "date") == "2024-12-15"
+
+    def test_unknown_format(self):
+        with pytest.raises(KeyError):
+            get_renderer("no_such_format")
+
+    def test_render_endpoint(self):
+        client = TestClient(llm_filler.app)
+        r = client.post("/render", json={
+            "format_name": "format2_simple",
+            "records": [{"ReportID": "R-1"}, {"ReportID": "R-2"}],
+        })
+        assert r.status_code == 200
+        assert [validate("format2_simple", xml) for xml in r.json()["xml"]] == [[], []]
+        r = client.post("/render", json={"format_name": "nope", "records": [{}]})
+        assert r.status_code == 400
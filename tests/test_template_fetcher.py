@@ -0,0 +1,279 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault("TEMPLATES_DIR", tempfile.mkdtemp())
+os.environ.setdefault("INDEX_DIR", tempfile.mkdtemp())
+
+from packages.shared.embedding_cache import EmbeddingCache
+from packages.shared.schema_model import SchemaModelStore, chunk_text, expand_schema_model, load_schema_model
+from services.template_fetcher.app import main as fetcher
+from services.rag.app.index_cache import IndexCache
+from services.template_fetcher.app.jobs import Job, JobManager
+from tests.test_rag import FakeEmbedder
+
+XSD_FILE = os.path.join(os.path.dirname(__file__), "..", "sar_agent", "regulator_xsds", "format2_simple.xsd")
+
+
+class GatedEmbedder(FakeEmbedder):
+    """FakeEmbedder that blocks in encode until released."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def encode(self, texts, **kwargs):
+        self.started.set()
+        self.release.wait(5)
+        return super().encode(texts, **kwargs)
+
+
+@pytest.fixture
+def fetcher_client(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    async def notify(cache_key):
+        pass
+
+    templates_dir, index_dir = tmp_path / "templates", tmp_path / "indexes"
+    templates_dir.mkdir()
+    index_dir.mkdir()
+    embedder = GatedEmbedder()
+    monkeypatch.setattr(fetcher, "TEMPLATES_DIR", str(templates_dir))
+    monkeypatch.setattr(fetcher, "INDEX_DIR", str(index_dir))
+    monkeypatch.setattr(fetcher, "get_embedder", lambda: embedder)
+    monkeypatch.setattr(fetcher, "embedding_cache", EmbeddingCache("fake"))
+    monkeypatch.setattr(fetcher, "notify_index_updated", notify)
+    monkeypatch.setattr(fetcher, "jobs", JobManager(workers=2))
+    monkeypatch.setattr(fetcher, "PRELOAD_MODELS", False)
+    with TestClient(fetcher.app) as client:
+        yield client, embedder, index_dir
+    embedder.release.set()
+
+
+def wait_for(client, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+class TestFetchJobs:
+    """Test template_fetcher's background indexing jobs."""
+
+    def test_fetch_returns_job_immediately(self, fetcher_client):
+        client, embedder, index_dir = fetcher_client
+        r = client.post("/fetch", json={"xsd_file": XSD_FILE})
+        assert r.status_code == 202
+        job = r.json()
+        assert job["status"] in ("queued", "running") and job["cache_key"] == "format2_simple.xsd"
+
+        embedder.release.set()
+        job = wait_for(client, job["job_id"])
+        assert job["status"] == "succeeded" and job["progress"] == 1.0
+        assert job["result"]["items_indexed"] > 0
+        assert (index_dir / "format2_simple.xsd.faiss").exists()
+
+    def test_wait_and_unchanged_refetch(self, fetcher_client):
+        client, embedder, _ = fetcher_client
+        embedder.release.set()
+        r = client.post("/fetch", params={"wait": "true"}, json={"xsd_file": XSD_FILE})
+        assert r.status_code == 200 and r.json()["status"] == "rebuilt"
+        assert r.json()["items_indexed"] > 0 and r.json()["index_path"].endswith("format2_simple.xsd.faiss")
+        r = client.post("/fetch", params={"wait": "true"}, json={"xsd_file": XSD_FILE})
+        assert r.json()["status"] == "unchanged"
+
+    def test_wait_reports_failure(self, fetcher_client, tmp_path):
+        client, embedder, index_dir = fetcher_client
+        embedder.release.set()
+        bad = tmp_path / "bad.xsd"
+        bad.write_text("<xs:schema xmlns:xs='http://www.w3.org/2001/XMLSchema'><xs:element/></xs:schema>")
+        r = client.post("/fetch", params={"wait": "true"}, json={"xsd_file": str(bad)})
+        assert r.status_code == 400
+        assert r.json()["detail"].startswith("XSD parse error")
+        assert not list(index_dir.iterdir())
+
+    def test_same_cache_key_is_deduplicated(self, fetcher_client):
+        client, embedder, _ = fetcher_client
+        first = client.post("/fetch", json={"xsd_file": XSD_FILE}).json()
+        second = client.post("/fetch", json={"xsd_file": XSD_FILE}).json()
+        assert second["job_id"] == first["job_id"] and second["deduplicated"]
+        other = client.post("/fetch", json={"xsd_file": XSD_FILE, "cache_key": "copy.xsd"}).json()
+        assert other["job_id"] != first["job_id"]
+        embedder.release.set()
+        assert wait_for(client, first["job_id"])["status"] == "succeeded"
+
+    def test_cancel_running_job_writes_nothing(self, fetcher_client):
+        client, embedder, index_dir = fetcher_client
+        job = client.post("/fetch", json={"xsd_file": XSD_FILE}).json()
+        assert embedder.started.wait(5)
+        assert client.post(f"/jobs/{job['job_id']}/cancel").status_code == 200
+        embedder.release.set()
+        assert wait_for(client, job["job_id"])["status"] == "cancelled"
+        assert not list(index_dir.iterdir())
+        assert not (index_dir.parent / "templates" / "format2_simple.xsd").exists()
+
+    def test_unknown_job_and_bad_request(self, fetcher_client):
+        client, _, _ = fetcher_client
+        assert client.get("/jobs/nope").status_code == 404
+        assert client.post("/fetch", json={}).status_code == 400
+        assert client.post("/fetch", json={"xsd_file": "/missing.xsd"}).status_code == 404
+
+
+class TestIndexFiles:
+    """Test that index files are replaced atomically for concurrent readers."""
+
+    def test_reader_never_sees_a_mismatched_pair(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(fetcher, "INDEX_DIR", str(tmp_path))
+        monkeypatch.setattr(fetcher, "get_embedder", lambda: FakeEmbedder())
+        monkeypatch.setattr(fetcher, "embedding_cache", EmbeddingCache("fake"))
+        corpora = [[f"element:a{i}" for i in range(10)], [f"element:b{i}" for i in range(30)]]
+        fetcher.write_index(Job(id="0", cache_key="x.xsd", kind="fetch"), "x.xsd", corpora[0])
+
+        stop = threading.Event()
+
+        def rewrite():
+            n = 0
+            while not stop.is_set():
+                n += 1
+                fetcher.write_index(Job(id=str(n), cache_key="x.xsd", kind="fetch"), "x.xsd", corpora[n % 2])
+
+        writer = threading.Thread(target=rewrite)
+        writer.start()
+        cache = IndexCache(str(tmp_path), retries=1000, retry_delay=0.001)
+        seen = set()
+        try:
+            deadline = time.time() + 1
+            while time.time() < deadline:
+                loaded = cache.get("x.xsd")
+                lines = [line for line in loaded.corpus if line]
+                assert loaded.index.ntotal == len(lines)
+                assert lines in corpora
+                seen.add(len(lines))
+        finally:
+            stop.set()
+            writer.join()
+        assert seen == {10, 30} and cache.reloads > 0
+        assert not [f for f in os.listdir(tmp_path) if f.endswith(".tmp")]
+
+
+ANNOTATED_XSD = """<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="urn:t" xmlns:t="urn:t"
+           elementFormDefault="qualified">
+  <xs:element name="Report">
+    <xs:complexType>
+      <xs:sequence>
+        <xs:element name="Code" maxOccurs="unbounded">
+          <xs:annotation><xs:documentation>Two   letter
+            country code</xs:documentation></xs:annotation>
+          <xs:simpleType>
+            <xs:restriction base="xs:string"><xs:pattern value="[A-Z]{2}"/></xs:restriction>
+          </xs:simpleType>
+        </xs:element>
+        <xs:element name="Node" type="t:NodeType" minOccurs="0"/>
+      </xs:sequence>
+      <xs:attribute name="kind" use="required">
+        <xs:simpleType>
+          <xs:restriction base="xs:string">
+            <xs:enumeration value="A"/><xs:enumeration value="B"/>
+          </xs:restriction>
+        </xs:simpleType>
+      </xs:attribute>
+    </xs:complexType>
+  </xs:element>
+  <xs:complexType name="NodeType">
+    <xs:sequence><xs:element name="Child" type="t:NodeType" minOccurs="0"/></xs:sequence>
+  </xs:complexType>
+</xs:schema>"""
+
+
+class TestSchemaModel:
+    """Test the single-pass structured XSD extractor and its saved model."""
+
+    def test_chunks_describe_paths_and_facets(self, tmp_path):
+        xsd = tmp_path / "t.xsd"
+        xsd.write_text(ANNOTATED_XSD)
+        model = fetcher.extract_schema_model(str(xsd), "abc")
+        chunks = {c["path"]: c for c in model["chunks"]}
+        assert model["roots"] == ["Report"] and model["xsd_sha256"] == "abc"
+
+        code = chunks["/Report/Code"]
+        assert (code["min_occurs"], code["max_occurs"]) == (1, "unbounded")
+        assert code["patterns"] == ["[A-Z]{2}"] and code["type"] == "xs:string"
+        assert code["documentation"] == "Two letter country code"
+        assert chunks["/Report/@kind"]["enumerations"] == ["A", "B"]
+        assert chunks["/Report/@kind"]["min_occurs"] == 1
+        # Named types are described once and referenced by name
+        assert chunks["/Report/Node"]["type_ref"] == "#NodeType"
+        assert chunks["#NodeType/Child"]["type_ref"] == "#NodeType"
+        assert chunks["#NodeType"]["kind"] == "type"
+        assert "/Report/Node/Child" not in chunks
+
+        # Expanded to document paths, recursive types stop after one level instead of looping
+        paths = {c["path"]: c for c in expand_schema_model(model)}
+        assert paths["/Report/Node/Child"]["recursive"]
+        assert "/Report/Node/Child/Child" not in paths
+        assert paths["/Report/Code"] == {**code, "path": "/Report/Code"}
+
+        text = chunk_text(code)
+        assert "\n" not in text
+        assert text.startswith("element:/Report/Code type=xs:string cardinality=1..unbounded")
+
+    def test_same_type_name_in_two_namespaces(self, tmp_path):
+        (tmp_path / "other.xsd").write_text(
+            '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="urn:o" '
+            'elementFormDefault="qualified">'
+            '<xs:complexType name="ItemType"><xs:sequence><xs:element name="Code" type="xs:string"/>'
+            '</xs:sequence></xs:complexType></xs:schema>')
+        xsd = tmp_path / "main.xsd"
+        xsd.write_text(
+            '<xs:schema xmlns:xs="http://www.w3.org/2001/XMLSchema" targetNamespace="urn:t" xmlns:t="urn:t" '
+            'xmlns:o="urn:o" elementFormDefault="qualified">'
+            '<xs:import namespace="urn:o" schemaLocation="other.xsd"/>'
+            '<xs:element name="Report"><xs:complexType><xs:sequence>'
+            '<xs:element name="Local" type="t:ItemType"/><xs:element name="Imported" type="o:ItemType"/>'
+            '</xs:sequence></xs:complexType></xs:element>'
+            '<xs:complexType name="ItemType"><xs:sequence><xs:element name="Amount" type="xs:decimal"/>'
+            '</xs:sequence></xs:complexType></xs:schema>')
+        model = fetcher.extract_schema_model(str(xsd))
+        chunks = {c["path"]: c for c in model["chunks"]}
+        assert chunks["/Report/Local"]["type_ref"] == "#ItemType"
+        assert chunks["/Report/Imported"]["type_ref"] == "#o:ItemType"
+        assert {"#ItemType/Amount", "#o:ItemType/Code"} <= set(chunks)
+        paths = {c["path"] for c in expand_schema_model(model)}
+        assert {"/Report/Local/Amount", "/Report/Imported/Code"} <= paths
+        assert "/Report/Imported/Amount" not in paths
+
+    def test_chunk_count_grows_with_schema_not_paths(self):
+        # The XML Schema meta-schema reuses its named types under many paths
+        model = fetcher.extract_schema_model(os.path.join(os.path.dirname(__file__), "..", "data", "templates", "Schema.xsd"))
+        assert len(model["chunks"]) < 1000
+        assert max(c["path"].count("/") for c in model["chunks"]) <= 3
+        chunks = {c["path"]: c for c in model["chunks"]}
+        assert chunks["/schema/include"]["ref"] == "/include"
+        assert len(json.dumps(model)) < 500_000
+
+    def test_fetch_saves_model_for_rag(self, fetcher_client, monkeypatch):
+        from fastapi.testclient import TestClient
+        from services.rag.app import main as rag
+
+        client, embedder, index_dir = fetcher_client
+        embedder.release.set()
+        client.post("/fetch", params={"wait": "true"}, json={"xsd_file": XSD_FILE})
+        model = load_schema_model(str(index_dir), "format2_simple.xsd")
+        assert model["roots"] == ["SimpleReport"]
+        assert (index_dir / "format2_simple.xsd.txt").read_text().splitlines()[0].startswith("element:/SimpleReport")
+
+        monkeypatch.setattr(rag, "schema_models", SchemaModelStore(str(index_dir)))
+        rag_client = TestClient(rag.app)
+        r = rag_client.get("/schema/format2_simple.xsd", params={"path_prefix": "#SimpleReportType/Transaction"})
+        assert r.status_code == 200
+        assert {c["name"] for c in r.json()["chunks"]} >= {"TransactionID", "TransactionType"}
+        assert rag_client.get("/schema/missing.xsd").status_code == 404
@@ -0,0 +1,179 @@
+import json
+import os
+import shutil
+
+import pytest
+from fastapi.testclient import TestClient
+
+from services.validator.app import main as validator
+from services.validator.app.schema_cache import SchemaCache
+
+XSD_DIR = os.path.join(os.path.dirname(__file__), "..", "sar_agent", "regulator_xsds")
+
+SIMPLE_XML = """<SimpleReport xmlns="http://www.regulator.gov/simple">
+    <ReportID>SAR-2024-001</ReportID>
+</SimpleReport>"""
+
+
+@pytest.fixture
+def templates_dir(tmp_path):
+    for name in ("fincen_sar.xsd", "format2_simple.xsd"):
+        shutil.copy(os.path.join(XSD_DIR, name), tmp_path / name)
+    return tmp_path
+
+
+class TestSchemaCache:
+    """Test the compiled schema cache."""
+
+    def test_hit_after_first_compile(self, templates_dir):
+        cache = SchemaCache(max_entries=4)
+        path = str(templates_dir / "format2_simple.xsd")
+        first = cache.get("format2_simple.xsd", path)
+        assert cache.get("format2_simple.xsd", path) is first
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_touched_file_with_same_content_stays_cached(self, templates_dir):
+        cache = SchemaCache()
+        path = str(templates_dir / "format2_simple.xsd")
+        first = cache.get("format2_simple.xsd", path)
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 5_000_000_000))
+        assert cache.get("format2_simple.xsd", path) is first
+        assert cache.misses == 1
+
+    def test_changed_file_is_recompiled(self, templates_dir):
+        cache = SchemaCache()
+        path = str(templates_dir / "format2_simple.xsd")
+        first = cache.get("format2_simple.xsd", path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n<!-- changed -->\n")
+        assert cache.get("format2_simple.xsd", path) is not first
+        assert cache.misses == 2
+
+    def test_lru_eviction_and_invalidation(self, templates_dir):
+        cache = SchemaCache(max_entries=1)
+        cache.get("format2_simple.xsd", str(templates_dir / "format2_simple.xsd"))
+        cache.get("fincen_sar.xsd", str(templates_dir / "fincen_sar.xsd"))
+        assert cache.evictions == 1
+        assert [e["cache_key"] for e in cache.stats()["cached"]] == ["fincen_sar.xsd"]
+        assert cache.invalidate("fincen_sar.xsd") == 1
+        assert cache.stats()["entries"] == 0
+
+
+class TestValidatorEndpoints:
+    """Test that the validator endpoints use the shared cache."""
+
+    def test_startup_warms_builtin_formats(self, templates_dir, monkeypatch):
+        monkeypatch.setattr(validator, "TEMPLATES_DIR", str(templates_dir))
+        monkeypatch.setattr(validator, "schema_cache", SchemaCache())
+        with TestClient(validator.app) as client:
+            stats = client.get("/metrics/schema_cache").json()
+            assert [e["cache_key"] for e in stats["cached"]] == ["format2_simple.xsd"]
+            assert stats["misses"] == 1
+
+            r = client.post("/validate_with_format", json={"xml_string": SIMPLE_XML, "format_type": "format2_simple"})
+            assert r.status_code == 200
+            assert r.json()["valid"] is False
+            assert client.get("/metrics/schema_cache").json()["hits"] == 1
+
+            r = client.post("/validate", json={"xml_string": SIMPLE_XML, "cache_key": "fincen_sar.xsd"})
+            assert r.status_code == 200
+            assert client.get("/metrics/schema_cache").json()["entries"] == 2
+
+            r = client.post("/schema_cache/invalidate", json={})
+            assert r.json()["invalidated"] == 2
+
+
+class TestFastValidation:
+    """Test the lxml-backed fast mode that collects every error."""
+
+    def test_fast_mode_reports_all_errors_with_positions(self, templates_dir, monkeypatch):
+        monkeypatch.setattr(validator, "TEMPLATES_DIR", str(templates_dir))
+        monkeypatch.setattr(validator, "schema_cache", SchemaCache())
+        client = TestClient(validator.app)
+        xml = SIMPLE_XML.replace("<ReportID>SAR-2024-001</ReportID>",
+                                 "<ReportID>SAR-2024-001</ReportID>\n    <Bogus/>")
+        r = client.post("/validate_with_format",
+                        json={"xml_string": xml, "format_type": "format2_simple", "mode": "fast"})
+        result = r.json()
+        assert result["valid"] is False
+        assert result["engine"] == "lxml"
+        assert result["format_type"] == "format2_simple"
+        assert result["error_count"] == len(result["errors"]) >= 1
+        assert result["errors"][0]["line"] == 3
+        assert result["errors"][0]["column"] is not None
+
+    def test_fast_mode_reports_syntax_errors(self, templates_dir, monkeypatch):
+        monkeypatch.setattr(validator, "TEMPLATES_DIR", str(templates_dir))
+        client = TestClient(validator.app)
+        r = client.post("/validate", json={"xml_string": "<SimpleReport>", "cache_key": "format2_simple.xsd",
+                                           "mode": "fast"})
+        result = r.json()
+        assert result["valid"] is False
+        assert result["errors"][0]["message"].startswith("XML parsing error")
+
+    def test_falls_back_to_xmlschema_when_lxml_cannot_compile(self, templates_dir, monkeypatch):
+        from lxml import etree
+        from services.validator.app import fast_validation, schema_cache as cache_module
+
+        def refuse(xsd_path):
+            raise etree.XMLSchemaParseError("unsupported")
+
+        monkeypatch.setitem(cache_module.COMPILERS, "lxml", refuse)
+        result = fast_validation.fast_validate(SchemaCache(), "format2_simple.xsd",
+                                               str(templates_dir / "format2_simple.xsd"), SIMPLE_XML)
+        assert result["engine"] == "xmlschema"
+        assert result["valid"] is False
+        assert result["error_count"] >= 1
+
+
+class TestValidateBatch:
+    """Test bulk validation on the process pool."""
+
+    @pytest.fixture
+    def client(self, templates_dir, monkeypatch):
+        from services.validator.app import batch
+        monkeypatch.setattr(validator, "TEMPLATES_DIR", str(templates_dir))
+        monkeypatch.setattr(batch, "VALIDATE_WORKERS", 2)
+        monkeypatch.setattr(batch, "VALIDATE_CHUNK_SIZE", 3)
+        yield TestClient(validator.app)
+        batch.shutdown_pool()
+
+    def test_json_batch(self, client):
+        documents = [{"id": f"doc-{i}", "xml_string": SIMPLE_XML} for i in range(10)] + ["<broken"]
+        r = client.post("/validate_batch", json={"documents": documents, "format_type": "format2_simple"})
+        assert r.status_code == 200
+        records = [json.loads(line) for line in r.text.splitlines()]
+        results = sorted(records[:-1], key=lambda rec: rec["index"])
+        assert [rec["index"] for rec in results] == list(range(11))
+        assert results[0]["id"] == "doc-0"
+        assert results[0]["engine"] == "lxml"
+        assert results[10]["errors"][0]["message"].startswith("XML parsing error")
+        assert records[-1]["summary"]["total"] == 11
+        assert records[-1]["summary"]["invalid"] == 11
+
+    def test_ndjson_batch_full_mode(self, client):
+        lines = [json.dumps({"id": "a", "xml_string": SIMPLE_XML}), "not json"]
+        r = client.post("/validate_batch?cache_key=format2_simple.xsd&mode=full", content="\n".join(lines),
+                        headers={"content-type": "application/x-ndjson"})
+        records = [json.loads(line) for line in r.text.splitlines()]
+        by_index = {rec["index"]: rec for rec in records[:-1]}
+        assert by_index[0]["engine"] == "xmlschema"
+        assert by_index[1]["error"].startswith("Invalid document")
+        assert records[-1]["summary"]["mode"] == "full"
+
+    def test_requires_a_schema(self, client):
+        r = client.post("/validate_batch", json={"documents": [SIMPLE_XML]})
+        assert r.status_code == 400
+
+    def test_unknown_mode_is_rejected(self, client):
+        r = client.post("/validate_batch", json={"documents": [SIMPLE_XML], "format_type": "format2_simple",
+                                                 "mode": "strict"})
+        assert r.status_code == 400
+        r = client.post("/validate_batch?cache_key=format2_simple.xsd&mode=strict",
+                        content=json.dumps({"xml_string": SIMPLE_XML}), headers={"content-type": "application/x-ndjson"})
+        assert r.status_code == 400
+
+    def test_workers_are_spawned(self, client):
+        from services.validator.app import batch
+        assert batch.get_pool()._mp_context.get_start_method() == "spawn"